@@ -1,7 +1,35 @@
-from flask import Flask, render_template_string, render_template, request, jsonify, send_from_directory
-from werkzeug.utils import secure_filename
+from flask import Flask, request, jsonify, send_from_directory, send_file, \
+    g, has_app_context, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.security import safe_join
 import sqlite3
+import atexit
+import json
 import os
+import time
+
+from bulk_io import (BulkError, WAIVER_SPEC, RETRY_SPEC, read_rows, validate_rows, bulk_write,
+                     export_rows, to_csv_chunks, to_xlsx_bytes)
+from change_log import LOGGED_TABLES, maybe_compact, read_changes, read_log
+from data_version import EPOCH_KEY, VERSIONED_TABLES, get_versions, make_etag
+from db_pool import PooledConnection, PoolRegistry
+from events import POLL_INTERVAL, RESYNC, BrokerFull, EventBroker, format_sse, max_subscribers_for
+from flaky_store import FlakyStore
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics
+from migrations import migrate_all
+from ordering import apply_order, diff_ordered_values, next_order_value
+from page_cache import PageCache
+from profiling import DEFAULT_RATE as PROFILE_RATE, Profiler, ProfilingError
+from result_merge import merge_results
+from retry_commands import build_retry_commands, MAX_COMMAND_CHARS
+from search import SEARCH_SOURCES, index_queued, search_all
+from shard_planner import ingest_result, parse_dut, plan_shards, validate as validate_shard_plans
+from static_manifest import StaticManifest
+from thumbnails import get_derivative, submit_derivatives, DERIVATIVE_DIRNAME
+from triage import RetryTipMatcher, triage_result
+from uploads import UploadStore, UploadError
+from waiver_index import WaiverIndex
+from xts_result import open_result
 
 # ----------------------------------------
 # 基本設定
@@ -13,7 +41,8 @@ app = Flask(__name__)
 gms_3pl_planning = "https://docs.google.com/spreadsheets/d/1T-m_5qRCIr2nBdPUiF-u8_Ph0bX2KACsU5_UAC1oVKk/edit?gid=0#gid=0"
 
 # 檔案上傳設定
-UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
+STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+UPLOAD_FOLDER = os.path.join(STATIC_ROOT, 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'zip', 'docx', 'xlsx', 'mp4'}
 
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024
@@ -22,6 +51,11 @@ if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+upload_store = UploadStore(UPLOAD_FOLDER, ALLOWED_EXTENSIONS, max_size=app.config['MAX_CONTENT_LENGTH'])
+
+# url_for('static') 加上內容 hash，靜態截圖 / PDF 可長期快取 (見 static_manifest.py)
+static_manifest = StaticManifest(STATIC_ROOT, os.path.join(BASE_DIR, '.static_manifest.json'))
+static_manifest.init_app(app)
 
 
 def allowed_file(filename):
@@ -32,131 +66,426 @@ def allowed_file(filename):
 # ----------------------------------------
 # DB Helper
 # ----------------------------------------
+# 資料庫與 analytics 所在目錄 (設定 TOOL_DATA_DIR 可改用其他目錄，例如 bench_api.py 產生的測試資料)
+DATA_DIR = os.environ.get("TOOL_DATA_DIR") or BASE_DIR
+DB_PATHS = {
+    "waiver": os.path.join(DATA_DIR, "waiver.db"),
+    "retry": os.path.join(DATA_DIR, "retry.db"),
+    "ctsv_gtsi": os.path.join(DATA_DIR, "ctsv_gtsi.db"),
+}
+
+# Request / SQL 計時，由 /metrics 輸出 (見 metrics.py；設定 TOOL_METRICS=0 可關閉)
+metrics = Metrics(os.environ.get("TOOL_METRICS_DIR") or os.path.join(DATA_DIR, ".metrics"),
+                  enabled=os.environ.get("TOOL_METRICS", "1") != "0")
+app.wsgi_app = metrics.wrap_wsgi(app.wsgi_app)
+CURSOR_FACTORIES = {name: metrics.cursor_factory(name) for name in DB_PATHS}
+
+# 連線池 (設定 TOOL_DB_POOL=0 可退回每次重新連線的舊行為，方便做 benchmark 比較)
+app.config['DB_POOL_ENABLED'] = os.environ.get("TOOL_DB_POOL", "1") != "0"
+db_pools = PoolRegistry(DB_PATHS, cursor_factories=CURSOR_FACTORIES)
+atexit.register(db_pools.close_all)
+
+
 def get_db_conn(db_name="waiver"):
-    if db_name == "retry":
-        db_path = os.path.join(BASE_DIR, "retry.db")
-    elif db_name == "ctsv_gtsi":
-        db_path = os.path.join(BASE_DIR, "ctsv_gtsi.db")
-    else:
-        db_path = os.path.join(BASE_DIR, "waiver.db")
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    if db_name not in DB_PATHS:
+        db_name = "waiver"
+    if not app.config['DB_POOL_ENABLED']:
+        # 不屬於任何連線池的 PooledConnection，close() 即真正關閉
+        conn = sqlite3.connect(DB_PATHS[db_name], factory=PooledConnection)
+        conn.row_factory = sqlite3.Row
+        conn.cursor_factory = CURSOR_FACTORIES[db_name]
+        return conn
+    conn = db_pools.acquire(db_name)
+    # 記錄在 request context，teardown 時歸還忘記 close 的連線 (例如 route 中途拋出例外)
+    if has_app_context():
+        g.setdefault("_db_conns", []).append((conn, conn.checkout_id))
     return conn
 
 
+class TimedJSONProvider(DefaultJSONProvider):
+    """jsonify 序列化所花的時間記到目前 request 的 json 階段。"""
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            metrics.add_json_time(time.perf_counter() - start)
+
+
+if metrics.enabled:
+    app.json = TimedJSONProvider(app)
+
+
+@app.before_request
+def label_request_route():
+    # 以 route 規則 (例如 /api/waiver/list/<suite>) 分類，而不是實際路徑，避免 label 無限增加
+    if request.url_rule is not None:
+        metrics.set_route(request.url_rule.rule)
+
+
+@app.before_request
+def start_request_profile():
+    if not profiler.enabled:
+        return
+    rule = request.url_rule.rule if request.url_rule is not None else None
+    session, trigger = profiler.begin(request.headers.get("X-Profile"), request.headers.get("X-Profile-Token"), rule,
+                                      request.path, request.query_string.decode("utf-8", "replace"))
+    if session is not None:
+        g._profile = (session, trigger, time.perf_counter())
+    elif trigger is not None:
+        g._profile_status = "skipped"
+
+
+def _finish_request_profile(status, error=None):
+    session, trigger, started = g.pop("_profile")
+    meta = {"method": request.method, "path": request.path, "query": request.query_string.decode("utf-8", "replace"),
+            "route": request.url_rule.rule if request.url_rule is not None else None, "status": status,
+            "trigger": trigger, "duration_ms": round((time.perf_counter() - started) * 1000, 2)}
+    if error is not None:
+        meta["error"] = repr(error)
+    return profiler.finish(session, meta)
+
+
+@app.after_request
+def finish_request_profile(response):
+    # 串流 response (例如 CSV 匯出) 只涵蓋產生 response 之前的部分
+    if "_profile" in g:
+        response.headers["X-Profile-Id"] = _finish_request_profile(response.status_code)
+        response.headers["X-Profile-Status"] = "saved"
+    elif g.get("_profile_status"):
+        response.headers["X-Profile-Status"] = g.pop("_profile_status")
+    return response
+
+
+@app.teardown_request
+def abort_request_profile(exc):
+    # route 拋出例外時不會經過 after_request
+    if "_profile" in g:
+        _finish_request_profile(500, exc)
+
+
+@app.teardown_appcontext
+def release_db_conns(exc):
+    for conn, checkout_id in g.pop("_db_conns", []):
+        if conn._pool is not None:
+            conn._pool.release_checkout(conn, checkout_id)
+
+
+# Waiver 記憶體索引 (第一次使用時載入，之後由 waiver 寫入 API 增量更新)
+waiver_index = WaiverIndex()
+flaky_store = FlakyStore(os.path.join(DATA_DIR, "analytics"))
+
+# 指定 request 的 profiling (見 profiling.py；設定 TOOL_PROFILE_TOKEN 才會啟用)
+profiler = Profiler(os.environ.get("TOOL_PROFILE_DIR") or os.path.join(DATA_DIR, "profiles"),
+                    token=os.environ.get("TOOL_PROFILE_TOKEN"),
+                    rate=float(os.environ.get("TOOL_PROFILE_RATE") or PROFILE_RATE))
+
+
+def _waivers_version(conn):
+    return get_versions(conn, ("waivers",)).get("waivers")
+
+
+def get_waiver_index():
+    # 版本號不同代表有其他程序 (import 腳本、其他 worker) 改過 waivers，整包重新載入
+    conn = get_db_conn("waiver")
+    try:
+        version = _waivers_version(conn)
+        if not waiver_index.loaded or waiver_index.version != version:
+            waiver_index.load_from_db(conn)
+            waiver_index.version = version
+    finally:
+        conn.close()
+    return waiver_index
+
+
+def _refresh_waiver_row(cur, row_id):
+    if not waiver_index.loaded:
+        return
+    cur.execute("SELECT id, suite, waiver_id, module, test_case, note FROM waivers WHERE id = ?", (row_id,))
+    row = cur.fetchone()
+    if row is None:
+        waiver_index.remove(row_id)
+    else:
+        waiver_index.upsert(row)
+    # 只有這一筆寫入時才視為索引仍是最新，否則留給 get_waiver_index 重新載入
+    version = _waivers_version(cur.connection)
+    if waiver_index.version is not None and version == waiver_index.version + 1:
+        waiver_index.version = version
+
+
+def versioned_json(db_name, tables, key, build):
+    """
+    List API 共用: 依 data_versions 產生 ETag，If-None-Match 相同時直接回 304，
+    不讀取任何資料列；否則呼叫 build(conn) 產生 JSON。
+    """
+    conn = get_db_conn(db_name)
+    try:
+        etag = make_etag(key, get_versions(conn, tables))
+        if request.if_none_match.contains(etag):
+            resp = app.response_class(status=304)
+        else:
+            resp = jsonify(build(conn))
+    finally:
+        conn.close()
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+# ----------------------------------------
+# 即時變更事件 (SSE，見 events.py)
+# ----------------------------------------
+EVENT_STREAM_SECONDS = 300   # 單一連線最長時間，之後由瀏覽器自動重連 (避免佔住 worker thread)
+EVENT_KEEPALIVE_SECONDS = 15
+EVENT_BUSY_RETRY_MS = 30000  # 訂閱者已滿時請瀏覽器等多久再重連
+EVENT_EXTERNAL_LIMIT = 200   # 其他 process 一次改了超過這麼多列時改送 resync
+event_broker = EventBroker(key_fields={"suites": "suite_key"})
+
+WAIVER_COLUMNS = "id, suite, waiver_id, module, test_case, note"
+RETRY_TIP_COLUMNS = "id, type, module_case, condition, trick"
+SUITE_COLUMNS = "suite_key, suite_title, suite_tag, display_order"
+
+
+def publish_change(db_name, table, op, **payload):
+    """寫入 commit 之後呼叫；row 為 sqlite3.Row 時轉成 dict。"""
+    if isinstance(payload.get("row"), sqlite3.Row):
+        payload["row"] = dict(payload["row"])
+    return event_broker.publish(db_name, table, op, **payload)
+
+
+def _read_external_changes(positions):
+    """
+    給 event_broker.poll_external: 讀各資料庫 change_log 在上次位置之後的變更 (其他 worker / import 腳本的寫入)。
+    沒有 change_log 的表 (ctsv_sections) 仍以 data_versions 偵測，有變動就 resync。
+    """
+    positions = positions or {}
+    new_positions, changes = {}, []
+    for db_name, tables in VERSIONED_TABLES.items():
+        conn = get_db_conn(db_name)
+        try:
+            cursor, rows = read_log(conn, db_name, positions.get(db_name), CHANGE_FETCHERS, EVENT_EXTERNAL_LIMIT)
+            unlogged = [t for t in tables if t not in LOGGED_TABLES[db_name]]
+            versions = get_versions(conn, unlogged) if unlogged else {}
+            epoch = versions.pop(EPOCH_KEY, None)
+        finally:
+            conn.close()
+        new_positions[db_name] = cursor
+        if rows is None:
+            if db_name in positions:
+                resources = {resource for resource, _ in LOGGED_TABLES[db_name].values()}
+                changes.extend((db_name, resource, None, RESYNC) for resource in sorted(resources))
+        else:
+            changes.extend((db_name, resource, key, row) for resource, key, row in rows)
+        for table, version in versions.items():
+            new_positions[(db_name, table)] = (epoch, version)
+            if (db_name, table) in positions and positions[(db_name, table)] != (epoch, version):
+                changes.append((db_name, table, None, RESYNC))
+    return new_positions, changes
+
+
+def _card_row(conn, card_id):
+    cur = conn.execute(f"SELECT {CARD_COLUMNS}, {CARD_IMAGES_SUBQUERY} FROM test_cards c WHERE c.id = ?",
+                       (card_id,))
+    rows = _card_rows(cur)
+    return rows[0] if rows else None
+
+
+# ----------------------------------------
+# 增量同步 (/api/<resource>/changes?since=<cursor>，見 change_log.py)
+# ----------------------------------------
+def _rows_by_keys(conn, sql, key_column, keys):
+    """sql 為不含 WHERE 的 SELECT；回傳 key_column IN keys 的資料列 (dict)。"""
+    marks = ",".join("?" for _ in keys)
+    return [dict(r) for r in conn.execute(f"{sql} WHERE {key_column} IN ({marks})", list(keys))]
+
+
+def _fetch_waivers(conn, keys):
+    return _rows_by_keys(conn, f"SELECT {WAIVER_COLUMNS} FROM waivers", "id", keys)
+
+
+def _fetch_retry_tips(conn, keys):
+    return _rows_by_keys(conn, f"SELECT {RETRY_TIP_COLUMNS} FROM retry_tips", "id", keys)
+
+
+def _fetch_suites(conn, keys):
+    return _rows_by_keys(conn, f"SELECT {SUITE_COLUMNS} FROM suites", "suite_key", keys)
+
+
+def _fetch_cards(conn, keys):
+    marks = ",".join("?" for _ in keys)
+    return _card_rows(conn.execute(f"SELECT {CARD_COLUMNS}, {CARD_IMAGES_SUBQUERY} FROM test_cards c "
+                                   f"WHERE c.id IN ({marks})", list(keys)))
+
+
+# change_log resource -> fetch_rows；/changes API 與 SSE 推送其他 process 的寫入共用，兩邊送出的資料列格式相同
+CHANGE_FETCHERS = {
+    "waivers": _fetch_waivers,
+    "retry_tips": _fetch_retry_tips,
+    "suites": _fetch_suites,
+    "test_cards": _fetch_cards,
+}
+
+
+def _rows_after(conn, sql, key_column, after, limit):
+    """sql 為不含 WHERE 的 SELECT；依鍵值排序回傳 key_column > after 的前 limit 筆 (reset 分頁用)。"""
+    if after is None:
+        return conn.execute(f"{sql} ORDER BY {key_column} LIMIT ?", (limit,))
+    return conn.execute(f"{sql} WHERE {key_column} > ? ORDER BY {key_column} LIMIT ?", (after, limit))
+
+
+def changes_json(db_name, resource, key_field, fetch_rows, fetch_page):
+    """
+    回傳 since 之後有變動的資料列 (upserts) 與已刪除的鍵 (deletes)，以及下一次要帶的 cursor。
+    沒帶 since、cursor 失效 (資料庫重建、超過保留期限) 時 reset=true，依鍵值分頁回傳全部資料。
+    has_more=true 時以新的 cursor 繼續呼叫 (前端依自己的排序顯示，不依回傳順序)。
+    """
+    limit = max(1, min(request.args.get("limit", MAX_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    conn = get_db_conn(db_name)
+    try:
+        maybe_compact(conn, db_name)
+        result = read_changes(conn, resource, key_field, request.args.get("since"), fetch_rows, fetch_page, limit)
+    finally:
+        conn.close()
+    return jsonify(result)
+
+
+def compact_change_logs():
+    for db_name in DB_PATHS:
+        conn = get_db_conn(db_name)
+        try:
+            maybe_compact(conn, db_name)
+        finally:
+            conn.close()
+
+
+def index_pending_grams():
+    """啟動時補上其他程式 (直接寫 DB 的腳本) 留在佇列裡的短詞索引；之後由各寫入路徑自行維護。"""
+    for db_name, (table, *_) in SEARCH_SOURCES.items():
+        conn = get_db_conn(db_name)
+        try:
+            with conn:
+                index_queued(conn, table)
+        finally:
+            conn.close()
+
+
+# ----------------------------------------
+# Keyset 分頁
+# ----------------------------------------
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def page_limit():
+    return max(1, min(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+
+
+def _cursor_value(text):
+    # display_order 可能是整數或小數
+    return float(text) if "." in text else int(text)
+
+
+def parse_cursor(text, size):
+    """'<v1>,<v2>' -> (v1, v2)；格式不符時回傳 None。section_key 類的字串欄位放在第一個。"""
+    if not text:
+        return None
+    parts = text.split(",")
+    if len(parts) != size:
+        return None
+    try:
+        return tuple(parts[:size - 2]) + tuple(_cursor_value(p) for p in parts[size - 2:])
+    except ValueError:
+        return None
+
+
+def make_cursor(*values):
+    return ",".join(str(v) for v in values)
+
+
+# ----------------------------------------
+# 批次匯入 / 匯出
+# ----------------------------------------
+def _flag(name, body=None):
+    if isinstance(body, dict) and name in body:
+        return bool(body[name])
+    return request.args.get(name, "").lower() in ("1", "true", "yes")
+
+
+def bulk_import(db_name, spec):
+    """
+    上傳 CSV / XLSX (multipart 'file') 或 JSON 陣列 ({"rows": [...]} 亦可)。
+    ?upsert=1  依唯一鍵更新既有資料
+    ?dry_run=1 只驗證不寫入
+    ?atomic=1  任一列驗證失敗就整批不寫入
+    """
+    body = None
+    try:
+        if 'file' in request.files:
+            f = request.files['file']
+            raw_rows = read_rows(f.read(), f.filename, f.mimetype)
+        else:
+            body = request.get_json(silent=True)
+            if body is None:
+                raise BulkError("body 不是合法的 JSON")
+            rows = body.get("rows") if isinstance(body, dict) else body
+            if not isinstance(rows, list):
+                raise BulkError('JSON 必須是陣列或 {"rows": [...]}')
+            raw_rows = read_rows(rows)
+    except (BulkError, ValueError, UnicodeDecodeError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    valid, errors = validate_rows(spec, raw_rows)
+    report = {"status": "ok", "total": len(raw_rows), "valid": len(valid), "errors": errors}
+    if _flag("dry_run", body) or (errors and _flag("atomic", body)):
+        report.update(inserted=0, updated=0, unchanged=0, skipped_duplicates=0)
+        if errors and _flag("atomic", body):
+            report["status"] = "error"
+            return jsonify(report), 400
+        return jsonify(report)
+
+    conn = get_db_conn(db_name)
+    try:
+        report.update(bulk_write(conn, spec, valid, upsert=_flag("upsert", body)))
+    except sqlite3.Error as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    finally:
+        conn.close()
+    if report.get("inserted") or report.get("updated"):
+        # 批次寫入不逐筆送出，前端收到後重新載入該表
+        publish_change(db_name, spec.table, "bulk", inserted=report["inserted"], updated=report["updated"])
+    return jsonify(report)
+
+
+def bulk_export(db_name, spec, filename, where="", params=()):
+    fmt = (request.args.get("format") or "csv").lower()
+    conn = get_db_conn(db_name)
+    cols, cursor = export_rows(conn, spec, where, params)
+    if fmt == "csv":
+        def generate():
+            try:
+                yield from to_csv_chunks(cols, cursor)
+            finally:
+                conn.close()
+        return Response(stream_with_context(generate()), mimetype="text/csv",
+                        headers={"Content-Disposition": f"attachment; filename={filename}.csv"})
+    try:
+        if fmt == "xlsx":
+            data = to_xlsx_bytes(cols, cursor)
+            return Response(data, mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            headers={"Content-Disposition": f"attachment; filename={filename}.xlsx"})
+        return jsonify([dict(zip(cols, r)) for r in cursor])
+    except BulkError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        conn.close()
+
+
 def init_db():
-    """初始化所有資料庫"""
-    # 1. waivers.db
-    conn_waiver = get_db_conn("waiver")
-    cursor_waiver = conn_waiver.cursor()
-    cursor_waiver.execute(
-        """
-        CREATE TABLE IF NOT EXISTS waivers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            suite TEXT NOT NULL, waiver_id TEXT NOT NULL, module TEXT NOT NULL, 
-            test_case TEXT NOT NULL, note TEXT
-        );
-        """
-    )
-    conn_waiver.commit()
-    conn_waiver.close()
-
-    # 2. retry.db
-    conn_retry = get_db_conn("retry")
-    cursor_retry = conn_retry.cursor()
-    cursor_retry.execute(
-        """
-        CREATE TABLE IF NOT EXISTS retry_tips (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT NOT NULL, 
-            module_case TEXT NOT NULL, 
-            condition TEXT NOT NULL, 
-            trick TEXT
-        );
-        """
-    )
-    cursor_retry.execute(
-        """
-        CREATE TABLE IF NOT EXISTS suites (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            suite_key TEXT UNIQUE NOT NULL,    
-            suite_title TEXT NOT NULL,         
-            suite_tag TEXT,                    
-            display_order INTEGER NOT NULL DEFAULT 0
-        );
-        """
-    )
-    # 預設區塊
-    cursor_retry.execute("SELECT COUNT(*) FROM suites")
-    if cursor_retry.fetchone()[0] == 0:
-        default_suites = [
-            ('BASIC', 'Basic 測項', 'SIM / Host / Permission 類', 10),
-            ('GTS', 'GTS 測項', 'GTS', 20),
-            ('CTS', 'CTS 測項', 'CTS', 30),
-            ('SECURITYTOT', 'Security / TOT 測項', 'Security / TOT', 40),
-            ('SPECIAL', '特殊情況 ', 'Special Cases / General', 50),
-        ]
-        cursor_retry.executemany(
-            "INSERT INTO suites (suite_key, suite_title, suite_tag, display_order) VALUES (?, ?, ?, ?)",
-            default_suites
-        )
-    conn_retry.commit()
-    conn_retry.close()
-
-    # 3. ctsv_gtsi.db
-    conn_ctsv = get_db_conn("ctsv_gtsi")
-    cursor_ctsv = conn_ctsv.cursor()
-    cursor_ctsv.execute(
-        """
-        CREATE TABLE IF NOT EXISTS ctsv_sections (
-            section_key TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            tag TEXT,
-            display_order INTEGER NOT NULL DEFAULT 0
-        );
-        """
-    )
-    cursor_ctsv.execute(
-        """
-        CREATE TABLE IF NOT EXISTS test_cards (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            section_key TEXT NOT NULL,
-            card_title TEXT NOT NULL,
-            card_subtitle TEXT,
-            content TEXT,
-            image_url TEXT,
-            note TEXT,
-            display_order INTEGER NOT NULL DEFAULT 0,
-            FOREIGN KEY(section_key) REFERENCES ctsv_sections(section_key) ON DELETE CASCADE
-        );
-        """
-    )
-    cursor_ctsv.execute(
-        """
-        CREATE TABLE IF NOT EXISTS card_images (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            card_id INTEGER NOT NULL,
-            filename TEXT NOT NULL,
-            display_order INTEGER NOT NULL DEFAULT 0,
-            FOREIGN KEY(card_id) REFERENCES test_cards(id) ON DELETE CASCADE
-        );
-        """
-    )
-    # 預設區塊
-    cursor_ctsv.execute("SELECT COUNT(*) FROM ctsv_sections")
-    if cursor_ctsv.fetchone()[0] == 0:
-        default_sections = [
-            ('GTSI', 'GTS Interactive 區塊', 'Android 13+ / MADA', 10),
-            ('CTSV', 'CTS Verifier 區塊', 'CameraITS / Audio / Sensor', 20),
-            ('MADA', 'MADA Check List 區塊', 'Auto discoverability / Doc', 30),
-        ]
-        cursor_ctsv.executemany(
-            "INSERT INTO ctsv_sections (section_key, title, tag, display_order) VALUES (?, ?, ?, ?)",
-            default_sections
-        )
-    conn_ctsv.commit()
-    conn_ctsv.close()
-    print("✅ 資料庫初始化完成。")
+    """初始化 / 升級所有資料庫 schema (見 migrations.py)；已是最新版本時只讀一次 user_version。"""
+    applied = migrate_all(DB_PATHS, log=print)
+    if any(applied.values()):
+        print("✅ 資料庫 schema 已更新。")
 
 
 def create_db_if_not_exists():
@@ -684,34 +1013,41 @@ TEMPLATE = r"""
 # APIs (包含重要的圖片路徑修復補丁)
 # ----------------------------------------
 
+# 頁面內容不隨請求變動: 只 render 一次並預先壓縮 (見 page_cache.py)
+pages = PageCache(app)
+pages.register("index", TEMPLATE, lambda: {"planning_url": gms_3pl_planning})
+for _name in ("flash_image", "sop", "retry", "waiver", "ctsv_gtsi"):
+    pages.register(_name, _name + ".html")
+
+
 @app.route("/")
 def index():
-    return render_template_string(TEMPLATE, planning_url=gms_3pl_planning)
+    return pages.serve("index")
 
 
 @app.route("/flash_image")
 def flash_image():
-    return render_template("flash_image.html")
+    return pages.serve("flash_image")
 
 
 @app.route("/sop")
 def sop():
-    return render_template("sop.html")
+    return pages.serve("sop")
 
 
 @app.route("/retry")
 def retry():
-    return render_template("retry.html")
+    return pages.serve("retry")
 
 
 @app.route("/waiver")
 def waiver():
-    return render_template("waiver.html")
+    return pages.serve("waiver")
 
 
 @app.route("/ctsv_gtsi")
 def ctsv_gtsi():
-    return render_template("ctsv_gtsi.html")
+    return pages.serve("ctsv_gtsi")
 
 
 # --- 圖片路徑修復補丁 (Magic Route) ---
@@ -722,24 +1058,88 @@ def serve_ctsv_image_fallback(filename):
     因為 ctvs_gtsi.html 前端可能用相對路徑 (src="image.jpg") 呼叫圖片，
     瀏覽器會去 /ctsv_gtsi/image.jpg 找，但圖片實際在 uploads 資料夾。
     這個函數會自動把請求轉接到 static/uploads/ 去。
+    帶 ?size= 時改送縮圖。
     """
     if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        if filename.startswith('uploads/'):
+            filename = filename[len('uploads/'):]
+        if 'size' in request.args:
+            return serve_thumbnail('uploads/' + filename)
+        return serve_upload(filename)
     return "File not found", 404
 
 
+@app.route('/static/uploads/<path:filename>')
+def serve_upload(filename):
+    """上傳檔以 sha256 命名；有記錄原始檔名時以 download_name 送出 (另存新檔時使用原檔名)。"""
+    name = None
+    conn = get_db_conn("ctsv_gtsi")
+    try:
+        row = conn.execute("SELECT original_name FROM uploads WHERE file_path = ?",
+                           ("uploads/" + filename,)).fetchone()
+        name = row[0] if row else None
+    except sqlite3.OperationalError:
+        pass   # 尚未升級 schema
+    finally:
+        conn.close()
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, download_name=name)
+
+
+# --- 縮圖 / WebP 衍生檔 ---
+@app.route('/thumb/<path:filename>')
+def serve_thumbnail(filename):
+    """回傳 static/ 下圖片的縮圖 (?size=寬度)，瀏覽器支援時優先送 WebP。"""
+    if filename.split('/', 1)[0] == DERIVATIVE_DIRNAME or safe_join(STATIC_ROOT, filename) is None:
+        return "File not found", 404
+    size = request.args.get("size", 640, type=int)
+    accept_webp = "image/webp" in request.headers.get("Accept", "")
+    path, mimetype = get_derivative(STATIC_ROOT, filename, size, accept_webp)
+    if path is None:
+        resp = send_from_directory(STATIC_ROOT, filename)
+    else:
+        resp = send_file(path, mimetype=mimetype, conditional=True)
+    # uploads/ 下的檔名就是內容 hash，內容不會變
+    if filename.startswith('uploads/'):
+        resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        resp.headers["Cache-Control"] = "public, max-age=86400"
+    resp.headers["Vary"] = "Accept"
+    return resp
+
+
 # --- Waiver API ---
 @app.route("/api/waiver/list/<suite>")
 def list_waivers(suite):
-    conn = get_db_conn("waiver")
-    cur = conn.cursor()
-    cur.execute("SELECT id, suite, waiver_id, module, test_case, note FROM waivers WHERE suite = ? ORDER BY id",
-                (suite.upper(),))
-    rows = cur.fetchall()
-    conn.close()
-    data = [{"id": r["id"], "suite": r["suite"], "waiver_id": r["waiver_id"], "module": r["module"],
-             "test_case": r["test_case"], "note": r["note"]} for r in rows]
-    return jsonify(data)
+    """不帶參數時回傳整個 suite；帶 after / limit 時改為 keyset 分頁 ({"items", "next_cursor"})。"""
+    paged = "after" in request.args or "limit" in request.args
+    after = request.args.get("after", 0, type=int)
+    limit = page_limit() if paged else None
+
+    def build(conn):
+        cur = conn.cursor()
+        if paged:
+            cur.execute("SELECT id, suite, waiver_id, module, test_case, note FROM waivers "
+                        "WHERE suite = ? AND id > ? ORDER BY id LIMIT ?", (suite.upper(), after, limit + 1))
+        else:
+            cur.execute("SELECT id, suite, waiver_id, module, test_case, note FROM waivers WHERE suite = ? ORDER BY id",
+                        (suite.upper(),))
+        data = [{"id": r["id"], "suite": r["suite"], "waiver_id": r["waiver_id"], "module": r["module"],
+                 "test_case": r["test_case"], "note": r["note"]} for r in cur.fetchall()]
+        if not paged:
+            return data
+        has_more = len(data) > limit
+        data = data[:limit]
+        return {"items": data, "next_cursor": make_cursor(data[-1]["id"]) if has_more else None}
+
+    key = ("waivers", suite.upper(), after if paged else None, limit)
+    return versioned_json("waiver", ("waivers",), key, build)
+
+
+@app.route("/api/waiver/changes")
+def waiver_changes():
+    sql = f"SELECT {WAIVER_COLUMNS} FROM waivers"
+    return changes_json("waiver", "waivers", "id", _fetch_waivers,
+                        lambda conn, after, limit: [dict(r) for r in _rows_after(conn, sql, "id", after, limit)])
 
 
 @app.route("/api/waiver/add", methods=["POST"])
@@ -750,9 +1150,13 @@ def add_waiver():
     cur.execute("INSERT INTO waivers (suite, waiver_id, module, test_case, note) VALUES (?, ?, ?, ?, ?)",
                 (data.get("suite").upper(), data.get("waiver_id"), data.get("module"), data.get("test_case"),
                  data.get("note")))
+    index_queued(conn, "waivers")
     conn.commit()
     new_id = cur.lastrowid
+    _refresh_waiver_row(cur, new_id)
+    row = conn.execute(f"SELECT {WAIVER_COLUMNS} FROM waivers WHERE id = ?", (new_id,)).fetchone()
     conn.close()
+    publish_change("waiver", "waivers", "insert", row=row)
     return jsonify({"status": "ok", "id": new_id})
 
 
@@ -764,8 +1168,13 @@ def update_waiver(waiver_id):
     cur.execute("UPDATE waivers SET suite = ?, waiver_id = ?, module = ?, test_case = ?, note = ? WHERE id = ?",
                 (data.get("suite").upper(), data.get("waiver_id"), data.get("module"), data.get("test_case"),
                  data.get("note"), waiver_id))
+    index_queued(conn, "waivers")
     conn.commit()
+    _refresh_waiver_row(cur, waiver_id)
+    row = conn.execute(f"SELECT {WAIVER_COLUMNS} FROM waivers WHERE id = ?", (waiver_id,)).fetchone()
     conn.close()
+    if row is not None:
+        publish_change("waiver", "waivers", "update", row=row)
     return jsonify({"status": "ok"})
 
 
@@ -774,21 +1183,84 @@ def delete_waiver(waiver_id):
     conn = get_db_conn("waiver")
     cur = conn.cursor()
     cur.execute("DELETE FROM waivers WHERE id = ?", (waiver_id,))
+    index_queued(conn, "waivers")
     conn.commit()
+    deleted = cur.rowcount
+    _refresh_waiver_row(cur, waiver_id)
     conn.close()
+    if deleted:
+        publish_change("waiver", "waivers", "delete", row_id=waiver_id)
     return jsonify({"status": "ok"})
 
 
+@app.route("/api/waiver/bulk", methods=["POST"])
+def bulk_import_waivers():
+    return bulk_import("waiver", WAIVER_SPEC)
+
+
+@app.route("/api/waiver/export")
+def export_waivers():
+    suite = (request.args.get("suite") or "").upper()
+    if suite:
+        return bulk_export("waiver", WAIVER_SPEC, f"waivers_{suite}", "WHERE suite = ?", (suite,))
+    return bulk_export("waiver", WAIVER_SPEC, "waivers")
+
+
+@app.route("/api/waiver/match", methods=["POST"])
+def match_waivers():
+    """
+    批次比對 waiver。body 可為:
+      {"suite": "CTS", "items": [{"module": ..., "test_case": ...}, ...]}
+      [["CTS", "CtsFooTestCases", "android.foo.BarTest#testX"], ...]
+    回傳 results 與輸入順序一一對應，未命中為 null。
+    """
+    data = request.json
+    default_suite = ""
+    if isinstance(data, dict):
+        default_suite = data.get("suite") or ""
+        items = data.get("items") or []
+    else:
+        items = data or []
+    if not isinstance(items, list):
+        return jsonify({"status": "error", "message": "items must be a list"}), 400
+
+    index = get_waiver_index()
+    results = []
+    matched = 0
+    for item in items:
+        if isinstance(item, dict):
+            suite, module, test_case = item.get("suite") or default_suite, item.get("module"), item.get("test_case")
+        elif isinstance(item, (list, tuple)) and len(item) == 3:
+            suite, module, test_case = item
+        else:
+            results.append(None)
+            continue
+        row, kind = index.match(suite, module, test_case)
+        if row is None:
+            results.append(None)
+            continue
+        matched += 1
+        results.append({"id": row["id"], "waiver_id": row["waiver_id"], "match": kind,
+                        "module": row["module"], "test_case": row["test_case"]})
+    return jsonify({"status": "ok", "matched": matched, "total": len(items), "results": results})
+
+
 # --- Retry API ---
 @app.route("/api/retry/list")
 def list_retry_tips():
-    conn = get_db_conn("retry")
-    cur = conn.cursor()
-    cur.execute("SELECT id, type, module_case, condition, trick FROM retry_tips ORDER BY id")
-    rows = cur.fetchall()
-    conn.close()
-    data = [{k: r[k] for k in r.keys()} for r in rows]
-    return jsonify(data)
+    def build(conn):
+        cur = conn.cursor()
+        cur.execute("SELECT id, type, module_case, condition, trick FROM retry_tips ORDER BY id")
+        return [{k: r[k] for k in r.keys()} for r in cur.fetchall()]
+
+    return versioned_json("retry", ("retry_tips",), ("retry_tips",), build)
+
+
+@app.route("/api/retry/changes")
+def retry_tip_changes():
+    sql = f"SELECT {RETRY_TIP_COLUMNS} FROM retry_tips"
+    return changes_json("retry", "retry_tips", "id", _fetch_retry_tips,
+                        lambda conn, after, limit: [dict(r) for r in _rows_after(conn, sql, "id", after, limit)])
 
 
 @app.route("/api/retry/add", methods=["POST"])
@@ -798,9 +1270,12 @@ def add_retry_tip():
     cur = conn.cursor()
     cur.execute("INSERT INTO retry_tips (type, module_case, condition, trick) VALUES (?, ?, ?, ?)",
                 (data.get("type"), data.get("module_case"), data.get("condition"), data.get("trick")))
+    index_queued(conn, "retry_tips")
     conn.commit()
     new_id = cur.lastrowid
+    row = conn.execute(f"SELECT {RETRY_TIP_COLUMNS} FROM retry_tips WHERE id = ?", (new_id,)).fetchone()
     conn.close()
+    publish_change("retry", "retry_tips", "insert", row=row)
     return jsonify({"status": "ok", "id": new_id})
 
 
@@ -811,8 +1286,12 @@ def update_retry_tip(tip_id):
     cur = conn.cursor()
     cur.execute("UPDATE retry_tips SET type = ?, module_case = ?, condition = ?, trick = ? WHERE id = ?",
                 (data.get("type"), data.get("module_case"), data.get("condition"), data.get("trick"), tip_id))
+    index_queued(conn, "retry_tips")
     conn.commit()
+    row = conn.execute(f"SELECT {RETRY_TIP_COLUMNS} FROM retry_tips WHERE id = ?", (tip_id,)).fetchone()
     conn.close()
+    if row is not None:
+        publish_change("retry", "retry_tips", "update", row=row)
     return jsonify({"status": "ok"})
 
 
@@ -821,21 +1300,41 @@ def delete_retry_tip(tip_id):
     conn = get_db_conn("retry")
     cur = conn.cursor()
     cur.execute("DELETE FROM retry_tips WHERE id = ?", (tip_id,))
+    index_queued(conn, "retry_tips")
     conn.commit()
+    deleted = cur.rowcount
     conn.close()
+    if deleted:
+        publish_change("retry", "retry_tips", "delete", row_id=tip_id)
     return jsonify({"status": "ok"})
 
 
+@app.route("/api/retry/bulk", methods=["POST"])
+def bulk_import_retry_tips():
+    return bulk_import("retry", RETRY_SPEC)
+
+
+@app.route("/api/retry/export")
+def export_retry_tips():
+    return bulk_export("retry", RETRY_SPEC, "retry_tips")
+
+
 # --- Suites API ---
 @app.route("/api/suites/list")
 def list_suites():
-    conn = get_db_conn("retry")
-    cur = conn.cursor()
-    cur.execute("SELECT suite_key, suite_title, suite_tag, display_order FROM suites ORDER BY display_order")
-    rows = cur.fetchall()
-    conn.close()
-    data = [{k: r[k] for k in r.keys()} for r in rows]
-    return jsonify(data)
+    def build(conn):
+        cur = conn.cursor()
+        cur.execute("SELECT suite_key, suite_title, suite_tag, display_order FROM suites ORDER BY display_order")
+        return [{k: r[k] for k in r.keys()} for r in cur.fetchall()]
+
+    return versioned_json("retry", ("suites",), ("suites",), build)
+
+
+@app.route("/api/suites/changes")
+def suite_changes():
+    sql = f"SELECT {SUITE_COLUMNS} FROM suites"
+    return changes_json("retry", "suites", "suite_key", _fetch_suites,
+                        lambda conn, after, limit: [dict(r) for r in _rows_after(conn, sql, "suite_key", after, limit)])
 
 
 @app.route("/api/suites/add", methods=["POST"])
@@ -849,11 +1348,13 @@ def add_suite():
 
     conn = get_db_conn("retry")
     cur = conn.cursor()
-    cur.execute("INSERT INTO suites (suite_key, suite_title, suite_tag, display_order) VALUES (?, ?, ?, 999)",
-                (suite_key, suite_title, suite_tag))
+    cur.execute("INSERT INTO suites (suite_key, suite_title, suite_tag, display_order) VALUES (?, ?, ?, ?)",
+                (suite_key, suite_title, suite_tag, next_order_value(conn, "suites")))
     conn.commit()
     new_id = cur.lastrowid
+    row = conn.execute(f"SELECT {SUITE_COLUMNS} FROM suites WHERE suite_key = ?", (suite_key,)).fetchone()
     conn.close()
+    publish_change("retry", "suites", "insert", row=row)
     return jsonify({"status": "ok", "id": new_id, "suite_key": suite_key})
 
 
@@ -863,58 +1364,113 @@ def delete_suite(suite_key):
     cur = conn.cursor()
     cur.execute("DELETE FROM suites WHERE suite_key = ?", (suite_key.upper(),))
     conn.commit()
+    deleted = cur.rowcount
     conn.close()
+    if deleted:
+        publish_change("retry", "suites", "delete", row_id=suite_key.upper())
     return jsonify({"status": "ok"})
 
 
 @app.route("/api/suites/reorder", methods=["PUT"])
 def reorder_suites():
     data = request.json or []
+    if not isinstance(data, list) or not all(isinstance(key, str) for key in data):
+        return jsonify({"status": "error", "message": "body must be a list of suite keys"}), 400
     conn = get_db_conn("retry")
-    cur = conn.cursor()
-    for idx, key in enumerate(data):
-        cur.execute("UPDATE suites SET display_order = ? WHERE suite_key = ?", ((idx + 1) * 10, key.upper()))
-    conn.commit()
-    conn.close()
-    return jsonify({"status": "ok"})
+    try:
+        result = apply_order(conn, "suites", "suite_key", [key.upper() for key in data])
+        items = [dict(r) for r in conn.execute("SELECT suite_key, display_order FROM suites ORDER BY display_order")]
+    finally:
+        conn.close()
+    if result.get("updated"):
+        publish_change("retry", "suites", "reorder", items=items)
+    return jsonify(dict(result, status="ok"))
 
 
 # --- CTSV/GTSI API ---
 @app.route("/api/ctsv_gtsi/sections/list")
 def list_ctsv_sections():
-    conn = get_db_conn("ctsv_gtsi")
-    cur = conn.cursor()
-    cur.execute("SELECT section_key, title, tag FROM ctsv_sections ORDER BY display_order")
-    rows = cur.fetchall()
-    conn.close()
-    data = [{k: r[k] for k in r.keys()} for r in rows]
-    return jsonify(data)
+    def build(conn):
+        cur = conn.cursor()
+        cur.execute("SELECT section_key, title, tag FROM ctsv_sections ORDER BY display_order")
+        return [{k: r[k] for k in r.keys()} for r in cur.fetchall()]
+
+    return versioned_json("ctsv_gtsi", ("ctsv_sections",), ("ctsv_sections",), build)
+
+
+CARD_COLUMNS = "c.id, c.section_key, c.card_title, c.card_subtitle, c.content, c.note, c.display_order"
+# 每張卡片的圖片以子查詢組成 JSON 陣列，避免 IN (?,?,...) 隨卡片數成長
+CARD_IMAGES_SUBQUERY = ("(SELECT json_group_array(filename) FROM "
+                        "(SELECT filename FROM card_images i WHERE i.card_id = c.id ORDER BY i.display_order, i.id))"
+                        " AS image_urls")
+
+
+def _card_rows(cur):
+    cards = []
+    for r in cur.fetchall():
+        c = dict(r)
+        c["image_urls"] = json.loads(c["image_urls"]) if c["image_urls"] else []
+        cards.append(c)
+    return cards
 
 
 @app.route("/api/ctsv_gtsi/cards/list")
 def list_ctsv_cards():
-    conn = get_db_conn("ctsv_gtsi")
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, section_key, card_title, card_subtitle, content, note, display_order FROM test_cards ORDER BY section_key, display_order")
-    cards = [dict(r) for r in cur.fetchall()]
-
-    # 獲取圖片
-    card_ids = [c['id'] for c in cards]
-    imgs_by_card = {}
-    if card_ids:
-        placeholders = ','.join('?' for _ in card_ids)
-        cur.execute(
-            f"SELECT card_id, filename FROM card_images WHERE card_id IN ({placeholders}) ORDER BY card_id, display_order",
-            card_ids)
-        for r in cur.fetchall():
-            imgs_by_card.setdefault(r["card_id"], []).append(r["filename"])
-
-    for c in cards:
-        c["image_urls"] = imgs_by_card.get(c["id"], [])
-
-    conn.close()
-    return jsonify(cards)
+    """
+    不帶參數時回傳所有卡片 (舊版前端使用)。
+    帶 section / after / limit 時為 keyset 分頁:
+      ?section=GTSI&after=<display_order>,<id>&limit=50
+      (不指定 section 時 cursor 為 <section_key>,<display_order>,<id>)
+    回傳 {"items": [...], "next_cursor": ...}。
+    """
+    section = request.args.get("section")
+    paged = any(k in request.args for k in ("section", "after", "limit"))
+    after = parse_cursor(request.args.get("after"), 2 if section else 3)
+    limit = page_limit() if paged else None
+
+    def build(conn):
+        cur = conn.cursor()
+        if not paged:
+            cur.execute(f"SELECT {CARD_COLUMNS}, {CARD_IMAGES_SUBQUERY} FROM test_cards c "
+                        "ORDER BY c.section_key, c.display_order, c.id")
+            return _card_rows(cur)
+
+        where, params = [], []
+        if section:
+            where.append("c.section_key = ?")
+            params.append(section)
+            if after:
+                where.append("(c.display_order, c.id) > (?, ?)")
+                params.extend(after)
+        elif after:
+            where.append("(c.section_key, c.display_order, c.id) > (?, ?, ?)")
+            params.extend(after)
+        sql = f"SELECT {CARD_COLUMNS}, {CARD_IMAGES_SUBQUERY} FROM test_cards c"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY c.section_key, c.display_order, c.id LIMIT ?"
+        cur.execute(sql, params + [limit + 1])
+        cards = _card_rows(cur)
+        has_more = len(cards) > limit
+        cards = cards[:limit]
+        next_cursor = None
+        if has_more:
+            last = cards[-1]
+            keys = (last["display_order"], last["id"]) if section else \
+                (last["section_key"], last["display_order"], last["id"])
+            next_cursor = make_cursor(*keys)
+        return {"items": cards, "next_cursor": next_cursor}
+
+    key = ("test_cards", section, after, limit)
+    return versioned_json("ctsv_gtsi", ("test_cards", "card_images"), key, build)
+
+
+@app.route("/api/ctsv_gtsi/cards/changes")
+def card_changes():
+    """卡片與其圖片的增量同步；圖片的新增 / 刪除 / 排序變動都會讓該卡片出現在 upserts。"""
+    sql = f"SELECT {CARD_COLUMNS}, {CARD_IMAGES_SUBQUERY} FROM test_cards c"
+    return changes_json("ctsv_gtsi", "test_cards", "id", _fetch_cards,
+                        lambda conn, after, limit: _card_rows(_rows_after(conn, sql, "c.id", after, limit)))
 
 
 @app.route("/api/ctsv_gtsi/cards/add", methods=["POST"])
@@ -923,40 +1479,120 @@ def add_ctsv_card():
     conn = get_db_conn("ctsv_gtsi")
     cur = conn.cursor()
     cur.execute(
-        "INSERT INTO test_cards (section_key, card_title, card_subtitle, content, note, display_order) VALUES (?, ?, ?, ?, ?, 999)",
-        (data['section_key'], data['card_title'], data.get('card_subtitle'), data['content'], data.get('note')))
+        "INSERT INTO test_cards (section_key, card_title, card_subtitle, content, note, display_order) VALUES (?, ?, ?, ?, ?, ?)",
+        (data['section_key'], data['card_title'], data.get('card_subtitle'), data['content'], data.get('note'),
+         next_order_value(conn, "test_cards", "section_key = ?", (data['section_key'],))))
     new_id = cur.lastrowid
 
     # 處理圖片
-    image_urls = data.get("image_urls") or []
-    for idx, url in enumerate(image_urls):
-        cur.execute("INSERT INTO card_images (card_id, filename, display_order) VALUES (?, ?, ?)",
-                    (new_id, url, (idx + 1) * 10))
+    _sync_card_images(conn, new_id, data.get("image_urls") or [])
 
+    index_queued(conn, "test_cards")
     conn.commit()
+    card = _card_row(conn, new_id)
     conn.close()
+    publish_change("ctsv_gtsi", "test_cards", "insert", row=card)
     return jsonify({"status": "ok", "id": new_id})
 
 
+CARD_FIELDS = ("section_key", "card_title", "card_subtitle", "content", "note")
+CARD_REQUIRED_FIELDS = ("section_key", "card_title", "content")
+
+
+def _sync_card_images(conn, card_id, image_urls):
+    """只寫入有變動的圖片資料列: 刪除移除的、新增新的、調整順序變動的。"""
+    stored = conn.execute("SELECT id, filename, display_order FROM card_images WHERE card_id = ? "
+                          "ORDER BY display_order, id", (card_id,)).fetchall()
+    deletes, updates, inserts = diff_ordered_values([tuple(r) for r in stored], list(image_urls))
+    if deletes:
+        conn.executemany("DELETE FROM card_images WHERE id = ?", [(i,) for i in deletes])
+    if updates:
+        conn.executemany("UPDATE card_images SET display_order = ? WHERE id = ?",
+                         [(v, i) for i, v in updates.items()])
+    if inserts:
+        conn.executemany("INSERT INTO card_images (card_id, filename, display_order) VALUES (?, ?, ?)",
+                         [(card_id, url, order) for url, order in inserts])
+    return {"added": len(inserts), "removed": len(deletes), "moved": len(updates)}
+
+
+def _update_card(card_id, data, partial):
+    """
+    PUT (partial=False) 需帶齊必要欄位；PATCH 只處理有送來的欄位。
+    兩者都只 UPDATE 值有變的欄位，圖片以差異更新。
+    """
+    if not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "invalid body"}), 400
+    if not partial:
+        missing = [f for f in CARD_REQUIRED_FIELDS if not data.get(f)]
+        if missing:
+            return jsonify({"status": "error", "message": "missing " + ", ".join(missing)}), 400
+    elif any(f in data and not data[f] for f in CARD_REQUIRED_FIELDS):
+        return jsonify({"status": "error", "message": "required field cannot be empty"}), 400
+    image_urls = data.get("image_urls")
+    if image_urls is not None and not (isinstance(image_urls, list) and all(isinstance(u, str) for u in image_urls)):
+        return jsonify({"status": "error", "message": "image_urls must be a list of strings"}), 400
+
+    conn = get_db_conn("ctsv_gtsi")
+    try:
+        row = conn.execute(f"SELECT {', '.join(CARD_FIELDS)} FROM test_cards WHERE id = ?", (card_id,)).fetchone()
+        if row is None:
+            return jsonify({"status": "error", "message": "card not found"}), 404
+        fields = CARD_FIELDS if not partial else [f for f in CARD_FIELDS if f in data]
+        changed = {f: data.get(f) for f in fields if data.get(f) != row[f]}
+        with conn:
+            if changed:
+                if "section_key" in changed:
+                    # 換區塊時排到新區塊最後
+                    changed["display_order"] = next_order_value(conn, "test_cards", "section_key = ?",
+                                                                (changed["section_key"],))
+                conn.execute(f"UPDATE test_cards SET {', '.join(f + ' = ?' for f in changed)} WHERE id = ?",
+                             (*changed.values(), card_id))
+            images = None
+            if image_urls is not None or not partial:
+                images = _sync_card_images(conn, card_id, image_urls or [])
+            index_queued(conn, "test_cards")
+        card = _card_row(conn, card_id) if changed or (images and any(images.values())) else None
+    finally:
+        conn.close()
+    if card is not None:
+        publish_change("ctsv_gtsi", "test_cards", "update", row=card)
+    return jsonify({"status": "ok", "changed": sorted(changed), "images": images})
+
+
 @app.route("/api/ctsv_gtsi/cards/update/<int:card_id>", methods=["PUT"])
 def update_ctsv_card(card_id):
-    data = request.json or {}
-    conn = get_db_conn("ctsv_gtsi")
-    cur = conn.cursor()
-    cur.execute("UPDATE test_cards SET section_key=?, card_title=?, card_subtitle=?, content=?, note=? WHERE id=?",
-                (data['section_key'], data['card_title'], data.get('card_subtitle'), data['content'], data.get('note'),
-                 card_id))
+    return _update_card(card_id, request.get_json(silent=True), partial=False)
 
-    # 更新圖片 (先刪後加)
-    cur.execute("DELETE FROM card_images WHERE card_id = ?", (card_id,))
-    image_urls = data.get("image_urls") or []
-    for idx, url in enumerate(image_urls):
-        cur.execute("INSERT INTO card_images (card_id, filename, display_order) VALUES (?, ?, ?)",
-                    (card_id, url, (idx + 1) * 10))
 
-    conn.commit()
-    conn.close()
-    return jsonify({"status": "ok"})
+@app.route("/api/ctsv_gtsi/cards/<int:card_id>", methods=["PATCH"])
+def patch_ctsv_card(card_id):
+    """部分更新: 只需送要改的欄位，例如 {"section_key": "..."} 或 {"image_urls": [...]}。"""
+    return _update_card(card_id, request.get_json(silent=True), partial=True)
+
+
+@app.route("/api/ctsv_gtsi/cards/reorder/<section_key>", methods=["PUT"])
+def reorder_ctsv_cards(section_key):
+    """
+    body 為該區塊卡片 id 的新順序。只更新排序值需要變更的卡片 (通常只有被拖曳的那一張)；
+    從其他區塊拖進來的卡片會一併改 section_key。
+    """
+    data = request.json or []
+    try:
+        card_ids = [int(x) for x in data]
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "body must be a list of card ids"}), 400
+    conn = get_db_conn("ctsv_gtsi")
+    try:
+        moved = conn.executemany("UPDATE test_cards SET section_key = ? WHERE id = ? AND section_key <> ?",
+                                 [(section_key, cid, section_key) for cid in card_ids]).rowcount
+        result = apply_order(conn, "test_cards", "id", card_ids, "section_key = ?", (section_key,))
+        items = [dict(r) for r in conn.execute("SELECT id, section_key, display_order FROM test_cards "
+                                               "WHERE section_key = ?", (section_key,))]
+    finally:
+        conn.close()
+    if result.get("updated") or moved:
+        publish_change("ctsv_gtsi", "test_cards", "reorder", section_key=section_key, items=items)
+    return jsonify(dict(result, status="ok"))
 
 
 @app.route("/api/ctsv_gtsi/cards/delete/<int:card_id>", methods=["DELETE"])
@@ -964,8 +1600,12 @@ def delete_ctsv_card(card_id):
     conn = get_db_conn("ctsv_gtsi")
     cur = conn.cursor()
     cur.execute("DELETE FROM test_cards WHERE id = ?", (card_id,))
+    index_queued(conn, "test_cards")
     conn.commit()
+    deleted = cur.rowcount
     conn.close()
+    if deleted:
+        publish_change("ctsv_gtsi", "test_cards", "delete", row_id=card_id)
     return jsonify({"status": "ok"})
 
 
@@ -974,16 +1614,409 @@ def upload_file():
     if 'file' not in request.files: return jsonify({"status": "error"}), 400
     file = request.files['file']
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-        return jsonify({"status": "ok", "file_path": filename})
+        # 以內容 sha256 存檔，同名不同內容不會互相覆蓋，同內容只存一份
+        result = upload_store.save_stream(file.stream, file.filename)
+        _record_upload(result)
+        submit_derivatives(STATIC_ROOT, result["file_path"])
+        return jsonify(dict(result, status="ok"))
     return jsonify({"status": "error"}), 400
 
 
+def _record_upload(result):
+    """記錄 content-addressed 檔案的原始檔名；同內容已有記錄時保留第一次的檔名。"""
+    if not result.get("original_name"):
+        return
+    conn = get_db_conn("ctsv_gtsi")
+    try:
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO uploads (file_path, original_name, size, created_at) "
+                         "VALUES (?, ?, ?, ?)",
+                         (result["file_path"], result["original_name"], result.get("size"), time.time()))
+    finally:
+        conn.close()
+
+
+# --- 分段續傳 (init -> chunk... -> finalize) ---
+def _upload_error(e):
+    return jsonify(dict(e.extra, status="error", message=str(e))), e.status
+
+
+@app.route("/api/ctsv_gtsi/upload/init", methods=["POST"])
+def upload_init():
+    data = request.json or {}
+    try:
+        result = upload_store.init(data.get("filename") or "", data.get("size"), data.get("sha256"))
+    except UploadError as e:
+        return _upload_error(e)
+    if result["status"] == "ok":
+        _record_upload(result)
+    return jsonify(result)
+
+
+@app.route("/api/ctsv_gtsi/upload/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    try:
+        return jsonify(upload_store.status(upload_id))
+    except UploadError as e:
+        return _upload_error(e)
+
+
+@app.route("/api/ctsv_gtsi/upload/<upload_id>", methods=["PUT"])
+def upload_chunk(upload_id):
+    offset = request.args.get("offset", type=int)
+    if offset is None:
+        return jsonify({"status": "error", "message": "missing offset"}), 400
+    try:
+        return jsonify(upload_store.write_chunk(upload_id, offset, request.stream))
+    except UploadError as e:
+        return _upload_error(e)
+
+
+@app.route("/api/ctsv_gtsi/upload/<upload_id>/finalize", methods=["POST"])
+def upload_finalize(upload_id):
+    try:
+        result = upload_store.finalize(upload_id)
+    except UploadError as e:
+        return _upload_error(e)
+    _record_upload(result)
+    submit_derivatives(STATIC_ROOT, result["file_path"])
+    return jsonify(result)
+
+
+@app.route("/api/ctsv_gtsi/upload/<upload_id>", methods=["DELETE"])
+def upload_abort(upload_id):
+    try:
+        upload_store.abort(upload_id)
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify({"status": "ok"})
+
+
+# --- Triage API ---
+@app.route("/api/triage", methods=["POST"])
+def triage_upload():
+    """上傳 test_result.xml (或 results zip)，回傳 waived / known_retry / new 分類報告。"""
+    if 'file' not in request.files: return jsonify({"status": "error"}), 400
+    suite = (request.values.get("suite") or "").upper() or None
+    retry_conn = get_db_conn("retry")
+    try:
+        tips = RetryTipMatcher.from_db(retry_conn)
+        with open_result(request.files['file'].stream) as f:
+            report = triage_result(f, get_waiver_index().for_suite, tips, suite=suite)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        retry_conn.close()
+    return jsonify(report)
+
+
+# --- Shard Planner API (見 shard_planner.py) ---
+@app.route("/api/shards/ingest", methods=["POST"])
+def ingest_shard_history():
+    """上傳 test_result.xml (或 results zip)，記錄各模組執行時間。"""
+    if 'file' not in request.files: return jsonify({"status": "error"}), 400
+    f = request.files['file']
+    conn = get_db_conn("retry")
+    try:
+        with open_result(f.stream) as fileobj:
+            result = ingest_result(conn, fileobj, source=f.filename)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        conn.close()
+    return jsonify(dict(result, status="ok"))
+
+
+@app.route("/api/shards/plan", methods=["POST"])
+def plan_shard_run():
+    """
+    body: {"suite": "CTS", "duts": ["SERIAL1:sim", "SERIAL2"] 或 "count": 3,
+           "exclude": [...], "modules": [...], "plan": "cts", "overhead_min": 3}
+    回傳每台 DUT 的模組與 run 指令。
+    """
+    data = request.get_json(silent=True) or {}
+    suite = (data.get("suite") or "").strip()
+    if not suite:
+        return jsonify({"status": "error", "message": "suite is required"}), 400
+    conn = get_db_conn("retry")
+    try:
+        duts = [parse_dut(d) for d in data.get("duts") or []] + \
+            [(None, frozenset())] * int(data.get("count") or 0)
+        overhead = data.get("overhead_min")
+        options = {"overhead_ms": int(float(overhead) * 60000)} if overhead is not None else {}
+        plan = plan_shards(conn, suite, duts, RetryTipMatcher.from_db(conn), exclude=data.get("exclude") or (),
+                           modules=data.get("modules"), plan_name=data.get("plan"), **options)
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        conn.close()
+    return jsonify(plan)
+
+
+@app.route("/api/shards/validate")
+def validate_shard_run():
+    suite = (request.args.get("suite") or "").strip()
+    if not suite:
+        return jsonify({"status": "error", "message": "suite is required"}), 400
+    conn = get_db_conn("retry")
+    try:
+        return jsonify(validate_shard_plans(conn, suite))
+    finally:
+        conn.close()
+
+
+@app.route("/api/results/merge", methods=["POST"])
+def merge_result_sessions():
+    """
+    上傳多份 test_result.xml / results zip (file 欄位可重複：base run、各次 retry、分片結果)，
+    回傳合併後的 pass / fail 摘要與剩餘 fail。?policy=best (預設) 或 latest。
+    """
+    uploads = request.files.getlist('file')
+    if not uploads: return jsonify({"status": "error"}), 400
+    files = []
+    try:
+        for f in uploads:
+            files.append((f.filename, open_result(f.stream)))
+        report = merge_results(files, policy=request.values.get("policy") or "best")
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        for _, fileobj in files:
+            fileobj.close()
+    return jsonify(report)
+
+
+@app.route("/api/retry/commands", methods=["POST"])
+def generate_retry_commands():
+    """
+    上傳 test_result.xml / results zip (file 欄位可重複，先合併)，回傳最精簡的 retry 指令與相關 retry_tips。
+    其他欄位: plan、serial (可重複)、max_length。
+    """
+    uploads = request.files.getlist('file')
+    if not uploads: return jsonify({"status": "error"}), 400
+    max_length = request.values.get("max_length", MAX_COMMAND_CHARS, type=int)
+    conn = get_db_conn("retry")
+    files = []
+    try:
+        tips = RetryTipMatcher.from_db(conn)
+        for f in uploads:
+            files.append((f.filename, open_result(f.stream)))
+        report = build_retry_commands(files, tips, plan_name=request.values.get("plan") or None,
+                                      serials=[s for s in request.values.getlist("serial") if s],
+                                      max_chars=max_length)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        for _, fileobj in files:
+            fileobj.close()
+        conn.close()
+    return jsonify(report)
+
+
+# --- Flaky 分析 API ---
+@app.route("/api/analytics/ingest", methods=["POST"])
+def ingest_analytics():
+    """上傳歷史 test_result.xml / results zip (file 欄位可重複，依執行順序) 匯入 flaky 分析資料。"""
+    uploads = request.files.getlist('file')
+    if not uploads: return jsonify({"status": "error"}), 400
+    files = []
+    try:
+        for f in uploads:
+            files.append((f.filename, open_result(f.stream)))
+        results = flaky_store.ingest(files)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        for _, fileobj in files:
+            fileobj.close()
+    return jsonify({"status": "ok", "results": results})
+
+
+@app.route("/api/analytics/flaky")
+def flaky_analytics():
+    """
+    各模組 / 測項的 flake rate、retry 通過率與各 build fingerprint 的趨勢。
+    ?suite=CTS&module=...&days=180&limit=50&sort=flake_rate|pass_on_retry|failed
+    """
+    days = request.args.get("days", type=int)
+    since_ms = int((time.time() - days * 86400) * 1000) if days else None
+    try:
+        report = flaky_store.report(suite=request.args.get("suite") or None,
+                                    module=request.args.get("module") or None, since_ms=since_ms,
+                                    limit=max(0, min(request.args.get("limit", 50, type=int), 500)),
+                                    sort=request.args.get("sort") or "flake_rate")
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify(report)
+
+
+# --- Search API ---
+@app.route("/api/search")
+def search():
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"status": "error", "message": "missing q"}), 400
+    limit = min(request.args.get("limit", 20, type=int), 200)
+    sources = [s for s in (request.args.get("sources") or "").split(",") if s] or None
+    return jsonify(search_all(get_db_conn, q, limit=limit, sources=sources))
+
+
+# --- Profiling 管理 API (見 profiling.py) ---
+def _profile_admin_error():
+    if not profiler.enabled:
+        return jsonify({"status": "error", "message": "profiling 未啟用 (需設定 TOOL_PROFILE_TOKEN)"}), 404
+    if not profiler.check_token(request.headers.get("X-Profile-Token") or request.args.get("token")):
+        return jsonify({"status": "error", "message": "invalid profile token"}), 403
+    return None
+
+
+@app.route("/api/admin/profiles")
+def list_profiles():
+    error = _profile_admin_error()
+    if error:
+        return error
+    return jsonify({"status": "ok", "profiles": profiler.list(), "armed": profiler.armed(),
+                    "rate_per_minute": profiler.rate})
+
+
+@app.route("/api/admin/profiles/arm", methods=["POST"])
+def arm_profiling():
+    """body: {"route", "query" (選填，query string 需包含), "mode": cprofile/sample, "count", "ttl" (秒)}"""
+    error = _profile_admin_error()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    try:
+        state = profiler.arm(data.get("route"), data.get("mode") or "cprofile", data.get("count") or 1,
+                             data.get("ttl") or 600, data.get("query"))
+    except (ProfilingError, TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "ok", "armed": state})
+
+
+@app.route("/api/admin/profiles/arm", methods=["DELETE"])
+def disarm_profiling():
+    error = _profile_admin_error()
+    if error:
+        return error
+    profiler.disarm()
+    return jsonify({"status": "ok"})
+
+
+@app.route("/api/admin/profiles/<profile_id>")
+def download_profile(profile_id):
+    """預設下載原始檔 (.prof / .folded)；?format=text 回傳可直接閱讀的文字報表。"""
+    error = _profile_admin_error()
+    if error:
+        return error
+    meta, path = profiler.get(profile_id)
+    if meta is None or not os.path.exists(path):
+        return jsonify({"status": "error", "message": "profile not found"}), 404
+    if request.args.get("format") == "text":
+        return Response(profiler.text_report(profile_id), mimetype="text/plain")
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
+
+@app.route("/api/admin/profiles/<profile_id>", methods=["DELETE"])
+def delete_profile(profile_id):
+    error = _profile_admin_error()
+    if error:
+        return error
+    if not profiler.delete(profile_id):
+        return jsonify({"status": "error", "message": "profile not found"}), 404
+    return jsonify({"status": "ok"})
+
+
+@app.route("/api/events")
+def event_stream():
+    """
+    Server-Sent Events: 資料變更即時推送 (event: change，data 為 {db, table, op, row / row_id / items})。
+    ?tables=waivers,retry_tips 只訂閱指定的表。斷線重連時瀏覽器自動帶 Last-Event-ID 補送漏掉的事件；
+    其他 worker / import 腳本的寫入同樣逐筆送出 (見 _read_external_changes)。
+    op 為 resync 時表示無法補送，前端重新載入該表 (table 為 '*' 時全部)。
+    """
+    tables = [t for t in (request.args.get("tables") or "").split(",") if t]
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        sub = event_broker.subscribe(last_event_id, tables)
+    except BrokerFull:
+        # EventSource 收到非 200 不會自動重連，由 live_events.js 依 retry / Retry-After 排程重連
+        return Response(f"retry: {EVENT_BUSY_RETRY_MS}\n\n", status=503, mimetype="text/event-stream",
+                        headers={"Retry-After": str(EVENT_BUSY_RETRY_MS // 1000), "Cache-Control": "no-cache"})
+
+    def generate():
+        # 不使用 stream_with_context: 連線可能持續數分鐘，不佔用 request context 與連線池連線
+        deadline = time.monotonic() + EVENT_STREAM_SECONDS
+        last_sent = time.monotonic()
+        with sub:
+            yield "retry: 3000\n\n"
+            while time.monotonic() < deadline:
+                event_broker.poll_external(_read_external_changes)
+                event = sub.get(timeout=POLL_INTERVAL)
+                if event:
+                    yield format_sse(event)
+                elif time.monotonic() - last_sent >= EVENT_KEEPALIVE_SECONDS:
+                    # 註解行: 讓 proxy 不會因閒置切斷連線，也讓斷線的 client 盡早被偵測到
+                    yield ": keepalive\n\n"
+                else:
+                    continue
+                last_sent = time.monotonic()
+
+    resp = Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # client 在第一次 yield 前就斷線時 generator 不會執行，仍要釋放訂閱名額
+    resp.call_on_close(sub.close)
+    return resp
+
+
 @app.route("/ping")
 def ping(): return "pong", 200
 
 
-if __name__ == "__main__":
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus 格式；gunicorn 多 worker 時合併所有 worker 的數值 (其他 worker 最多延遲 FLUSH_INTERVAL 秒)。"""
+    if not metrics.enabled:
+        return "metrics disabled (TOOL_METRICS=0)\n", 404
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+# ----------------------------------------
+# 啟動 (開發用 app.run 與 production 的 serve.py / wsgi.py 共用)
+# ----------------------------------------
+def create_app(config=None):
+    """
+    套用設定並預先準備所有可共用的資料: schema 升級、change log 壓縮、短詞索引、static manifest、頁面快取、waiver 索引。
+    production 以 preload 方式在 master process 執行一次，fork 出來的 worker 直接共用 (copy-on-write)。
+    """
+    if config:
+        app.config.update(config)
+    # serve.py reload (USR2) 由舊 master re-exec 時帶 GUNICORN_PID；舊 worker 仍在寫 metrics 檔，不能整個清掉
+    metrics.clear_directory(master_alive=bool(os.environ.get("GUNICORN_PID")))
     create_db_if_not_exists()
+    compact_change_logs()
+    index_pending_grams()
+    static_manifest.build()
+    pages.warm_up()
+    with app.app_context():
+        get_waiver_index()
+    # SQLite 連線不能帶到 fork 出來的 worker，preload 用過的連線先關掉
+    db_pools.clear_idle()
+    return app
+
+
+def init_worker(threads=None):
+    """
+    每個 worker 啟動後呼叫 (gunicorn post_fork)：建立自己的連線池連線。
+    threads 為 gthread worker 的 thread 數，SSE 訂閱者上限依此決定。
+    """
+    if threads:
+        event_broker.max_subscribers = max_subscribers_for(threads)
+    if app.config['DB_POOL_ENABLED']:
+        db_pools.warm_up()
+
+
+if __name__ == "__main__":
+    create_app()
+    init_worker()
     app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
@@ -0,0 +1,619 @@
+# bench_api.py
+# -*- coding: utf-8 -*-
+"""
+API 負載 / 延遲 benchmark: 產生指定大小的測試資料庫，以 serve.py 啟動 app，
+對 /api/waiver、/api/retry、/api/suites、/api/ctsv_gtsi 的每個 route 與上傳送出並行請求，
+輸出每個 route 的 throughput 與 p50 / p95 / p99 延遲 (JSON)，可與其他 commit 的結果比較。
+
+- 測試資料依 --seed 產生，內容固定；同樣大小只產生一次 (快取在 .bench_fixtures/)，
+  每組資料量測試前複製一份給 server 使用 (TOOL_DATA_DIR)，不會動到快取與正式資料庫
+- 每個 route 由 --clients 條連線持續送請求 --seconds 秒 (closed loop)，延遲為送出到讀完 response；
+  upload.resumable 為 init -> chunk -> finalize 三個請求合計
+- 先跑所有讀取類 route，再跑寫入類 (新增 / 修改 / bulk / 排序 / 刪除 / 上傳)；每個寫入請求帶不同資料，
+  刪除優先刪掉 benchmark 自己新增的資料
+- 上傳的測試檔 (static/uploads 裡原本沒有的) 結束後會刪除
+- --compare 與先前輸出的 JSON 比較，p95 變慢或 throughput 下降超過 --tolerance 時 exit code 為 1
+
+用法:
+    python bench_api.py                                         # waiver 1k / 100k，卡片 10k，8 clients，每個 route 2 秒
+    python bench_api.py --waivers 1000 100000 1000000 --clients 1 8 32 --json bench.json
+    python bench_api.py --routes 'waiver.*' 'upload.*' --seconds 5
+    python bench_api.py --json new.json --compare bench.json    # 與舊 commit 的結果比較
+    python bench_api.py --list                                  # 列出所有 route 名稱
+"""
+import argparse
+import collections
+import fnmatch
+import http.client
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench_workers import free_port, multipart, remove_uploads, start_server, upload_files
+from change_log import current_seq, make_cursor
+from data_version import EPOCH_KEY
+from migrations import DB_FILES, MIGRATIONS, latest_version, migrate_all
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_ROOT = os.path.join(BASE_DIR, ".bench_fixtures")
+WAIVER_SUITES = ("CTS", "GTS", "VTS", "STS")
+MODULE_COUNT = 600
+MATCH_ITEMS = 100
+BULK_ROWS = 50
+SAMPLE_SIZE = 500
+
+
+class BenchError(Exception):
+    pass
+
+
+# ----------------------------------------
+# 測試資料
+# ----------------------------------------
+def _module_name(i):
+    return f"Cts{['Media', 'Camera', 'Net', 'Os', 'Security', 'Widget'][i % 6]}{i}TestCases"
+
+
+def _waiver_rows(rng, count):
+    for i in range(count):
+        m = rng.randrange(MODULE_COUNT)
+        note = None if i % 3 else f"known issue #{rng.randrange(100000)}"
+        yield (WAIVER_SUITES[i % len(WAIVER_SUITES)], f"WV-{i:07d}", _module_name(m),
+               f"android.m{m}.cts.Class{rng.randrange(200)}Test#test{rng.randrange(1000)}_{i}", note)
+
+
+def _tip_rows(rng, count, types):
+    for i in range(count):
+        m = rng.randrange(MODULE_COUNT)
+        yield (types[i % len(types)], f"{_module_name(m)} android.m{m}.cts.Class{i}Test",
+               f"condition {i}: fails when device is {rng.choice(['idle', 'rebooted', 'offline'])}",
+               f"retry after step {rng.randrange(10)}")
+
+
+def fixture_name(waivers, tips, cards, images, seed):
+    schema = ".".join(str(latest_version(name)) for name in MIGRATIONS)
+    return f"w{waivers}_t{tips}_c{cards}_i{images}_s{seed}_v{schema}"
+
+
+def fixture_paths(path):
+    return {name: os.path.join(path, filename) for name, filename in DB_FILES.items()}
+
+
+def build_fixture(path, waivers, tips, cards, images, seed):
+    """在 path 建立三個資料庫 (schema 走 migrations.py，資料經由 trigger 寫入 change log / 搜尋索引)。"""
+    rng = random.Random(seed)
+    paths = fixture_paths(path)
+    migrate_all(paths)
+
+    conn = sqlite3.connect(paths["waiver"])
+    with conn:
+        conn.executemany("INSERT INTO waivers (suite, waiver_id, module, test_case, note) VALUES (?, ?, ?, ?, ?)",
+                         _waiver_rows(rng, waivers))
+    waiver_ids = list(conn.execute("SELECT MIN(id), MAX(id) FROM waivers").fetchone())
+    sample = [list(r) for r in conn.execute("SELECT suite, module, test_case FROM waivers ORDER BY random() LIMIT ?",
+                                            (SAMPLE_SIZE,))]
+    conn.close()
+
+    conn = sqlite3.connect(paths["retry"])
+    suites = [r[0] for r in conn.execute("SELECT suite_key FROM suites ORDER BY display_order")]
+    with conn:
+        conn.executemany("INSERT INTO retry_tips (type, module_case, condition, trick) VALUES (?, ?, ?, ?)",
+                         _tip_rows(rng, tips, suites))
+    tip_ids = list(conn.execute("SELECT MIN(id), MAX(id) FROM retry_tips").fetchone())
+    conn.close()
+
+    conn = sqlite3.connect(paths["ctsv_gtsi"])
+    sections = [r[0] for r in conn.execute("SELECT section_key FROM ctsv_sections ORDER BY display_order")]
+    with conn:
+        for i in range(cards):
+            section = sections[i % len(sections)]
+            cur = conn.execute("INSERT INTO test_cards (section_key, card_title, card_subtitle, content, note, "
+                               "display_order) VALUES (?, ?, ?, ?, ?, ?)",
+                               (section, f"Card {i}", f"subtitle {i}", f"step {i}\n" * rng.randrange(1, 20),
+                                None, (i // len(sections) + 1) * 1024))
+            conn.executemany("INSERT INTO card_images (card_id, filename, display_order) VALUES (?, ?, ?)",
+                             [(cur.lastrowid, f"bench_{i}_{k}.jpg", (k + 1) * 1024) for k in range(images)])
+    by_section = {s: [r[0] for r in conn.execute(
+        "SELECT id FROM test_cards WHERE section_key = ? ORDER BY display_order, id", (s,))] for s in sections}
+    conn.close()
+
+    meta = {"waivers": waivers, "tips": tips, "cards": cards, "images": images, "seed": seed,
+            "waiver_ids": waiver_ids, "tip_ids": tip_ids, "suites": suites, "sections": by_section,
+            "waiver_sample": sample}
+    with open(os.path.join(path, "fixture.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def ensure_fixture(waivers, tips, cards, images, seed, regenerate=False):
+    """回傳快取的測試資料目錄；沒有時產生 (先寫在暫存目錄，完成後才改名，中斷不會留下不完整的快取)。"""
+    path = os.path.join(FIXTURE_ROOT, fixture_name(waivers, tips, cards, images, seed))
+    if regenerate and os.path.isdir(path):
+        shutil.rmtree(path)
+    if not os.path.isdir(path):
+        os.makedirs(FIXTURE_ROOT, exist_ok=True)
+        work = tempfile.mkdtemp(prefix=".building_", dir=FIXTURE_ROOT)
+        started = time.perf_counter()
+        print(f"產生測試資料: waivers={waivers} tips={tips} cards={cards} (每張 {images} 張圖)...", flush=True)
+        try:
+            build_fixture(work, waivers, tips, cards, images, seed)
+            os.replace(work, path)
+        except BaseException:
+            shutil.rmtree(work, ignore_errors=True)
+            raise
+        print(f"  完成 ({time.perf_counter() - started:.1f}s)", flush=True)
+    return path
+
+
+def copy_fixture(path):
+    run_dir = tempfile.mkdtemp(prefix="bench_api_")
+    for filename in list(DB_FILES.values()) + ["fixture.json"]:
+        shutil.copy2(os.path.join(path, filename), run_dir)
+    return run_dir
+
+
+def _cursor(db_path):
+    """目前的 change log cursor: changes route 帶這個 cursor 時只回傳 benchmark 期間的變動。"""
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT version FROM data_versions WHERE table_name = ?", (EPOCH_KEY,)).fetchone()
+        return make_cursor(row[0] if row else 0, current_seq(conn))
+    finally:
+        conn.close()
+
+
+# ----------------------------------------
+# Route 定義
+# ----------------------------------------
+class Context:
+    """一組資料量的共用狀態: 測試資料資訊、各 route 的請求序號、benchmark 新增的資料 (給刪除用)。"""
+
+    def __init__(self, meta, run_dir, upload_payload):
+        self.meta = meta
+        self.payload = upload_payload
+        self.cursors = {name: _cursor(path) for name, path in fixture_paths(run_dir).items()}
+        self.counters = collections.defaultdict(itertools.count)
+        self.created = collections.defaultdict(collections.deque)
+        self.card_section = {i: s for s, ids in meta["sections"].items() for i in ids}
+        self.card_ids = sorted(self.card_section)
+        self.removed = set()
+        self.pending_upload = None
+        self.lock = threading.Lock()
+
+    def next(self, name):
+        with self.lock:
+            return next(self.counters[name])
+
+    def take(self, kind, fixture_ids, n):
+        """要刪除的資料: 優先取 benchmark 新增的；沒有時由測試資料的最後一筆往前取 (記在 removed)。"""
+        try:
+            return self.created[kind].popleft()
+        except IndexError:
+            if n >= len(fixture_ids):
+                return None
+            with self.lock:
+                self.removed.add((kind, fixture_ids[-1 - n]))
+            return fixture_ids[-1 - n]
+
+    def live(self, kind, ids):
+        return [i for i in ids if (kind, i) not in self.removed]
+
+
+def pick(seq, n):
+    return seq[(n * 2654435761) % len(seq)]
+
+
+def call(conn, method, path, payload=None, raw=None, content_type=None):
+    headers = {}
+    body = raw
+    if payload is not None:
+        body = json.dumps(payload).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    elif content_type:
+        headers["Content-Type"] = content_type
+    try:
+        conn.request(method, path, body=body, headers=headers)
+        resp = conn.getresponse()
+    except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+        # keep-alive 連線被 server 關閉 (閒置逾時或 worker 達 max_requests 後替換)：重新連線再送一次
+        conn.close()
+        conn.request(method, path, body=body, headers=headers)
+        resp = conn.getresponse()
+    data = resp.read()
+    if resp.status >= 400:
+        raise BenchError(f"{method} {path}: HTTP {resp.status} {data[:200]!r}")
+    return data
+
+
+def _id_range(ctx, key):
+    first, last = ctx.meta[key]
+    return range(first, last + 1) if last else range(0)
+
+
+def _waiver_id(ctx, n):
+    ids = _id_range(ctx, "waiver_ids")
+    return pick(ids, n) if ids else 1
+
+
+def _tip_id(ctx, n):
+    ids = _id_range(ctx, "tip_ids")
+    return pick(ids, n) if ids else 1
+
+
+def _card_id(ctx, n):
+    """修改用的卡片 id (跳過已被刪除的)。"""
+    for i in range(n, n + 64):
+        card_id = pick(ctx.card_ids, i)
+        if ("card", card_id) not in ctx.removed:
+            return card_id
+    return card_id
+
+
+def _match_items(ctx, n):
+    sample = ctx.meta["waiver_sample"] or [["CTS", "CtsNone", "none#none"]]
+    items = [pick(sample, n * MATCH_ITEMS + i) for i in range(MATCH_ITEMS // 2)]
+    items += [["CTS", _module_name(i), f"android.miss.Test#test{n}_{i}"] for i in range(MATCH_ITEMS - len(items))]
+    return items
+
+
+def _waiver_body(n, prefix="A"):
+    return {"suite": WAIVER_SUITES[n % len(WAIVER_SUITES)], "waiver_id": f"BENCH-{prefix}{n}",
+            "module": _module_name(n % MODULE_COUNT), "test_case": f"android.bench.Test#{prefix.lower()}{n}",
+            "note": f"bench {n}"}
+
+
+def _tip_body(ctx, n, prefix="A"):
+    return {"type": pick(ctx.meta["suites"], n), "module_case": f"{_module_name(n % MODULE_COUNT)} bench{prefix}{n}",
+            "condition": f"bench condition {n}", "trick": f"bench trick {n}"}
+
+
+def _card_body(ctx, card_id, n):
+    return {"section_key": ctx.card_section.get(card_id, next(iter(ctx.meta["sections"]))),
+            "card_title": f"Card {card_id} (rev {n})", "card_subtitle": f"subtitle {n}",
+            "content": f"updated step {n}\n" * 5, "image_urls": [f"bench_{card_id}_{k}.jpg"
+                                                             for k in range(ctx.meta["images"])]}
+
+
+def op_waiver_add(conn, ctx, n):
+    data = json.loads(call(conn, "POST", "/api/waiver/add", _waiver_body(n)))
+    ctx.created["waiver"].append(data["id"])
+
+
+def op_waiver_delete(conn, ctx, n):
+    waiver_id = ctx.take("waiver", _id_range(ctx, "waiver_ids"), n)
+    call(conn, "DELETE", f"/api/waiver/delete/{waiver_id or 0}")
+
+
+def op_tip_add(conn, ctx, n):
+    data = json.loads(call(conn, "POST", "/api/retry/add", _tip_body(ctx, n)))
+    ctx.created["retry"].append(data["id"])
+
+
+def op_tip_delete(conn, ctx, n):
+    tip_id = ctx.take("retry", _id_range(ctx, "tip_ids"), n)
+    call(conn, "DELETE", f"/api/retry/delete/{tip_id or 0}")
+
+
+def op_suite_add(conn, ctx, n):
+    call(conn, "POST", "/api/suites/add", {"suite_title": f"Bench suite {n}", "suite_tag": f"BENCH-{n}"})
+    ctx.created["suite"].append(f"BENCH_{n}")
+
+
+def op_suite_delete(conn, ctx, n):
+    key = ctx.take("suite", [], n) or f"BENCH_MISSING_{n}"
+    call(conn, "DELETE", f"/api/suites/delete/{key}")
+
+
+def op_suite_reorder(conn, ctx, n):
+    keys = ctx.meta["suites"]
+    call(conn, "PUT", "/api/suites/reorder", keys[::-1] if n % 2 else keys)
+
+
+def op_card_add(conn, ctx, n):
+    body = _card_body(ctx, _card_id(ctx, n) if ctx.card_ids else 0, n)
+    body["card_title"] = f"Bench card {n}"
+    data = json.loads(call(conn, "POST", "/api/ctsv_gtsi/cards/add", body))
+    ctx.created["card"].append(data["id"])
+
+
+def op_card_reorder(conn, ctx, n):
+    """拖曳一張卡片: 送出整個區塊的新順序 (與前端相同)，每次移動不同的卡片。"""
+    section = pick(list(ctx.meta["sections"]), n)
+    ids = ctx.live("card", ctx.meta["sections"][section])
+    if len(ids) > 1:
+        ids.insert(pick(range(len(ids)), n + 1), ids.pop(pick(range(len(ids)), n)))
+    call(conn, "PUT", f"/api/ctsv_gtsi/cards/reorder/{section}", ids)
+
+
+def op_card_delete(conn, ctx, n):
+    card_id = ctx.take("card", ctx.card_ids, n)
+    call(conn, "DELETE", f"/api/ctsv_gtsi/cards/delete/{card_id or 0}")
+
+
+def op_upload_file(conn, ctx, n):
+    body, ctype = multipart(ctx.payload)
+    call(conn, "POST", "/api/ctsv_gtsi/upload_file", raw=body, content_type=ctype)
+
+
+def op_upload_resumable(conn, ctx, n):
+    init = json.loads(call(conn, "POST", "/api/ctsv_gtsi/upload/init",
+                           {"filename": "bench_resumable.pdf", "size": len(ctx.payload)}))
+    upload_id = init["upload_id"]
+    chunk = init.get("chunk_size") or len(ctx.payload)
+    for offset in range(0, len(ctx.payload), chunk):
+        call(conn, "PUT", f"/api/ctsv_gtsi/upload/{upload_id}?offset={offset}",
+             raw=ctx.payload[offset:offset + chunk], content_type="application/octet-stream")
+    call(conn, "POST", f"/api/ctsv_gtsi/upload/{upload_id}/finalize")
+
+
+def _get(path_fn):
+    return lambda conn, ctx, n: call(conn, "GET", path_fn(ctx, n))
+
+
+Route = collections.namedtuple("Route", "name kind op")
+
+ROUTES = [
+    # --- 讀取 ---
+    Route("waiver.list", "read", _get(lambda ctx, n: f"/api/waiver/list/{pick(WAIVER_SUITES, n)}")),
+    Route("waiver.list_page", "read", _get(lambda ctx, n: f"/api/waiver/list/{pick(WAIVER_SUITES, n)}"
+                                                          f"?after={_waiver_id(ctx, n)}&limit=50")),
+    Route("waiver.changes", "read", _get(lambda ctx, n: f"/api/waiver/changes?since={ctx.cursors['waiver']}")),
+    Route("waiver.export", "read", _get(lambda ctx, n: f"/api/waiver/export?suite={pick(WAIVER_SUITES, n)}")),
+    Route("waiver.match", "read", lambda conn, ctx, n: call(conn, "POST", "/api/waiver/match", _match_items(ctx, n))),
+    Route("retry.list", "read", _get(lambda ctx, n: "/api/retry/list")),
+    Route("retry.changes", "read", _get(lambda ctx, n: f"/api/retry/changes?since={ctx.cursors['retry']}")),
+    Route("retry.export", "read", _get(lambda ctx, n: "/api/retry/export")),
+    Route("suites.list", "read", _get(lambda ctx, n: "/api/suites/list")),
+    Route("suites.changes", "read", _get(lambda ctx, n: f"/api/suites/changes?since={ctx.cursors['retry']}")),
+    Route("ctsv.sections", "read", _get(lambda ctx, n: "/api/ctsv_gtsi/sections/list")),
+    Route("ctsv.cards_list", "read", _get(lambda ctx, n: "/api/ctsv_gtsi/cards/list")),
+    Route("ctsv.cards_page", "read", _get(lambda ctx, n: f"/api/ctsv_gtsi/cards/list"
+                                                         f"?section={pick(list(ctx.meta['sections']), n)}&limit=50")),
+    Route("ctsv.cards_changes", "read",
+          _get(lambda ctx, n: f"/api/ctsv_gtsi/cards/changes?since={ctx.cursors['ctsv_gtsi']}")),
+    Route("upload.status", "read", _get(lambda ctx, n: f"/api/ctsv_gtsi/upload/{ctx.pending_upload}")),
+    # --- 寫入 ---
+    Route("waiver.add", "write", op_waiver_add),
+    Route("waiver.update", "write", lambda conn, ctx, n: call(
+        conn, "PUT", f"/api/waiver/update/{_waiver_id(ctx, n)}", _waiver_body(n, "U"))),
+    Route("waiver.bulk", "write", lambda conn, ctx, n: call(
+        conn, "POST", "/api/waiver/bulk", {"rows": [_waiver_body(n * BULK_ROWS + i, "B") for i in range(BULK_ROWS)]})),
+    Route("waiver.delete", "write", op_waiver_delete),
+    Route("retry.add", "write", op_tip_add),
+    Route("retry.update", "write", lambda conn, ctx, n: call(
+        conn, "PUT", f"/api/retry/update/{_tip_id(ctx, n)}", _tip_body(ctx, n, "U"))),
+    Route("retry.bulk", "write", lambda conn, ctx, n: call(
+        conn, "POST", "/api/retry/bulk", {"rows": [_tip_body(ctx, n * BULK_ROWS + i, "B") for i in range(BULK_ROWS)]})),
+    Route("retry.delete", "write", op_tip_delete),
+    Route("suites.add", "write", op_suite_add),
+    Route("suites.reorder", "write", op_suite_reorder),
+    Route("suites.delete", "write", op_suite_delete),
+    Route("ctsv.cards_add", "write", op_card_add),
+    Route("ctsv.cards_update", "write", lambda conn, ctx, n: call(
+        conn, "PUT", f"/api/ctsv_gtsi/cards/update/{_card_id(ctx, n)}", _card_body(ctx, _card_id(ctx, n), n))),
+    Route("ctsv.cards_patch", "write", lambda conn, ctx, n: call(
+        conn, "PATCH", f"/api/ctsv_gtsi/cards/{_card_id(ctx, n)}", {"note": f"bench note {n}"})),
+    Route("ctsv.cards_reorder", "write", op_card_reorder),
+    Route("ctsv.cards_delete", "write", op_card_delete),
+    Route("upload.file", "write", op_upload_file),
+    Route("upload.resumable", "write", op_upload_resumable),
+]
+
+
+# ----------------------------------------
+# 負載 / 統計
+# ----------------------------------------
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+
+def run_route(port, route, ctx, clients, seconds):
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    samples = []
+    deadline = time.perf_counter() + seconds
+
+    def worker(idx):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+        while time.perf_counter() < deadline:
+            n = ctx.next(route.name)
+            start = time.perf_counter()
+            try:
+                route.op(conn, ctx, n)
+                latencies[idx].append(time.perf_counter() - start)
+            except (BenchError, OSError, http.client.HTTPException, KeyError, ValueError) as e:
+                errors[idx] += 1
+                if not samples:
+                    samples.append(f"{type(e).__name__}: {e}")
+                if not isinstance(e, BenchError):
+                    conn.close()
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    values = sorted(v * 1000 for lat in latencies for v in lat)
+    result = {
+        "route": route.name, "kind": route.kind, "clients": clients,
+        "requests": len(values), "errors": sum(errors), "seconds": round(elapsed, 3),
+        "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(values) / len(values), 3) if values else None,
+            **{f"p{p}": round(percentile(values, p), 3) if values else None for p in (50, 95, 99)},
+            "max": round(values[-1], 3) if values else None,
+        },
+    }
+    if samples:
+        result["error_sample"] = samples[0]
+    return result
+
+
+def bench_dataset(args, routes, waivers, payload):
+    fixture = ensure_fixture(waivers, args.tips, args.cards, args.images, args.seed, args.regenerate)
+    run_dir = copy_fixture(fixture)
+    with open(os.path.join(run_dir, "fixture.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    ctx = Context(meta, run_dir, payload)
+    dataset = f"waivers={waivers},tips={args.tips},cards={args.cards}"
+
+    port = free_port()
+    started = time.perf_counter()
+    proc = start_server(args.workers, args.threads, port, env={"TOOL_DATA_DIR": run_dir},
+                        timeout=args.startup_timeout)
+    startup = time.perf_counter() - started
+    print(f"\n== {dataset} (server 啟動 {startup:.1f}s) ==", flush=True)
+    results = []
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        ctx.pending_upload = json.loads(call(conn, "POST", "/api/ctsv_gtsi/upload/init",
+                                             {"filename": "bench_pending.pdf", "size": len(payload)}))["upload_id"]
+        # 讀取類在所有 clients 數量下先跑完，寫入類才開始改資料
+        for kind in ("read", "write"):
+            for clients in args.clients:
+                for route in (r for r in routes if r.kind == kind):
+                    if args.warmup:
+                        run_route(port, route, ctx, clients, args.warmup)
+                    result = dict(run_route(port, route, ctx, clients, args.seconds), dataset=dataset,
+                                  waivers=waivers, tips=args.tips, cards=args.cards)
+                    results.append(result)
+                    print_result(result)
+        call(conn, "DELETE", f"/api/ctsv_gtsi/upload/{ctx.pending_upload}")
+    finally:
+        conn.close()
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return results, round(startup, 2)
+
+
+# ----------------------------------------
+# 輸出 / 比較
+# ----------------------------------------
+def git_info():
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=BASE_DIR, capture_output=True, text=True,
+                                  timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": git("rev-parse", "HEAD") or None,
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def print_result(r, out=sys.stdout):
+    lat = r["latency_ms"]
+    fmt = lambda v: f"{v:>9.1f}" if v is not None else f"{'-':>9}"
+    print(f"  {r['route']:<22}{r['clients']:>4}c{r['rps']:>10.1f}/s" + "".join(fmt(lat[k]) for k in (
+        "p50", "p95", "p99")) + (f"  errors={r['errors']} ({r.get('error_sample', '')[:120]})" if r["errors"] else ""),
+          file=out, flush=True)
+
+
+def compare(report, baseline, tolerance, out=sys.stdout):
+    """回傳退步的項目 (p95 變慢或 rps 下降超過 tolerance)。"""
+    index = {(r["dataset"], r["route"], r["clients"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n== 與 {baseline['meta'].get('commit') or '?'} 比較 (tolerance {tolerance:.0%}) ==", file=out)
+    print(f"  {'route':<22}{'clients':>8}{'rps':>18}{'p95 ms':>20}", file=out)
+    for r in report["results"]:
+        old = index.get((r["dataset"], r["route"], r["clients"]))
+        if not old or not old["requests"] or not r["requests"]:
+            continue
+        p95_old, p95_new = old["latency_ms"]["p95"], r["latency_ms"]["p95"]
+        slower = p95_old and p95_new > p95_old * (1 + tolerance)
+        fewer = r["rps"] < old["rps"] * (1 - tolerance)
+        mark = "  ⚠️" if slower or fewer else ""
+        print(f"  {r['route']:<22}{r['clients']:>8}{old['rps']:>9.0f}->{r['rps']:<7.0f}"
+              f"{p95_old:>10.1f}->{p95_new:<8.1f}{mark}", file=out)
+        if slower or fewer:
+            regressions.append({"dataset": r["dataset"], "route": r["route"], "clients": r["clients"],
+                                "rps": [old["rps"], r["rps"]], "p95_ms": [p95_old, p95_new]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load / latency benchmark for every API route")
+    parser.add_argument("--waivers", type=int, nargs="+", default=[1000, 100_000], help="waiver 筆數 (每個值一組資料)")
+    parser.add_argument("--tips", type=int, default=2000, help="retry tip 筆數")
+    parser.add_argument("--cards", type=int, default=10_000, help="卡片數")
+    parser.add_argument("--images", type=int, default=2, help="每張卡片的圖片數")
+    parser.add_argument("--clients", type=int, nargs="+", default=[8], help="並行連線數 (可多個)")
+    parser.add_argument("--seconds", type=float, default=2.0, help="每個 route 的測試秒數")
+    parser.add_argument("--warmup", type=float, default=0.5, help="每個 route 正式測試前的暖機秒數")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8, help="每個 worker 的 thread 數")
+    parser.add_argument("--routes", nargs="+", help="只測符合的 route (可用萬用字元，例如 'waiver.*')")
+    parser.add_argument("--upload-kb", type=int, default=256, help="上傳測試檔大小 (KB)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--regenerate", action="store_true", help="重新產生測試資料")
+    parser.add_argument("--startup-timeout", type=float, default=300, help="等待 server 啟動的秒數")
+    parser.add_argument("--json", dest="json_path", help="輸出 JSON 結果到指定路徑")
+    parser.add_argument("--compare", help="與先前輸出的 JSON 比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="比較時允許的退步比例")
+    parser.add_argument("--list", action="store_true", help="列出所有 route 名稱")
+    args = parser.parse_args()
+
+    if args.list:
+        for r in ROUTES:
+            print(f"{r.name:<24}{r.kind}")
+        return
+    routes = [r for r in ROUTES if not args.routes or any(fnmatch.fnmatch(r.name, p) for p in args.routes)]
+    if not routes:
+        parser.error("沒有符合 --routes 的 route")
+
+    payload = b"%PDF-1.4\n% bench_api upload payload\n" + b"0" * args.upload_kb * 1024
+    existing_uploads = upload_files()
+    report = {
+        "meta": dict(git_info(), created=time.strftime("%Y-%m-%dT%H:%M:%S%z"), python=platform.python_version(),
+                     platform=platform.platform(), cpus=os.cpu_count(), workers=args.workers, threads=args.threads,
+                     seconds=args.seconds, warmup=args.warmup, seed=args.seed, upload_kb=args.upload_kb,
+                     db_pool=os.environ.get("TOOL_DB_POOL", "1") != "0", startup_seconds={}),
+        "results": [],
+    }
+    print(f"{len(routes)} routes, clients {args.clients}, {args.seconds}s per route, "
+          f"{args.workers} workers x {args.threads} threads")
+    print(f"  {'route':<22}{'clients':>5}{'rps':>12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    try:
+        for waivers in args.waivers:
+            results, startup = bench_dataset(args, routes, waivers, payload)
+            report["results"].extend(results)
+            report["meta"]["startup_seconds"][str(waivers)] = startup
+    finally:
+        remove_uploads(upload_files() - existing_uploads)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n已輸出 JSON: {args.json_path}")
+    errors = sum(r["errors"] for r in report["results"])
+    if errors:
+        print(f"錯誤回應: {errors}")
+    if regressions:
+        print(f"退步: {len(regressions)} 項")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
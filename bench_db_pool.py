@@ -0,0 +1,78 @@
+# bench_db_pool.py
+# -*- coding: utf-8 -*-
+"""
+比較 get_db_conn 連線池開啟前後的 requests/sec。
+
+用法:
+    python bench_db_pool.py                 # 預設 8 threads、每個 endpoint 跑 3 秒
+    python bench_db_pool.py --threads 16 --seconds 5
+"""
+import argparse
+import importlib.util
+import os
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ENDPOINTS = ["/api/retry/list", "/api/ctsv_gtsi/cards/list"]
+
+
+def load_app():
+    # 3PL.py 檔名以數字開頭，無法直接 import
+    spec = importlib.util.spec_from_file_location("tool_3pl", os.path.join(BASE_DIR, "3PL.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_load(app, path, threads, seconds):
+    counts = [0] * threads
+    errors = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(idx):
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            resp = client.get(path)
+            if resp.status_code == 200:
+                counts[idx] += 1
+            else:
+                errors[idx] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed, sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DB connection pool benchmark")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    module = load_app()
+    module.create_db_if_not_exists()
+    app = module.app
+
+    print(f"threads={args.threads} seconds={args.seconds}")
+    print(f"{'endpoint':<32}{'no pool (req/s)':>18}{'pool+WAL (req/s)':>20}{'speedup':>10}")
+    for path in ENDPOINTS:
+        app.config['DB_POOL_ENABLED'] = False
+        before, err_before = run_load(app, path, args.threads, args.seconds)
+        app.config['DB_POOL_ENABLED'] = True
+        module.db_pools.warm_up()
+        after, err_after = run_load(app, path, args.threads, args.seconds)
+        speedup = after / before if before else float("inf")
+        print(f"{path:<32}{before:>18.1f}{after:>20.1f}{speedup:>9.2f}x")
+        if err_before or err_after:
+            print(f"  errors: no pool={err_before}, pool={err_after}")
+    module.db_pools.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# bench_workers.py
+# -*- coding: utf-8 -*-
+"""
+多 worker 擴充性測試: 以不同 worker 數啟動 serve.py，對 list 與上傳 endpoint 送 HTTP 負載，
+比較 requests/sec 是否隨 worker 數成長。
+
+用法:
+    python bench_workers.py                          # worker 數 1 2 4，每個 endpoint 3 秒
+    python bench_workers.py --workers 1 2 4 8 --clients 32 --seconds 5
+    python bench_workers.py --no-upload              # 不測上傳
+
+每次啟動 server 前先複製一份目前的資料庫給它使用 (TOOL_DATA_DIR)，結束後刪除；
+上傳測試寫入 static/uploads 的檔案在結束時刪除 (原本就存在的不動)，不會動到正式資料。
+"""
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from migrations import DB_FILES
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_DIR = os.path.join(BASE_DIR, "static", "uploads")
+LIST_ENDPOINTS = ["/api/retry/list", "/api/ctsv_gtsi/cards/list", "/api/waiver/list/CTS"]
+UPLOAD_ENDPOINT = "/api/ctsv_gtsi/upload_file"
+UPLOAD_PAYLOAD = b"%PDF-1.4\n% bench_workers upload payload\n" + b"0" * 256 * 1024
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def copy_data_dir():
+    """以 SQLite backup API 複製目前的資料庫 (server 執行中也能取得一致的內容)，回傳給 TOOL_DATA_DIR 用的目錄。"""
+    run_dir = tempfile.mkdtemp(prefix="bench_workers_")
+    for filename in DB_FILES.values():
+        path = os.path.join(BASE_DIR, filename)
+        if not os.path.exists(path):
+            continue  # server 啟動時自行建立
+        src = sqlite3.connect(path)
+        dst = sqlite3.connect(os.path.join(run_dir, filename))
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+    return run_dir
+
+
+def upload_files():
+    return {os.path.join(root, name) for root, _, files in os.walk(UPLOAD_DIR) for name in files}
+
+
+def remove_uploads(paths):
+    """刪除上傳測試留下的檔案 (原本就存在的不動)，以及因此變空的子目錄。"""
+    for path in paths:
+        os.remove(path)
+        parent = os.path.dirname(path)
+        if parent != UPLOAD_DIR and not os.listdir(parent):
+            os.rmdir(parent)
+
+
+def start_server(workers, threads, port, env=None, timeout=30):
+    """env: 額外的環境變數 (例如 TOOL_DATA_DIR)；timeout: 等待 server 就緒的秒數。"""
+    pidfile = os.path.join(BASE_DIR, f".bench_{port}.pid")
+    proc = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "serve.py"), "--workers", str(workers),
+                             "--threads", str(threads), "--bind", f"127.0.0.1:{port}", "--pidfile", pidfile],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            env=dict(os.environ, **env) if env else None)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/ping")
+            if conn.getresponse().status == 200:
+                # 等所有 worker 都起來
+                time.sleep(0.5 + 0.1 * workers)
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"server 沒有在 {timeout} 秒內啟動")
+
+
+def multipart(payload):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bench.pdf\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n").encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def run_load(port, method, path, clients, seconds, body=None, content_type=None):
+    counts = [0] * clients
+    errors = [0] * clients
+    deadline = time.perf_counter() + seconds
+
+    def worker(idx):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        headers = {"Content-Type": content_type} if content_type else {}
+        while time.perf_counter() < deadline:
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status == 200:
+                    counts[idx] += 1
+                else:
+                    errors[idx] += 1
+            except (OSError, http.client.HTTPException):
+                errors[idx] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed, sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput vs. worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=4, help="每個 worker 的 thread 數")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--no-upload", action="store_true")
+    args = parser.parse_args()
+
+    cases = [("GET", p, None, None) for p in LIST_ENDPOINTS]
+    if not args.no_upload:
+        body, ctype = multipart(UPLOAD_PAYLOAD)
+        cases.append(("POST", UPLOAD_ENDPOINT, body, ctype))
+
+    results = {}
+    existing_uploads = upload_files()
+    try:
+        for workers in args.workers:
+            port = free_port()
+            run_dir = copy_data_dir()
+            proc = start_server(workers, args.threads, port, env={"TOOL_DATA_DIR": run_dir})
+            try:
+                for method, path, body, ctype in cases:
+                    run_load(port, method, path, args.clients, 0.5, body, ctype)  # 暖機
+                    results[(workers, path)] = run_load(port, method, path, args.clients, args.seconds, body, ctype)
+            finally:
+                proc.terminate()
+                proc.wait()
+                shutil.rmtree(run_dir, ignore_errors=True)
+    finally:
+        remove_uploads(upload_files() - existing_uploads)
+
+    print(f"{args.clients} clients, {args.threads} threads/worker, {args.seconds}s per endpoint")
+    header = f"{'endpoint':<32}" + "".join(f"{f'{w} worker':>14}" for w in args.workers) + f"{'scale':>9}"
+    print(header)
+    print("-" * len(header))
+    for _, path, _, _ in cases:
+        rates = [results[(w, path)][0] for w in args.workers]
+        row = f"{path:<32}" + "".join(f"{r:>12.0f}/s" for r in rates)
+        print(row + f"{rates[-1] / rates[0] if rates[0] else 0:>8.2f}x")
+    errors = sum(e for _, e in results.values())
+    if errors:
+        print(f"錯誤回應: {errors}")
+
+
+if __name__ == "__main__":
+    main()
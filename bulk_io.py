@@ -0,0 +1,216 @@
+# bulk_io.py
+# -*- coding: utf-8 -*-
+"""
+Waiver / Retry 技巧批次匯入匯出
+
+- 匯入格式: CSV (UTF-8 / UTF-8 BOM)、XLSX (需要 openpyxl)、JSON 陣列
+- 全部資料列先驗證，再於同一個 transaction 內以 executemany 寫入 (短詞搜尋的 gram 索引一併更新)
+- upsert 模式: 以唯一鍵比對既有資料，內容有變才 UPDATE，不存在才 INSERT
+- 匯出: CSV / JSON / XLSX
+"""
+import csv
+import io
+import json
+
+from search import index_queued
+
+try:
+    import openpyxl
+except ImportError:  # XLSX 為選用功能
+    openpyxl = None
+
+
+class BulkError(Exception):
+    pass
+
+
+# ----------------------------------------
+# 資料表規格
+# ----------------------------------------
+class TableSpec:
+    def __init__(self, table, fields, required, key, aliases, normalize=None):
+        self.table = table
+        self.fields = fields
+        self.required = required
+        self.key = key
+        self.aliases = aliases
+        self.normalize = normalize or {}
+
+
+WAIVER_SPEC = TableSpec(
+    table="waivers",
+    fields=("suite", "waiver_id", "module", "test_case", "note"),
+    required=("suite", "waiver_id", "module", "test_case"),
+    key=("suite", "waiver_id", "module", "test_case"),
+    aliases={"waiverid": "waiver_id", "waiver": "waiver_id", "bug": "waiver_id", "bugid": "waiver_id",
+             "modulename": "module", "testcase": "test_case", "test": "test_case", "testname": "test_case",
+             "notes": "note", "備註": "note", "模組": "module", "測項": "test_case"},
+    normalize={"suite": lambda v: v.upper()},
+)
+
+RETRY_SPEC = TableSpec(
+    table="retry_tips",
+    fields=("type", "module_case", "condition", "trick"),
+    required=("type", "module_case", "condition"),
+    key=("type", "module_case"),
+    aliases={"suite": "type", "module": "module_case", "modulecase": "module_case", "case": "module_case",
+             "模組/測項": "module_case", "條件": "condition", "關鍵條件": "condition", "技巧": "trick",
+             "retry技巧": "trick", "備註": "trick", "note": "trick"},
+)
+
+
+def _header_key(spec, header):
+    h = (header or "").strip().lower().replace(" ", "").replace("-", "")
+    if h in spec.fields:
+        return h
+    h2 = h.replace("_", "")
+    for f in spec.fields:
+        if f.replace("_", "") == h2:
+            return f
+    return spec.aliases.get(h) or spec.aliases.get(h2)
+
+
+# ----------------------------------------
+# 解析
+# ----------------------------------------
+def read_rows(data, filename=None, content_type=None):
+    """
+    將上傳內容轉為 list[dict]。data 為 bytes 或已解析的 JSON (list)。
+    回傳的 dict 以原始表頭為 key，之後由 validate_rows 對應欄位。
+    """
+    if isinstance(data, list):
+        return data
+    name = (filename or "").lower()
+    if name.endswith(".xlsx") or (content_type or "").endswith("spreadsheetml.sheet"):
+        if openpyxl is None:
+            raise BulkError("XLSX 匯入需要 openpyxl (pip install openpyxl)")
+        wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            headers = [str(h) if h is not None else "" for h in next(rows, [])]
+            return [dict(zip(headers, r)) for r in rows if any(v not in (None, "") for v in r)]
+        finally:
+            wb.close()
+    if name.endswith(".json") or (content_type or "").endswith("json"):
+        parsed = json.loads(data.decode("utf-8-sig"))
+        if isinstance(parsed, dict):
+            parsed = parsed.get("rows")
+        if not isinstance(parsed, list):
+            raise BulkError('JSON 必須是陣列或 {"rows": [...]}')
+        return parsed
+    text = data.decode("utf-8-sig")
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def validate_rows(spec, raw_rows):
+    """回傳 (valid, errors)；valid 為 (列號, tuple(欄位值)) list，列號從 1 開始。"""
+    valid, errors = [], []
+    for idx, raw in enumerate(raw_rows, start=1):
+        if isinstance(raw, (list, tuple)):
+            raw = dict(zip(spec.fields, raw))
+        if not isinstance(raw, dict):
+            errors.append({"row": idx, "error": "row must be an object"})
+            continue
+        row = {}
+        for header, value in raw.items():
+            field = _header_key(spec, str(header))
+            if field and field not in row:
+                value = "" if value is None else str(value).strip()
+                row[field] = spec.normalize.get(field, lambda v: v)(value)
+        missing = [f for f in spec.required if not row.get(f)]
+        if missing:
+            errors.append({"row": idx, "error": "missing " + ", ".join(missing)})
+            continue
+        valid.append((idx, tuple(row.get(f) or None for f in spec.fields)))
+    return valid, errors
+
+
+# ----------------------------------------
+# 寫入
+# ----------------------------------------
+def bulk_write(conn, spec, valid_rows, upsert=False):
+    """
+    在同一個 transaction 內寫入。upsert 時以 spec.key 比對既有資料列 (第一筆相符者)，
+    欄位值與資料庫相同的列不 UPDATE (不會 bump data_versions / 寫入 change_log)，計入 unchanged。
+    回傳 {"inserted": n, "updated": n, "unchanged": n, "skipped_duplicates": n}。
+    """
+    fields = spec.fields
+    key_idx = [fields.index(k) for k in spec.key]
+    inserts, updates = [], []
+    skipped = unchanged = 0
+
+    existing = {}
+    if upsert:
+        for r in conn.execute(f"SELECT id, {', '.join(fields)} FROM {spec.table} ORDER BY id"):
+            stored = tuple(_comparable(v) for v in r[1:])
+            existing.setdefault(tuple(stored[i] for i in key_idx), (r[0], stored))
+    seen = set()
+    for _, values in valid_rows:
+        key = tuple(values[i] for i in key_idx)
+        if upsert:
+            if key in seen:
+                skipped += 1
+                continue
+            seen.add(key)
+            hit = existing.get(key)
+            if hit is not None:
+                row_id, stored = hit
+                if tuple(_comparable(v) for v in values) == stored:
+                    unchanged += 1
+                else:
+                    updates.append(values + (row_id,))
+                continue
+        inserts.append(values)
+
+    placeholders = ", ".join("?" for _ in fields)
+    set_clause = ", ".join(f"{f} = ?" for f in fields)
+    with conn:
+        if inserts:
+            conn.executemany(f"INSERT INTO {spec.table} ({', '.join(fields)}) VALUES ({placeholders})", inserts)
+        if updates:
+            conn.executemany(f"UPDATE {spec.table} SET {set_clause} WHERE id = ?", updates)
+        index_queued(conn, spec.table)
+    return {"inserted": len(inserts), "updated": len(updates), "unchanged": unchanged,
+            "skipped_duplicates": skipped}
+
+
+def _comparable(value):
+    """空字串與 NULL 視為相同，其餘一律以字串比較 (匯入值皆為字串)。"""
+    return None if value in (None, "") else str(value)
+
+
+# ----------------------------------------
+# 匯出
+# ----------------------------------------
+def export_rows(conn, spec, where="", params=()):
+    cols = ("id",) + spec.fields
+    sql = f"SELECT {', '.join(cols)} FROM {spec.table} {where} ORDER BY id"
+    return cols, conn.execute(sql, params)
+
+
+def to_csv_chunks(cols, cursor):
+    """逐列產生 CSV 字串 (含 BOM 方便 Excel 開啟中文)。"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")
+    writer.writerow(cols)
+    for r in cursor:
+        writer.writerow(tuple(r))
+        if buf.tell() > 64 * 1024:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def to_xlsx_bytes(cols, cursor):
+    if openpyxl is None:
+        raise BulkError("XLSX 匯出需要 openpyxl (pip install openpyxl)")
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(list(cols))
+    for r in cursor:
+        ws.append(list(r))
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
@@ -0,0 +1,238 @@
+# change_log.py
+# -*- coding: utf-8 -*-
+"""
+資料變更紀錄 (給 /api/<resource>/changes?since= 增量同步使用)
+
+- 每個資料庫一張 change_log 表，由 trigger 在每次 INSERT / UPDATE / DELETE 時寫入
+  (table_name, row_key, op)；seq 為 AUTOINCREMENT，只增不減，壓縮刪掉最大值後也不會重複使用
+- 包含 import 腳本、其他 worker 直接寫 DB 的變更，不需要各 API 自行記錄
+- 子表的變更記到父資料列 (card_images -> test_cards)，前端只需處理「哪些卡片變了」
+- 查詢時每個 row_key 只取最後一次變更，依目前資料庫內容回傳: 還存在 -> upsert，已不存在 -> 刪除 (tombstone)
+- compact():
+    * 同一資料列只保留最新一筆 (不影響任何 since 的查詢結果)
+    * 超過 RETENTION_DAYS 的紀錄刪除，並記錄 floor；since 早於 floor 的 client 需整包重新載入 (reset)
+- cursor 格式為 "<data_versions epoch>-<seq>"，資料庫重建後舊 cursor 自動失效
+- reset 也分頁: 依鍵值 keyset 分頁，cursor 為 "<epoch>-<seq>-<最後一個鍵 (JSON)>"，seq 固定為 reset 開始時的值；
+  最後一頁回傳 "<epoch>-<seq>"，下一次查詢從該 seq 補上分頁期間的變更
+"""
+import json
+import time
+
+from data_version import EPOCH_KEY
+
+RETENTION_DAYS = 30
+COMPACT_INTERVAL = 3600  # 秒；每個 process 最多這麼久壓縮一次
+
+# 各資料庫要記錄的表: {table: (記錄到哪個 resource 表, 該 resource 的鍵欄位)}
+LOGGED_TABLES = {
+    "waiver": {"waivers": ("waivers", "id")},
+    "retry": {"retry_tips": ("retry_tips", "id"), "suites": ("suites", "suite_key")},
+    "ctsv_gtsi": {"test_cards": ("test_cards", "id"), "card_images": ("test_cards", "card_id")},
+}
+
+# 各資料庫的 resource -> 鍵欄位 (子表記錄在父資料列，不是 resource)
+_KEY_FIELDS = {db_name: {table: key for table, (resource, key) in tables.items() if resource == table}
+               for db_name, tables in LOGGED_TABLES.items()}
+
+_last_compact = {}
+
+
+def ensure_change_log(conn, db_name):
+    """建立 change_log 表與 trigger。由 migrations.py 在 transaction 內呼叫。"""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_key NOT NULL,
+            op TEXT NOT NULL,
+            changed_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+        )
+        """
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS change_log_state (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    conn.execute("INSERT OR IGNORE INTO change_log_state (name, value) VALUES ('floor', 0)")
+    for table, (resource, key) in LOGGED_TABLES[db_name].items():
+        log = "INSERT INTO change_log (table_name, row_key, op) "
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_log_ai AFTER INSERT ON {table} BEGIN
+                {log} VALUES ('{resource}', NEW.{key}, '{'I' if resource == table else 'U'}');
+            END
+        """)
+        # 鍵值被修改 (例如 suite_key、卡片圖片換到別張卡片) 時，舊鍵也要記錄
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_log_au AFTER UPDATE ON {table} BEGIN
+                {log} SELECT '{resource}', OLD.{key}, '{'D' if resource == table else 'U'}'
+                    WHERE OLD.{key} IS NOT NEW.{key};
+                {log} VALUES ('{resource}', NEW.{key}, 'U');
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_log_ad AFTER DELETE ON {table} BEGIN
+                {log} VALUES ('{resource}', OLD.{key}, '{'D' if resource == table else 'U'}');
+            END
+        """)
+
+
+# ----------------------------------------
+# cursor
+# ----------------------------------------
+def _epoch(conn):
+    row = conn.execute("SELECT version FROM data_versions WHERE table_name = ?", (EPOCH_KEY,)).fetchone()
+    return row[0] if row else 0
+
+
+def make_cursor(epoch, seq):
+    return f"{epoch}-{seq}"
+
+
+def parse_cursor(text, epoch):
+    """回傳 seq；格式錯誤或 epoch 不同 (資料庫重建) 時回傳 None。"""
+    head, _, tail = (text or "").partition("-")
+    if head != str(epoch) or not tail.isdigit():
+        return None
+    return int(tail)
+
+
+def make_reset_cursor(epoch, seq, after):
+    return f"{epoch}-{seq}-{json.dumps(after, ensure_ascii=False, separators=(',', ':'))}"
+
+
+def parse_reset_cursor(text, epoch):
+    """reset 分頁中的 cursor -> (seq, 最後一個鍵)；不是 reset 分頁的 cursor 或格式錯誤時回傳 None。"""
+    parts = (text or "").split("-", 2)
+    if len(parts) != 3 or parts[0] != str(epoch) or not parts[1].isdigit():
+        return None
+    try:
+        after = json.loads(parts[2])
+    except ValueError:
+        return None
+    if not isinstance(after, (int, str)) or isinstance(after, bool):
+        return None
+    return int(parts[1]), after
+
+
+def current_seq(conn):
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+
+def _floor(conn):
+    row = conn.execute("SELECT value FROM change_log_state WHERE name = 'floor'").fetchone()
+    return row[0] if row else 0
+
+
+# ----------------------------------------
+# 查詢
+# ----------------------------------------
+def read_changes(conn, resource, key_field, since_cursor, fetch_rows, fetch_page, limit):
+    """
+    fetch_rows(conn, keys) -> 目前仍存在的資料列 list (dict，需含 key_field)；
+    fetch_page(conn, after, limit) -> 依 key_field 排序、鍵值大於 after 的資料列 (after 為 None 時從頭)，reset 時分頁使用。
+    回傳 {"cursor", "reset", "upserts", "deletes", "has_more"}；reset 只出現在第一頁，之後的頁面照常合併。
+    所有查詢在同一個讀取 transaction 內完成，cursor 與回傳的資料列內容一致。
+    """
+    in_tx = conn.in_transaction
+    if not in_tx:
+        conn.execute("BEGIN")
+    try:
+        epoch = _epoch(conn)
+        latest = current_seq(conn)
+        paging = parse_reset_cursor(since_cursor, epoch)
+        if paging is not None and _floor(conn) <= paging[0] <= latest:
+            # reset 分頁的後續頁面: seq 固定在 reset 開始時，分頁期間的變更由最後一頁之後的查詢補上
+            return _reset_page(conn, epoch, paging[0], paging[1], key_field, fetch_page, limit, reset=False)
+        since = parse_cursor(since_cursor, epoch)
+        if since is None or since < _floor(conn) or since > latest:
+            return _reset_page(conn, epoch, latest, None, key_field, fetch_page, limit, reset=True)
+
+        rows = conn.execute(
+            "SELECT row_key, MAX(seq) AS last_seq FROM change_log WHERE seq > ? AND table_name = ? "
+            "GROUP BY row_key ORDER BY last_seq LIMIT ?", (since, resource, limit + 1)).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        keys = [r[0] for r in rows]
+        upserts = fetch_rows(conn, keys) if keys else []
+        present = {row[key_field] for row in upserts}
+        deletes = [k for k in keys if k not in present]
+        # 還有下一頁時 cursor 停在這一頁最後一筆；否則直接跳到目前最新 (其他表的變更也一併略過)
+        next_seq = rows[-1][1] if has_more else latest
+        return {"cursor": make_cursor(epoch, next_seq), "reset": False, "upserts": upserts,
+                "deletes": deletes, "has_more": has_more}
+    finally:
+        if not in_tx:
+            conn.rollback()
+
+
+def _reset_page(conn, epoch, seq, after, key_field, fetch_page, limit, reset):
+    rows = fetch_page(conn, after, limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = make_reset_cursor(epoch, seq, rows[-1][key_field]) if has_more else make_cursor(epoch, seq)
+    return {"cursor": cursor, "reset": reset, "upserts": rows, "deletes": [], "has_more": has_more}
+
+
+def read_log(conn, db_name, since_cursor, fetchers, limit):
+    """
+    SSE 推送其他 process 的寫入用: since 之後有變動的資料列，依最後變更的順序。
+    fetchers 為 {resource: fetch_rows}；回傳 (cursor, changes)，changes 為 [(resource, key, row)]，
+    row 為 None 表示已刪除。since 為 None (第一次)、已失效或一次超過 limit 筆時 changes 為 None，
+    呼叫端改送 resync (since 為 None 時只需要記下 cursor)。
+    """
+    in_tx = conn.in_transaction
+    if not in_tx:
+        conn.execute("BEGIN")
+    try:
+        epoch = _epoch(conn)
+        latest = current_seq(conn)
+        since = parse_cursor(since_cursor, epoch)
+        cursor = make_cursor(epoch, latest)
+        if since is None or since < _floor(conn) or since > latest:
+            return cursor, None
+        if since == latest:
+            return cursor, []
+        rows = conn.execute(
+            "SELECT table_name, row_key, MAX(seq) AS last_seq FROM change_log WHERE seq > ? "
+            "GROUP BY table_name, row_key ORDER BY last_seq LIMIT ?", (since, limit + 1)).fetchall()
+        if len(rows) > limit:
+            return cursor, None
+        keys = {}
+        for resource, key, _ in rows:
+            keys.setdefault(resource, []).append(key)
+        current = {}
+        for resource, resource_keys in keys.items():
+            key_field = _KEY_FIELDS[db_name][resource]
+            for row in fetchers[resource](conn, resource_keys):
+                current[(resource, row[key_field])] = row
+        return cursor, [(resource, key, current.get((resource, key))) for resource, key, _ in rows]
+    finally:
+        if not in_tx:
+            conn.rollback()
+
+
+# ----------------------------------------
+# 壓縮
+# ----------------------------------------
+def compact(conn, retention_days=RETENTION_DAYS):
+    """回傳刪除的筆數。"""
+    cutoff = int(time.time()) - retention_days * 86400
+    with conn:
+        expired = conn.execute("SELECT MAX(seq) FROM change_log WHERE changed_at < ?", (cutoff,)).fetchone()[0]
+        removed = 0
+        if expired is not None:
+            removed += conn.execute("DELETE FROM change_log WHERE seq <= ?", (expired,)).rowcount
+            conn.execute("UPDATE change_log_state SET value = MAX(value, ?) WHERE name = 'floor'", (expired,))
+        # 同一資料列只保留最後一筆
+        removed += conn.execute(
+            "DELETE FROM change_log WHERE seq NOT IN "
+            "(SELECT MAX(seq) FROM change_log GROUP BY table_name, row_key)").rowcount
+    return removed
+
+
+def maybe_compact(conn, db_name, interval=COMPACT_INTERVAL):
+    """每個 process 每個資料庫每 interval 秒最多壓縮一次 (在讀取 API 中順便呼叫)。"""
+    now = time.monotonic()
+    if now - _last_compact.get(db_name, float("-inf")) < interval:
+        return 0
+    _last_compact[db_name] = now
+    return compact(conn)
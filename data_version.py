@@ -0,0 +1,57 @@
+# data_version.py
+# -*- coding: utf-8 -*-
+"""
+每張表的資料版本號 (給 ETag / 304 使用)
+
+- 每個資料庫建立 data_versions 表，並對需要追蹤的表加上 INSERT / UPDATE / DELETE trigger，
+  任何寫入 (包含 import 腳本直接寫 DB) 都會讓版本號 +1
+- '__epoch__' 在 data_versions 建立時隨機產生，資料庫重建後舊的 ETag 不會誤判為相同
+"""
+import hashlib
+import random
+
+# 各資料庫需要追蹤版本的表
+VERSIONED_TABLES = {
+    "waiver": ("waivers",),
+    "retry": ("retry_tips", "suites"),
+    "ctsv_gtsi": ("ctsv_sections", "test_cards", "card_images"),
+}
+
+EPOCH_KEY = "__epoch__"
+
+
+def ensure_data_versions(conn, db_name):
+    """建立 data_versions 表與 trigger。由 migrations.py 在 transaction 內呼叫。"""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    conn.execute("INSERT OR IGNORE INTO data_versions (table_name, version) VALUES (?, ?)",
+                 (EPOCH_KEY, random.randint(1, 2 ** 31)))
+    for table in VERSIONED_TABLES[db_name]:
+        conn.execute("INSERT OR IGNORE INTO data_versions (table_name, version) VALUES (?, 0)", (table,))
+        for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_ver_{suffix} AFTER {event} ON {table} BEGIN
+                    UPDATE data_versions SET version = version + 1 WHERE table_name = '{table}';
+                END
+            """)
+
+
+def get_versions(conn, tables):
+    """回傳 {table: version}，包含 '__epoch__'。"""
+    names = (EPOCH_KEY,) + tuple(tables)
+    placeholders = ",".join("?" for _ in names)
+    rows = conn.execute(f"SELECT table_name, version FROM data_versions WHERE table_name IN ({placeholders})",
+                        names).fetchall()
+    return {r[0]: r[1] for r in rows}
+
+
+def make_etag(key, versions):
+    """由 endpoint key (含查詢參數) 與版本號組出 strong ETag 值 (不含引號)。"""
+    raw = repr((key, sorted(versions.items())))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
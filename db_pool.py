@@ -0,0 +1,152 @@
+# db_pool.py
+# -*- coding: utf-8 -*-
+"""
+SQLite 連線池 (waiver.db / retry.db / ctsv_gtsi.db 共用)
+
+- 每個資料庫維護一組長駐連線，避免每個 request 都重新 sqlite3.connect
+- 連線建立時統一設定 WAL 與 pragma (synchronous / cache_size / mmap_size / busy_timeout)
+- conn.close() 不會真的關閉，而是歸還到池中；原本 routes 的寫法 (用完 close) 不需修改
+- cursor_factory: 指定後 conn.cursor() / conn.execute() 都改用該 factory 建立 cursor (例如 metrics.py 的計時 cursor)
+"""
+import sqlite3
+import threading
+
+# ----------------------------------------
+# Pragma 設定
+# ----------------------------------------
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",       # 讀取不會擋住寫入
+    "synchronous": "NORMAL",     # WAL 模式下 NORMAL 已足夠安全
+    "cache_size": -16000,        # 負值代表 KiB，約 16MB page cache
+    "mmap_size": 134217728,      # 128MB memory-mapped I/O
+    "busy_timeout": 5000,        # 寫入鎖衝突時最多等 5 秒
+    "temp_store": "MEMORY",
+}
+
+
+def apply_pragmas(conn, pragmas=None):
+    for key, value in (pragmas or DEFAULT_PRAGMAS).items():
+        conn.execute(f"PRAGMA {key} = {value}")
+
+
+class PooledConnection(sqlite3.Connection):
+    """close() 時歸還到所屬的 ConnectionPool，而不是真的關閉。"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = None
+        self._in_use = False
+        self.checkout_id = 0
+        self.cursor_factory = None
+
+    def cursor(self, factory=None):
+        factory = factory or self.cursor_factory
+        return super().cursor(factory) if factory else super().cursor()
+
+    # sqlite3 內建的 conn.execute() 不會呼叫 self.cursor()，改寫成經過 cursor_factory
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.release(self)
+        else:
+            super().close()
+
+    def real_close(self):
+        self._pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """單一資料庫檔案的連線池 (thread-safe)。"""
+
+    def __init__(self, db_path, max_idle=8, pragmas=None, cursor_factory=None):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.pragmas = pragmas or DEFAULT_PRAGMAS
+        self.cursor_factory = cursor_factory
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        # 連線會在不同 thread 之間借用，但同一時間只會被一個 thread 使用
+        conn = sqlite3.connect(self.db_path, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        apply_pragmas(conn, self.pragmas)
+        conn.cursor_factory = self.cursor_factory
+        conn._pool = self
+        return conn
+
+    def acquire(self):
+        conn = None
+        with self._lock:
+            if self._idle:
+                conn = self._idle.pop()
+        if conn is None:
+            conn = self._connect()
+        conn._in_use = True
+        conn.checkout_id += 1
+        return conn
+
+    def release(self, conn):
+        if not conn._in_use:
+            return
+        conn._in_use = False
+        # 未 commit 的交易一律 rollback，避免下一個使用者接手半套交易
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.real_close()
+
+    def release_checkout(self, conn, checkout_id):
+        """只在連線仍屬於該次借用時才歸還 (避免歸還已被其他 thread 借走的連線)。"""
+        if conn._in_use and conn.checkout_id == checkout_id:
+            self.release(conn)
+
+    def clear_idle(self):
+        """關閉閒置連線但保留連線池 (例如 fork worker 前，SQLite 連線不能跨 process 使用)。"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.real_close()
+
+    def close_all(self):
+        with self._lock:
+            self._closed = True
+        self.clear_idle()
+
+
+class PoolRegistry:
+    """依 db_name 管理多個 ConnectionPool。"""
+
+    def __init__(self, paths, max_idle=8, pragmas=None, cursor_factories=None):
+        """cursor_factories: {db_name: factory}，未指定的資料庫用一般 cursor。"""
+        self.paths = dict(paths)
+        factories = cursor_factories or {}
+        self.pools = {name: ConnectionPool(path, max_idle=max_idle, pragmas=pragmas,
+                                           cursor_factory=factories.get(name))
+                      for name, path in self.paths.items()}
+
+    def acquire(self, db_name):
+        return self.pools[db_name].acquire()
+
+    def warm_up(self):
+        """啟動時先建立每個資料庫的連線 (同時確保 WAL 已開啟)。"""
+        for pool in self.pools.values():
+            pool.acquire().close()
+
+    def clear_idle(self):
+        for pool in self.pools.values():
+            pool.clear_idle()
+
+    def close_all(self):
+        for pool in self.pools.values():
+            pool.close_all()
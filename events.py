@@ -0,0 +1,227 @@
+# events.py
+# -*- coding: utf-8 -*-
+"""
+資料變更事件 (Server-Sent Events 用)
+
+- 寫入 API 完成後 publish({db, table, op, row / id})，所有連到 /api/events 的頁面即時收到，
+  直接修改前端手上的資料，不必重新抓整份 list
+- 每個訂閱者一個有上限的佇列；消化不及 (佇列滿) 時丟棄並改送一次 resync，前端重新載入即可
+- 保留最近 HISTORY_SIZE 筆事件，瀏覽器斷線重連 (Last-Event-ID) 時補送漏掉的事件；
+  已超出保留範圍或 server 重啟過 (epoch 不同) 則送 resync
+- 訂閱者上限依 worker thread 數決定 (max_subscribers_for)，SSE 連線最多佔一半 thread，
+  其餘留給一般 API；超過上限時 subscribe 丟出 BrokerFull
+- broker 只在單一 process 內；其他 worker / import 腳本的寫入由 poll_external 讀 change_log
+  (見 change_log.read_log) 取得，逐列送出 update / delete；本 process 已送過相同內容的略過。
+  只有紀錄無法接續 (已壓縮、資料庫重建、一次變更太多) 時才對該表送 resync
+"""
+import collections
+import json
+import threading
+import time
+import uuid
+
+HISTORY_SIZE = 1000
+QUEUE_SIZE = 256
+MAX_SUBSCRIBERS = 64         # 開發用 app.run (每個請求一個 thread) 的上限
+POLL_INTERVAL = 0.5          # 讀 change_log 只是一次索引查詢，間隔短一點讓其他 worker 的寫入盡快送達
+RESYNC = object()            # poll_external 的 changes 中表示該表需要 resync
+
+
+class BrokerFull(Exception):
+    pass
+
+
+def max_subscribers_for(threads):
+    """gthread worker 每條 SSE 連線佔住一個 thread，最多用掉一半。"""
+    return max(1, threads // 2)
+
+
+class Subscription:
+
+    def __init__(self, broker, tables):
+        self.broker = broker
+        self.tables = set(tables) if tables else None
+        self.queue = collections.deque()
+        self.cond = threading.Condition()
+        self.overflowed = False
+
+    def wants(self, event):
+        return self.tables is None or event["table"] in self.tables or event["table"] == "*"
+
+    def push(self, event):
+        with self.cond:
+            if self.overflowed:
+                return
+            if len(self.queue) >= self.broker.queue_size:
+                self.queue.clear()
+                self.overflowed = True
+            else:
+                self.queue.append(event)
+            self.cond.notify()
+
+    def get(self, timeout):
+        """回傳下一筆事件；timeout 內沒有事件回傳 None。"""
+        with self.cond:
+            if not self.queue and not self.overflowed:
+                self.cond.wait(timeout)
+            if self.overflowed:
+                self.overflowed = False
+                return self.broker.resync_event("*", reason="overflow")
+            return self.queue.popleft() if self.queue else None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventBroker:
+
+    def __init__(self, history_size=HISTORY_SIZE, queue_size=QUEUE_SIZE, max_subscribers=MAX_SUBSCRIBERS,
+                 key_fields=None):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._seq = 0
+        self._history = collections.deque(maxlen=history_size)
+        self._subs = set()
+        self._lock = threading.Lock()
+        # 各表 row / items 的鍵欄位 (預設 id)
+        self.key_fields = dict(key_fields or {})
+        # 跨 process 寫入偵測
+        self._positions = None
+        self._local_rows = {}
+        self._local_bulk = set()
+        self._last_poll = 0.0
+        self._poll_lock = threading.Lock()
+
+    # ----------------------------------------
+    # 發佈
+    # ----------------------------------------
+    def _next_id(self):
+        self._seq += 1
+        return f"{self.epoch}-{self._seq}"
+
+    def publish(self, db, table, op, **payload):
+        """op: insert / update / delete / reorder / bulk / resync；payload 為 row、id、items 等。"""
+        with self._lock:
+            event = dict(payload, id=self._next_id(), db=db, table=table, op=op, ts=time.time())
+            self._history.append(event)
+            self._remember_local(db, table, op, payload)
+            subs = list(self._subs)
+        for sub in subs:
+            if sub.wants(event):
+                sub.push(event)
+        return event
+
+    def _remember_local(self, db, table, op, payload):
+        """記下本 process 已送出的內容，poll_external 讀到同一筆變更時不再重送。"""
+        key_field = self.key_fields.get(table, "id")
+        if op in ("insert", "update") and payload.get("row"):
+            row = payload["row"]
+            self._local_rows[(db, table, row[key_field])] = dict(row)
+        elif op == "delete":
+            self._local_rows[(db, table, payload.get("row_id"))] = None
+        elif op == "reorder":
+            for item in payload.get("items") or ():
+                known = self._local_rows.get((db, table, item[key_field])) or {}
+                self._local_rows[(db, table, item[key_field])] = dict(known, **item)
+        elif op == "bulk":
+            self._local_bulk.add((db, table))
+
+    def resync_event(self, table, db=None, reason=None):
+        with self._lock:
+            return {"id": self._next_id(), "db": db, "table": table, "op": "resync", "reason": reason,
+                    "ts": time.time()}
+
+    # ----------------------------------------
+    # 訂閱
+    # ----------------------------------------
+    def subscribe(self, last_event_id=None, tables=None):
+        sub = Subscription(self, tables)
+        with self._lock:
+            if len(self._subs) >= self.max_subscribers:
+                raise BrokerFull()
+            self._subs.add(sub)
+            missed = self._missed_since(last_event_id) if last_event_id else []
+        if missed is None:
+            sub.push(self.resync_event("*", reason="history"))
+        else:
+            for event in missed:
+                if sub.wants(event):
+                    sub.push(event)
+        return sub
+
+    def _missed_since(self, last_event_id):
+        """回傳 last_event_id 之後的事件；無法判斷時回傳 None (需 resync)。"""
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq >= self._seq:
+            return []
+        oldest = int(self._history[0]["id"].partition("-")[2]) if self._history else self._seq + 1
+        if seq + 1 < oldest:
+            return None
+        return [e for e in self._history if int(e["id"].partition("-")[2]) > seq]
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subs)
+
+    # ----------------------------------------
+    # 其他 process 的寫入
+    # ----------------------------------------
+    def poll_external(self, read_external, interval=POLL_INTERVAL):
+        """
+        read_external(positions) -> (positions, changes)。每個 process 每 interval 秒最多讀一次。
+        positions 由 broker 保存並原樣傳回 (第一次為 None，只記下起點)；changes 為 [(db, table, key, row)]，
+        row 為目前內容 (dict)、None (已刪除) 或 RESYNC (無法接續，key 為 None)。
+        """
+        now = time.monotonic()
+        if now - self._last_poll < interval or not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_poll = now
+            # 先取出本地寫入再讀 change_log: 讀取期間才 publish 的寫入留給下一輪比對，最多重送一次相同內容
+            with self._lock:
+                local, self._local_rows = self._local_rows, {}
+                bulk, self._local_bulk = self._local_bulk, set()
+            first = self._positions is None
+            self._positions, changes = read_external(self._positions)
+            if first:
+                return
+            for db, table, key, row in changes:
+                if row is RESYNC:
+                    self.publish(db, table, "resync", reason="external")
+                elif (db, table) in bulk or _already_sent(local, (db, table, key), row):
+                    # 本 process 的 bulk 事件已讓前端重新載入該表
+                    continue
+                elif row is None:
+                    self.publish(db, table, "delete", row_id=key)
+                else:
+                    self.publish(db, table, "update", row=row)
+        finally:
+            self._poll_lock.release()
+
+
+def _already_sent(local, key, row):
+    if key not in local:
+        return False
+    sent = local[key]
+    if sent is None or row is None:
+        return sent is None and row is None
+    return all(row.get(field) == value for field, value in sent.items())
+
+
+def format_sse(event):
+    data = json.dumps(event, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {event['id']}\nevent: change\ndata: {data}\n\n"
@@ -0,0 +1,729 @@
+# flaky_store.py
+# -*- coding: utf-8 -*-
+"""
+Flaky 測項分析 (歷史 test_result.xml 的欄式儲存)
+
+- 字串全部字典編碼 (suite / build fingerprint / module / test / abi 各一份字典)，
+  測項紀錄以定長整數欄位存成 array 檔 (run, module, test, abi, result 每筆 13 bytes)，
+  模組紀錄另存 (run, module, abi, total, failed, done)
+- 只保存 fail，以及「同一 build fingerprint 曾經 fail 過」的測項之後的 pass (retry 通過)；
+  其他 pass 只計入模組紀錄，多年的資料量仍以 MB 計
+- 請依執行順序匯入 (base run 之後才是 retry)，retry 通過的 pass 才會被保存
+- 指標 (以 build fingerprint 為單位):
+    flake_rate      : 該 build 中同一測項同時有 fail 與 pass 的比例 (模組: 出現 flaky 測項的 build 比例)
+    pass_on_retry   : fail 之後在同一 build 的後續執行中通過的比例
+    trend           : 各 build fingerprint 的 fail / flaky / retry 通過測項數
+- 有 numpy 時以排序 / bincount 向量化彙總；沒有時退回純 Python (結果相同，只是較慢)
+- 寫入: 先 append 欄位檔再以 os.replace 更新 meta.json (內含各欄筆數)，讀取端只讀到 meta 記錄的筆數，
+  寫到一半中斷也不會讀到不完整的資料
+
+用法:
+    python flaky_store.py ingest results/*.zip
+    python flaky_store.py report --suite CTS --days 180
+    python flaky_store.py report --module CtsWifiTestCases
+"""
+import argparse
+import array
+import json
+import os
+import sys
+import threading
+import time
+
+from xts_result import XtsResultReader, open_result
+
+try:
+    import numpy as np
+except ImportError:  # numpy 為選用套件
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只保護同一 process 內的寫入
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DIR = os.path.join(BASE_DIR, "analytics")
+
+RESULT_CODES = {"pass": 0, "fail": 1}
+OTHER_RESULT = 2
+
+# 欄位: (名稱, array typecode)
+TEST_COLUMNS = (("run", "I"), ("module", "I"), ("test", "I"), ("abi", "B"), ("result", "B"))
+MODULE_COLUMNS = (("run", "I"), ("module", "I"), ("abi", "B"), ("total", "I"), ("failed", "I"), ("done", "B"))
+DICTIONARIES = ("suite", "fingerprint", "module", "test", "abi")
+TABLES = {"tests": TEST_COLUMNS, "modules": MODULE_COLUMNS}
+
+REPORT_CACHE_SIZE = 32
+
+
+def _empty_meta():
+    return {
+        "version": 0,
+        "rows": {table: 0 for table in TABLES},
+        "dicts": {name: [] for name in DICTIONARIES},
+        "runs": {"key": [], "suite": [], "fingerprint": [], "start": [], "source": []},
+    }
+
+
+class Snapshot:
+    """某一版資料的唯讀內容: meta 與各欄位 (numpy array 或 array.array)。"""
+
+    def __init__(self, meta, columns):
+        self.meta = meta
+        self.columns = columns
+        self.version = meta["version"]
+        self.dicts = meta["dicts"]
+        runs = meta["runs"]
+        self.run_suite = runs["suite"]
+        self.run_fingerprint = runs["fingerprint"]
+        self.run_start = runs["start"]
+        # build fingerprint 依第一次出現的時間排序 (trend 使用)
+        first = {}
+        for fp, start in zip(self.run_fingerprint, self.run_start):
+            first[fp] = min(first.get(fp, start), start)
+        self.fingerprint_first_seen = first
+        self.fingerprint_order = sorted(range(len(self.dicts["fingerprint"])), key=lambda f: first.get(f, 0))
+        # 模組名稱的字母順序 (排序同分時使用)
+        names = self.dicts["module"]
+        rank = [0] * len(names)
+        for r, i in enumerate(sorted(range(len(names)), key=names.__getitem__)):
+            rank[i] = r
+        self.module_name_rank = np.asarray(rank, dtype=np.int64) if np is not None else rank
+        self.sorted_tests = self._sort_tests() if np is not None else None
+
+    def _sort_tests(self):
+        """
+        測項紀錄依 (module, test, fingerprint) 排序一次 (每個版本只做一次)，
+        查詢時同一組的紀錄相鄰，以 reduceat 彙總即可，不必每次重新排序。
+        回傳 (key, run, result)，key = (module * n_tests + test) * n_fingerprints + fingerprint。
+        """
+        cols = self.columns["tests"]
+        n_tests, n_fps = len(self.dicts["test"]) or 1, len(self.dicts["fingerprint"]) or 1
+        run = cols["run"]
+        fp = np.asarray(self.run_fingerprint, dtype=np.int64)[run]
+        keys = (cols["module"].astype(np.int64) * n_tests + cols["test"]) * n_fps + fp
+        order = np.argsort(keys, kind="stable")
+        return keys[order], run[order], cols["result"][order]
+
+
+class FlakyStore:
+
+    def __init__(self, path=DEFAULT_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._snapshot_mtime = None
+        self._reports = {}
+
+    # ----------------------------------------
+    # 檔案
+    # ----------------------------------------
+    def _meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    def _column_path(self, table, column):
+        return os.path.join(self.path, f"{table}.{column}.bin")
+
+    def _read_meta(self):
+        try:
+            with open(self._meta_path(), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return _empty_meta()
+
+    def _write_meta(self, meta):
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self._meta_path())
+
+    def _read_column(self, table, column, typecode, rows):
+        path = self._column_path(table, column)
+        if np is not None:
+            if not rows:
+                return np.zeros(0, dtype=np.dtype(typecode))
+            return np.fromfile(path, dtype=np.dtype(typecode), count=rows)
+        values = array.array(typecode)
+        if rows:
+            with open(path, "rb") as f:
+                values.fromfile(f, rows)
+        return values
+
+    def snapshot(self):
+        """回傳目前資料的 Snapshot；meta.json 沒變時沿用已載入的欄位。"""
+        try:
+            mtime = os.stat(self._meta_path()).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if self._snapshot is None or mtime != self._snapshot_mtime:
+                meta = self._read_meta()
+                columns = {table: {name: self._read_column(table, name, code, meta["rows"][table])
+                                   for name, code in spec} for table, spec in TABLES.items()}
+                self._snapshot = Snapshot(meta, columns)
+                self._snapshot_mtime = mtime
+                self._reports = {}
+            return self._snapshot
+
+    # ----------------------------------------
+    # 匯入
+    # ----------------------------------------
+    def _acquire_file_lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        handle = open(os.path.join(self.path, ".lock"), "w")
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def ingest(self, files):
+        """
+        files: [(name, fileobj)]，依執行順序 (base run 在 retry 之前) 傳入。全部成功才寫入。
+        回傳 [{"source", "suite", "fingerprint", "tests", "stored", "duplicate"}]。
+        """
+        with self._lock:
+            handle = self._acquire_file_lock()
+            try:
+                meta = self._read_meta()
+                known = set(meta["runs"]["key"])
+                interesting = _FailedKeys(self, meta)
+                encoders = {d: _Encoder(meta["dicts"][d]) for d in DICTIONARIES}
+                appended = {table: {name: array.array(code) for name, code in spec} for table, spec in TABLES.items()}
+                results = [self._ingest_one(meta, known, interesting, encoders, appended, name, fileobj)
+                           for name, fileobj in files]
+                if any(not r["duplicate"] for r in results):
+                    self._append_columns(meta, appended)
+                    meta["version"] += 1
+                    self._write_meta(meta)
+                return results
+            finally:
+                handle.close()
+
+    def _read_range(self, table, column, typecode, start, stop):
+        """讀取欄位檔 [start, stop) 的紀錄 (list)。"""
+        values = array.array(typecode)
+        if stop > start:
+            with open(self._column_path(table, column), "rb") as f:
+                f.seek(start * values.itemsize)
+                values.fromfile(f, stop - start)
+        return values.tolist()
+
+    def _run_rows(self, rows, run):
+        """
+        tests 表中屬於 run 的紀錄範圍 [start, stop)。紀錄依匯入順序 append，run 欄位遞增，
+        以二分搜尋直接在檔案上找邊界，不必讀整個欄位。
+        """
+        path = self._column_path("tests", "run")
+        size = array.array("I").itemsize
+        with open(path, "rb") as f:
+            def first_at_least(target):
+                lo, hi = 0, rows
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    f.seek(mid * size)
+                    value = array.array("I", f.read(size))[0]
+                    if value < target:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                return lo
+            return first_at_least(run), first_at_least(run + 1)
+
+    def _ingest_one(self, meta, known, interesting, encoders, appended, name, fileobj):
+        reader = XtsResultReader(fileobj)
+        tests = appended["tests"]
+        run_id = len(meta["runs"]["key"])
+        fp_id = None
+        module_fails = {}
+        stored = total = 0
+        for rec in reader.iter_tests():
+            if fp_id is None:
+                if reader.run_key in known:
+                    return {"source": name, "suite": reader.suite_name, "duplicate": True,
+                            "fingerprint": reader.build_attrs.get("build_fingerprint"), "tests": 0, "stored": 0}
+                fp_id = encoders["fingerprint"].encode(reader.build_attrs.get("build_fingerprint") or "")
+                failed = interesting.for_fingerprint(fp_id)
+            total += 1
+            code = RESULT_CODES.get((rec.result or "").lower(), OTHER_RESULT)
+            module_id = encoders["module"].encode(rec.module or "")
+            abi_id = encoders["abi"].encode(rec.abi or "")
+            if code == 1:
+                module_fails[(module_id, abi_id)] = module_fails.get((module_id, abi_id), 0) + 1
+            elif code != 0:
+                continue
+            test_name = f"{rec.test_class}#{rec.test_name}"
+            if code == 0:
+                # pass 只在同一 build 曾 fail 過時保存；不查新字串，避免字典塞滿所有測項名稱
+                test_id = encoders["test"].index.get(test_name)
+                if test_id is None or (module_id, test_id) not in failed:
+                    continue
+            else:
+                test_id = encoders["test"].encode(test_name)
+                failed.add((module_id, test_id))
+            for column, value in (("run", run_id), ("module", module_id), ("test", test_id),
+                                  ("abi", abi_id), ("result", code)):
+                tests[column].append(value)
+            stored += 1
+
+        if reader.run_key in known:
+            return {"source": name, "suite": reader.suite_name, "duplicate": True,
+                    "fingerprint": reader.build_attrs.get("build_fingerprint"), "tests": 0, "stored": 0}
+        if not reader.suite_name or not reader.modules:
+            raise ValueError(f"{name}: 不是 tradefed test_result.xml (缺少 suite_name 或 Module)")
+        if fp_id is None:
+            fp_id = encoders["fingerprint"].encode(reader.build_attrs.get("build_fingerprint") or "")
+        modules = appended["modules"]
+        for (module, abi), info in reader.modules.items():
+            module_id = encoders["module"].encode(module or "")
+            abi_id = encoders["abi"].encode(abi or "")
+            for column, value in (("run", run_id), ("module", module_id), ("abi", abi_id), ("total", info["total"]),
+                                  ("failed", module_fails.get((module_id, abi_id), 0)), ("done", int(info["done"]))):
+                modules[column].append(value)
+
+        runs = meta["runs"]
+        runs["key"].append(reader.run_key)
+        runs["suite"].append(encoders["suite"].encode(reader.suite_name))
+        runs["fingerprint"].append(fp_id)
+        runs["start"].append(int(reader.result_attrs.get("start") or 0))
+        runs["source"].append(name)
+        known.add(reader.run_key)
+        return {"source": name, "suite": reader.suite_name, "duplicate": False,
+                "fingerprint": reader.build_attrs.get("build_fingerprint"), "tests": total, "stored": stored}
+
+    def _append_columns(self, meta, appended):
+        for table, spec in TABLES.items():
+            rows = meta["rows"][table]
+            added = len(appended[table][spec[0][0]])
+            for name, code in spec:
+                path = self._column_path(table, name)
+                with open(path, "ab") as f:
+                    # 先截掉上次中斷時寫了一半、meta 沒有記錄的部分
+                    f.truncate(rows * array.array(code).itemsize)
+                    appended[table][name].tofile(f)
+            meta["rows"][table] = rows + added
+
+    # ----------------------------------------
+    # 查詢
+    # ----------------------------------------
+    def report(self, suite=None, module=None, since_ms=None, limit=50, sort="flake_rate"):
+        snap = self.snapshot()
+        cache_key = (suite, module, since_ms, limit, sort)
+        cached = self._reports.get(cache_key)
+        if cached is not None and cached[0] == snap.version:
+            return cached[1]
+        started = time.perf_counter()
+        result = flaky_report(snap, suite=suite, module=module, since_ms=since_ms, limit=limit, sort=sort)
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        with self._lock:
+            if len(self._reports) >= REPORT_CACHE_SIZE:
+                self._reports.clear()
+            self._reports[cache_key] = (snap.version, result)
+        return result
+
+
+class _FailedKeys:
+    """
+    已保存的 fail，依 build fingerprint 分組 {fingerprint_id: {(module_id, test_id)}}；後續同一 build 的 pass 才需要保存。
+    只在匯入到某個 fingerprint 時才讀取該 fingerprint 既有 run 的紀錄範圍，不必每次匯入都讀整個 tests 欄位。
+    """
+
+    def __init__(self, store, meta):
+        self.store = store
+        self.rows = meta["rows"]["tests"]
+        # 只看這次匯入之前的 run；這次匯入中的 fail 由 _ingest_one 直接加入
+        self.run_fingerprint = list(meta["runs"]["fingerprint"])
+        self._by_fingerprint = {}
+
+    def for_fingerprint(self, fp_id):
+        failed = self._by_fingerprint.get(fp_id)
+        if failed is None:
+            failed = self._by_fingerprint[fp_id] = set()
+            if self.rows:
+                for run, fp in enumerate(self.run_fingerprint):
+                    if fp == fp_id:
+                        self._load_run(run, failed)
+        return failed
+
+    def _load_run(self, run, failed):
+        start, stop = self.store._run_rows(self.rows, run)
+        if start == stop:
+            return
+        cols = {name: self.store._read_range("tests", name, code, start, stop)
+                for name, code in TEST_COLUMNS if name != "run"}
+        failed.update((module, test) for module, test, result in
+                      zip(cols["module"], cols["test"], cols["result"]) if result == 1)
+
+
+class _Encoder:
+    """字典編碼: 字串 -> 在 values list 中的位置 (新字串 append 到 list 尾端)。"""
+
+    def __init__(self, values):
+        self.values = values
+        self.index = {v: i for i, v in enumerate(values)}
+
+    def encode(self, value):
+        code = self.index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.index[value] = code
+        return code
+
+
+# ----------------------------------------
+# 彙總
+# ----------------------------------------
+# 排序依據: (主要, 次要)；同分時依模組名稱、測項字典順序
+SORTS = {
+    "flake_rate": lambda flake, retry, failed, flaky: (flake, flaky),
+    "pass_on_retry": lambda flake, retry, failed, flaky: (retry, failed),
+    "failed": lambda flake, retry, failed, flaky: (failed, flake),
+}
+
+
+class _Stats:
+    """彙總結果 (與引擎無關)。modules / trend 為 {id: tuple}，tests 為已排序的前 limit 筆。"""
+
+    def __init__(self):
+        # module id -> (builds, runs, failed_builds, flaky_builds, flaky_tests, failed_tests, recovered)
+        self.modules = {}
+        # (module, test, builds, failed_builds, flaky_builds, fails, recovered, last_fp)
+        self.tests = []
+        # fp -> (runs, failed_tests, flaky_tests, recovered)
+        self.trend = {}
+        self.failed_tests = 0
+        self.flaky_tests = 0
+
+
+def _selected_runs(snap, suite, since_ms):
+    suite_id = snap.dicts["suite"].index(suite.upper()) if suite and suite.upper() in snap.dicts["suite"] else None
+    if suite and suite_id is None:
+        return [False] * len(snap.run_suite)
+    return [(suite_id is None or s == suite_id) and (since_ms is None or start >= since_ms)
+            for s, start in zip(snap.run_suite, snap.run_start)]
+
+
+def _distinct(values):
+    """排序後去重 (大量資料時比 np.unique 的 hash 實作快)。"""
+    values = np.sort(values)
+    if len(values) > 1:
+        values = values[np.concatenate(([True], values[1:] != values[:-1]))]
+    return values
+
+
+def _top(keys, limit):
+    """
+    keys: 由主到次的排序鍵 (皆為越大越前面)。回傳前 limit 筆的索引。
+    逐一以 partition 找出各鍵的門檻，只保留候選再排序，避免對上百萬筆測項做完整排序。
+    """
+    selected, candidates = [], np.arange(len(keys[0]))
+    room = limit
+    for values in keys:
+        if len(candidates) <= room:
+            break
+        v = values[candidates]
+        cut = np.partition(v, len(v) - room)[len(v) - room]      # 第 room 大的值
+        above = candidates[v > cut]
+        selected.append(above)
+        room -= len(above)
+        candidates = candidates[v == cut]
+    candidates = np.concatenate(selected + [candidates])
+    order = np.lexsort([-k[candidates] for k in reversed(keys)])
+    return candidates[order[:limit]]
+
+
+def _first_of_runs(values):
+    """已排序陣列中每段相同值的起點。"""
+    if not len(values):
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+
+
+def _reduce(ufunc, values, starts):
+    return ufunc.reduceat(values, starts) if len(starts) else values[:0]
+
+
+def _aggregate_numpy(snap, run_ok, module_id, sort, limit):
+    stats = _Stats()
+    n_modules, n_tests = len(snap.dicts["module"]) or 1, len(snap.dicts["test"]) or 1
+    n_fps = len(snap.dicts["fingerprint"]) or 1
+    run_ok = np.asarray(run_ok, dtype=bool)
+    run_fp = np.asarray(snap.run_fingerprint, dtype=np.int64)
+    run_start = np.asarray(snap.run_start, dtype=np.int64)
+
+    # 分母: 各模組執行過的 build 數 / 執行次數 (多個 ABI 算同一次)，各 build 的執行次數
+    mcols = snap.columns["modules"]
+    mask = run_ok[mcols["run"]] if len(mcols["run"]) else np.zeros(0, dtype=bool)
+    if module_id is not None:
+        mask &= mcols["module"] == module_id
+    m_run = mcols["run"][mask].astype(np.int64)
+    m_mod = mcols["module"][mask].astype(np.int64)
+    builds = np.bincount(_distinct(run_fp[m_run] * n_modules + m_mod) % n_modules, minlength=n_modules)
+    runs = np.bincount(_distinct(m_run * n_modules + m_mod) % n_modules, minlength=n_modules)
+    fp_runs = np.bincount(run_fp[_distinct(m_run)], minlength=n_fps)
+
+    # 測項紀錄已依 (module, test, fingerprint) 排序；指定模組時直接切出該段
+    keys, run, results = snap.sorted_tests
+    if module_id is not None:
+        span = n_tests * n_fps
+        lo, hi = np.searchsorted(keys, [module_id * span, (module_id + 1) * span])
+        keys, run, results = keys[lo:hi], run[lo:hi], results[lo:hi]
+    mask = run_ok[run] if len(run) else np.zeros(0, dtype=bool)
+    keys, start, results = keys[mask], run_start[run[mask]], results[mask]
+    is_fail, is_pass = results == 1, results == 0
+    starts = _first_of_runs(keys)
+    groups = keys[starts]
+    fails = _reduce(np.add, is_fail.astype(np.int64), starts)
+    passes = _reduce(np.add, is_pass.astype(np.int64), starts)
+    first_fail = _reduce(np.minimum, np.where(is_fail, start, np.iinfo(np.int64).max), starts)
+    last_pass = _reduce(np.maximum, np.where(is_pass, start, -1), starts)
+
+    failed = fails > 0
+    groups, fails = groups[failed], fails[failed]
+    flaky = passes[failed] > 0
+    recovered = last_pass[failed] > first_fail[failed]
+    rest, g_fp = np.divmod(groups, n_fps)
+    g_mod = rest // n_tests
+
+    # 測項層級 (rest = module * n_tests + test，已排序)
+    t_starts = _first_of_runs(rest)
+    tests = rest[t_starts]
+    t_mod, t_test = np.divmod(tests, n_tests)
+    t_failed = np.diff(np.append(t_starts, len(rest)))
+    t_flaky = _reduce(np.add, flaky.astype(np.int64), t_starts)
+    t_recovered = _reduce(np.add, recovered.astype(np.int64), t_starts)
+    t_fails = _reduce(np.add, fails, t_starts)
+    t_builds = np.where(builds[t_mod] > 0, builds[t_mod], t_failed)
+    fp_order = np.asarray(snap.fingerprint_order, dtype=np.int64)
+    fp_rank = np.zeros(n_fps, dtype=np.int64)
+    fp_rank[fp_order] = np.arange(len(fp_order))
+    t_last = _reduce(np.maximum, fp_rank[g_fp], t_starts)
+    stats.failed_tests = len(tests)
+    stats.flaky_tests = int(np.count_nonzero(t_flaky))
+
+    if len(tests) and limit > 0:
+        primary, secondary = SORTS[sort](t_flaky / t_builds, t_recovered / t_failed, t_failed, t_flaky)
+        order = _top((primary, secondary, -snap.module_name_rank[t_mod], -t_test), limit)
+        stats.tests = list(zip(t_mod[order].tolist(), t_test[order].tolist(), t_builds[order].tolist(),
+                               t_failed[order].tolist(), t_flaky[order].tolist(), t_fails[order].tolist(),
+                               t_recovered[order].tolist(), fp_order[t_last[order]].tolist()))
+
+    # 模組層級
+    mf = g_mod * n_fps + g_fp
+    m_failed_builds = np.bincount(_distinct(mf) // n_fps, minlength=n_modules)
+    m_flaky_builds = np.bincount(_distinct(mf[flaky]) // n_fps, minlength=n_modules)
+    m_flaky_tests = np.bincount(tests[t_flaky > 0] // n_tests, minlength=n_modules)
+    m_failed_tests = np.bincount(g_mod, minlength=n_modules)
+    m_recovered = np.bincount(g_mod, weights=recovered, minlength=n_modules).astype(np.int64)
+    for mod in np.flatnonzero(m_failed_tests).tolist():
+        stats.modules[mod] = (int(builds[mod]), int(runs[mod]), int(m_failed_builds[mod]), int(m_flaky_builds[mod]),
+                              int(m_flaky_tests[mod]), int(m_failed_tests[mod]), int(m_recovered[mod]))
+
+    # build 趨勢
+    b_failed = np.bincount(g_fp, minlength=n_fps)
+    b_flaky = np.bincount(g_fp, weights=flaky, minlength=n_fps).astype(np.int64)
+    b_recovered = np.bincount(g_fp, weights=recovered, minlength=n_fps).astype(np.int64)
+    for f in np.flatnonzero((b_failed > 0) | (fp_runs > 0)).tolist():
+        stats.trend[f] = (int(fp_runs[f]), int(b_failed[f]), int(b_flaky[f]), int(b_recovered[f]))
+    return stats
+
+
+def _aggregate_python(snap, run_ok, module_id, sort, limit):
+    stats = _Stats()
+    run_fp, run_start = snap.run_fingerprint, snap.run_start
+
+    mcols = snap.columns["modules"]
+    pairs = {(run, module) for run, module in zip(mcols["run"], mcols["module"])
+             if run_ok[run] and (module_id is None or module == module_id)}
+    builds, runs, fp_runs = {}, {}, {}
+    for run, module in pairs:
+        builds.setdefault(module, set()).add(run_fp[run])
+        runs[module] = runs.get(module, 0) + 1
+        fp_runs.setdefault(run_fp[run], set()).add(run)
+
+    # (fp, module, test) -> [fails, passes, first_fail_start, last_pass_start]
+    groups = {}
+    cols = snap.columns["tests"]
+    for run, module, test, result in zip(cols["run"], cols["module"], cols["test"], cols["result"]):
+        if not run_ok[run] or (module_id is not None and module != module_id):
+            continue
+        g = groups.get((run_fp[run], module, test))
+        if g is None:
+            g = groups[(run_fp[run], module, test)] = [0, 0, sys.maxsize, -1]
+        if result == 1:
+            g[0] += 1
+            g[2] = min(g[2], run_start[run])
+        elif result == 0:
+            g[1] += 1
+            g[3] = max(g[3], run_start[run])
+
+    tests, modules, trend = {}, {}, {}
+    first_seen = snap.fingerprint_first_seen
+    for (fp, mod, test), (fails, passes, first_fail, last_pass) in groups.items():
+        if not fails:
+            continue
+        flaky, recovered = passes > 0, last_pass > first_fail
+        t = tests.setdefault((mod, test), [0, 0, 0, 0, fp])
+        t[0] += 1
+        t[1] += flaky
+        t[2] += fails
+        t[3] += recovered
+        if first_seen[fp] > first_seen[t[4]]:
+            t[4] = fp
+        m = modules.setdefault(mod, [set(), set(), set(), 0, 0])
+        m[0].add(fp)
+        m[3] += 1
+        m[4] += recovered
+        if flaky:
+            m[1].add(fp)
+            m[2].add(test)
+        b = trend.setdefault(fp, [0, 0, 0])
+        b[0] += 1
+        b[1] += flaky
+        b[2] += recovered
+
+    stats.failed_tests = len(tests)
+    stats.flaky_tests = sum(1 for t in tests.values() if t[1])
+    rows = []
+    for (mod, test), (failed, flaky, fails, recovered, last_fp) in tests.items():
+        n_builds = len(builds.get(mod, ())) or failed
+        rows.append((mod, test, n_builds, failed, flaky, fails, recovered, last_fp))
+    rank = snap.module_name_rank
+
+    def key(r):
+        primary, secondary = SORTS[sort](r[4] / r[2], r[6] / r[3], r[3], r[4])
+        return -primary, -secondary, rank[r[0]], r[1]
+    stats.tests = sorted(rows, key=key)[:max(limit, 0)]
+    for mod, (failed_builds, flaky_builds, flaky_tests, failed_tests, recovered) in modules.items():
+        stats.modules[mod] = (len(builds.get(mod, ())), runs.get(mod, 0), len(failed_builds), len(flaky_builds),
+                              len(flaky_tests), failed_tests, recovered)
+    for fp in set(trend) | set(fp_runs):
+        stats.trend[fp] = (len(fp_runs.get(fp, ())),) + tuple(trend.get(fp, (0, 0, 0)))
+    return stats
+
+
+def flaky_report(snap, suite=None, module=None, since_ms=None, limit=50, sort="flake_rate"):
+    if sort not in SORTS:
+        raise ValueError(f"sort 必須是 {' / '.join(SORTS)}")
+    run_ok = _selected_runs(snap, suite, since_ms)
+    module_names = snap.dicts["module"]
+    module_id = None
+    if module is not None:
+        # 不存在的模組以 -1 過濾，結果為空
+        module_id = module_names.index(module) if module in module_names else -1
+    aggregate = _aggregate_numpy if np is not None else _aggregate_python
+    stats = aggregate(snap, run_ok, module_id, sort, limit)
+
+    fingerprints, test_names = snap.dicts["fingerprint"], snap.dicts["test"]
+    module_rows = []
+    for mod, (builds, runs, failed_builds, flaky_builds, flaky_tests, failed_tests, recovered) in stats.modules.items():
+        builds = builds or failed_builds
+        module_rows.append({
+            "module": module_names[mod],
+            "builds": builds,
+            "runs": runs,
+            "failed_builds": failed_builds,
+            "flaky_builds": flaky_builds,
+            "flaky_tests": flaky_tests,
+            "flake_rate": round(flaky_builds / builds, 4),
+            "pass_on_retry": round(recovered / failed_tests, 4),
+            "_key": SORTS[sort](flaky_builds / builds, recovered / failed_tests, failed_builds, flaky_builds),
+        })
+    module_rows.sort(key=lambda r: (-r["_key"][0], -r["_key"][1], r["module"]))
+    for row in module_rows:
+        del row["_key"]
+
+    test_rows = [{
+        "module": module_names[mod],
+        "test": test_names[test],
+        "builds": builds,
+        "failed_builds": failed_builds,
+        "flaky_builds": flaky_builds,
+        "fails": fails,
+        "flake_rate": round(flaky_builds / builds, 4),
+        "pass_on_retry": round(recovered / failed_builds, 4),
+        "last_fingerprint": fingerprints[last_fp],
+    } for mod, test, builds, failed_builds, flaky_builds, fails, recovered, last_fp in stats.tests]
+
+    trend_rows = [{
+        "fingerprint": fingerprints[fp],
+        "first_seen": snap.fingerprint_first_seen[fp] or None,
+        "runs": runs,
+        "failed_tests": failed,
+        "flaky_tests": flaky,
+        "recovered": recovered,
+    } for fp, (runs, failed, flaky, recovered) in
+        sorted(stats.trend.items(), key=lambda kv: snap.fingerprint_first_seen[kv[0]])]
+    return {
+        "engine": "numpy" if np is not None else "python",
+        "summary": {
+            "runs": sum(run_ok),
+            "builds": sum(1 for runs, *_ in stats.trend.values() if runs),
+            "failed_tests": stats.failed_tests,
+            "flaky_tests": stats.flaky_tests,
+            "stored_records": snap.meta["rows"]["tests"],
+        },
+        "modules": module_rows[:limit],
+        "tests": test_rows,
+        "trend": trend_rows,
+    }
+
+
+# ----------------------------------------
+# CLI
+# ----------------------------------------
+def print_report(report, out=sys.stdout):
+    s = report["summary"]
+    print(f"{s['runs']} 次執行 / {s['builds']} 個 build；曾 fail 的測項 {s['failed_tests']}，"
+          f"flaky {s['flaky_tests']}  ({report['engine']}, {report.get('elapsed_ms', '-')} ms)", file=out)
+    print("\n== 模組 ==", file=out)
+    for m in report["modules"]:
+        print(f"  {m['module']}: flake {m['flake_rate']:.0%} ({m['flaky_builds']}/{m['builds']} build)  "
+              f"retry 通過 {m['pass_on_retry']:.0%}  flaky 測項 {m['flaky_tests']}", file=out)
+    print("\n== 測項 ==", file=out)
+    for t in report["tests"]:
+        print(f"  {t['module']} {t['test']}: flake {t['flake_rate']:.0%} ({t['flaky_builds']}/{t['builds']})  "
+              f"retry 通過 {t['pass_on_retry']:.0%}", file=out)
+    print("\n== 趨勢 (依 build) ==", file=out)
+    for b in report["trend"]:
+        print(f"  {b['fingerprint']}: {b['runs']} 次執行  fail {b['failed_tests']}  flaky {b['flaky_tests']}  "
+              f"retry 通過 {b['recovered']}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flaky-test analytics over historical tradefed results")
+    parser.add_argument("--dir", default=DEFAULT_DIR, help="分析資料目錄")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_ingest = sub.add_parser("ingest", help="匯入 test_result.xml / results zip (依執行順序)")
+    p_ingest.add_argument("results", nargs="+")
+    p_report = sub.add_parser("report", help="flaky 統計")
+    p_report.add_argument("--suite")
+    p_report.add_argument("--module")
+    p_report.add_argument("--days", type=int, help="只看最近 N 天")
+    p_report.add_argument("--limit", type=int, default=20)
+    p_report.add_argument("--sort", default="flake_rate", choices=("flake_rate", "pass_on_retry", "failed"))
+    p_report.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    store = FlakyStore(args.dir)
+    if args.command == "ingest":
+        for path in args.results:
+            with open_result(path) as f:
+                try:
+                    r = store.ingest([(os.path.basename(path), f)])[0]
+                except ValueError as e:
+                    print(f"{path}: {e}")
+                    continue
+            note = " (已匯入過，略過)" if r["duplicate"] else f" {r['tests']} 測項，保存 {r['stored']} 筆"
+            print(f"{path}: {r['suite']} {r['fingerprint'] or '-'}{note}")
+        return
+    since = int((time.time() - args.days * 86400) * 1000) if args.days else None
+    report = store.report(suite=args.suite, module=args.module, since_ms=since, limit=args.limit, sort=args.sort)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as out:
+            json.dump(report, out, ensure_ascii=False, indent=2)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,18 @@
 # -*- coding: utf-8 -*-
 """
 將固定內容（對應你提供的 ctsv_gtsi HTML）匯入 ctsv_gtsi.db。
-- 建立或確認表格: ctsv_sections, test_cards, card_images
-- 清空 test_cards & card_images，然後匯入 HTML 裡的卡片與多張圖片
+- 確認 schema 為最新版本 (migrations.py)
+- 將 HTML 裡的卡片與多張圖片增量同步到 test_cards & card_images (seed_sync.py)，
+  重複執行不會改變 id，也不會覆蓋網頁上修改過的卡片
 """
+import argparse
 import sqlite3
 import os
 import sys
 
+from migrations import migrate
+from seed_sync import CARD_SEED, print_summary, sync
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "ctsv_gtsi.db")
 
@@ -19,38 +24,8 @@ def get_conn():
     return conn
 
 def ensure_tables(conn):
-    cur = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS ctsv_sections (
-        section_key TEXT PRIMARY KEY,
-        title TEXT NOT NULL,
-        tag TEXT,
-        display_order INTEGER NOT NULL DEFAULT 0
-    );
-    """)
-    # test_cards (no image_url column; images in card_images)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS test_cards (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        section_key TEXT NOT NULL,
-        card_title TEXT NOT NULL,
-        card_subtitle TEXT,
-        content TEXT,
-        note TEXT,
-        display_order INTEGER NOT NULL DEFAULT 0,
-        FOREIGN KEY(section_key) REFERENCES ctsv_sections(section_key) ON DELETE CASCADE
-    );
-    """)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS card_images (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        card_id INTEGER NOT NULL,
-        filename TEXT NOT NULL,
-        display_order INTEGER NOT NULL DEFAULT 0,
-        FOREIGN KEY(card_id) REFERENCES test_cards(id) ON DELETE CASCADE
-    );
-    """)
-    conn.commit()
+    """schema 由 migrations.py 管理；這裡只確保資料庫已升級到最新版本。"""
+    migrate(DB_PATH, "ctsv_gtsi")
 
 def upsert_sections(conn):
     cur = conn.cursor()
@@ -60,38 +35,18 @@ def upsert_sections(conn):
         ('MADA', 'MADA Check List', 'MADA', 30),
     ]
     for key, title, tag, order in default_sections:
-        cur.execute("SELECT 1 FROM ctsv_sections WHERE section_key = ?", (key,))
-        if cur.fetchone():
-            cur.execute("UPDATE ctsv_sections SET title=?, tag=?, display_order=? WHERE section_key=?",
-                        (title, tag, order, key))
+        cur.execute("SELECT title, tag FROM ctsv_sections WHERE section_key = ?", (key,))
+        row = cur.fetchone()
+        if row:
+            # display_order 只在新增時設定，保留使用者調整過的排序；內容相同就不寫入 (不 bump data_version)
+            if tuple(row) != (title, tag):
+                cur.execute("UPDATE ctsv_sections SET title=?, tag=? WHERE section_key=?", (title, tag, key))
         else:
             cur.execute("INSERT INTO ctsv_sections (section_key, title, tag, display_order) VALUES (?, ?, ?, ?)",
                         (key, title, tag, order))
     conn.commit()
 
-def clear_cards(conn):
-    cur = conn.cursor()
-    cur.execute("DELETE FROM card_images")
-    cur.execute("DELETE FROM test_cards")
-    conn.commit()
-
-def insert_card(conn, card):
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO test_cards (section_key, card_title, card_subtitle, content, note, display_order)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (card['section_key'], card['card_title'], card.get('card_subtitle'),
-          card.get('content'), card.get('note'), card.get('display_order')))
-    card_id = cur.lastrowid
-    for idx, fname in enumerate(card.get('image_urls', [])):
-        if not fname:
-            continue
-        cur.execute("INSERT INTO card_images (card_id, filename, display_order) VALUES (?, ?, ?)",
-                    (card_id, fname, (idx + 1) * 10))
-    conn.commit()
-    return card_id
-
-def main():
+def main(dry_run=False, force=False):
     print("使用資料庫：", DB_PATH)
     conn = get_conn()
     try:
@@ -99,9 +54,6 @@ def main():
         upsert_sections(conn)
         print("ctsv_sections 建立/更新完成。")
 
-        print("清空現有 test_cards 與 card_images（避免重複匯入）...")
-        clear_cards(conn)
-
         cards = []
         order = 10
 
@@ -258,10 +210,9 @@ def main():
             "display_order": order
         }); order += 10
 
-        print("開始匯入卡片...")
-        for c in cards:
-            cid = insert_card(conn, c)
-            print(f"Inserted card id={cid} title='{c['card_title']}' section={c['section_key']} images={len(c.get('image_urls',[]))}")
+        print("開始同步卡片（只寫入有變動的卡片，id 不變）...")
+        summary = sync(conn, CARD_SEED, cards, dry_run=dry_run, force=force)
+        print_summary("test_cards", summary, dry_run)
 
         print("匯入完成。請把靜態檔放到 static/ 對應路徑，以便前端顯示。")
         # 列印使用到的檔案
@@ -283,4 +234,8 @@ def main():
         conn.close()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Sync CTSV/GTSI card fixtures into ctsv_gtsi.db")
+    parser.add_argument("--dry-run", action="store_true", help="只顯示會變動的筆數")
+    parser.add_argument("--force", action="store_true", help="覆蓋網頁上修改過的卡片")
+    args = parser.parse_args()
+    main(dry_run=args.dry_run, force=args.force)
@@ -1,6 +1,10 @@
+import argparse
 import sqlite3
 import os
 
+from migrations import migrate
+from seed_sync import RETRY_SEED, print_summary, sync
+
 # ----------------------------------------
 # 設定 DB 路徑 - 🌟 保持 retry.db 🌟
 # ----------------------------------------
@@ -72,64 +76,34 @@ RETRY_DATA = [
 ]
 
 
-def import_retry_data():
+def import_retry_data(dry_run=False, force=False):
     """
-    連接資料庫並批量匯入 Retry 技巧資料到 'retry_tips' 表格。
+    將 RETRY_DATA 增量同步到 'retry_tips' 表格 (見 seed_sync.py)：
+    只寫入有變動的資料列，id 不變，網頁上修改過的資料不會被覆蓋。
     """
     if not os.path.exists(DB_PATH):
         print(f"⚠️ 警告：找不到資料庫檔案 {DB_PATH}。請先運行 3pl.py 確保 DB 初始化。")
         return
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-
-            # 1. 確保 retry_tips 表格存在 (這是關鍵!)
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS retry_tips (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    type TEXT NOT NULL,           -- 測試類型 (Basic, GTS, CTS, Special)
-                    module_case TEXT NOT NULL,    -- 模組 / 測項
-                    condition TEXT NOT NULL,      -- 條件 / 環境
-                    trick TEXT                    -- 備註 / Retry 方法
-                );
-                """
-            )
-            conn.commit()
-            print(f"✅ 資料庫 {DB_PATH} 和 'retry_tips' 表格結構已確認/建立。")
-
-            # 2. 清空舊數據，以便重新導入
-            cursor.execute("DELETE FROM retry_tips")
-
-            # 3. 準備 SQL 語句
-            sql = """
-            INSERT INTO retry_tips (type, module_case, condition, trick)
-            VALUES (?, ?, ?, ?)
-            """
-
-            # 4. 準備要匯入的資料 (將空字串替換為 None)
-            data_to_insert = [
-                (
-                    d["type"],
-                    d["module_case"],
-                    d["condition"],
-                    d["trick"] if d["trick"] else None
-                )
-                for d in RETRY_DATA
-            ]
-
-            # 5. 批量執行插入操作
-            cursor.executemany(sql, data_to_insert)
-
-            # 6. 提交事務
-            conn.commit()
+        # 1. 確保 schema 為最新版本 (retry_tips 等表格由 migrations.py 建立)
+        migrate(DB_PATH, "retry")
 
-            print(f"✅ 成功匯入 {cursor.rowcount} 筆 Retry 技巧紀錄到 {DB_PATH} 的 'retry_tips' 表格中。")
+        # 2. 比對 seed 與資料庫，只套用差異
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            summary = sync(conn, RETRY_SEED, RETRY_DATA, dry_run=dry_run, force=force)
+        finally:
+            conn.close()
+        print_summary("retry_tips", summary, dry_run)
 
     except sqlite3.Error as e:
         print(f"❌ 資料庫操作失敗: {e}")
 
 
 if __name__ == "__main__":
-    import_retry_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sync RETRY_DATA into retry.db")
+    parser.add_argument("--dry-run", action="store_true", help="只顯示會變動的筆數")
+    parser.add_argument("--force", action="store_true", help="覆蓋網頁上修改過的資料")
+    args = parser.parse_args()
+    import_retry_data(dry_run=args.dry_run, force=args.force)
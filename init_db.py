@@ -1,20 +1,8 @@
-import sqlite3
+# init_db.py
+# 建立 / 升級 waiver.db (schema 定義在 migrations.py)
+from migrations import DB_FILES, BASE_DIR, migrate
+import os
 
-conn = sqlite3.connect("waiver.db")
-cursor = conn.cursor()
+migrate(os.path.join(BASE_DIR, DB_FILES["waiver"]), "waiver", log=print)
 
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS waivers (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    suite TEXT NOT NULL,
-    waiver_id TEXT,
-    module TEXT,
-    test_case TEXT,
-    note TEXT
-)
-""")
-
-conn.commit()
-conn.close()
-
-print("資料庫建立成功")
\ No newline at end of file
+print("資料庫建立成功")
@@ -0,0 +1,599 @@
+# metrics.py
+# -*- coding: utf-8 -*-
+"""
+Request / SQL 計時與 Prometheus 格式的 /metrics
+
+- 每個 request: 總延遲 (含把 response 送完的時間)、request / response bytes、
+  各階段時間 (handler、SQLite、JSON 序列化、送出 response) 與 SQL 次數；上傳另記 bytes 與 throughput
+- 每個經過 get_db_conn 的 cursor: 依「動詞 + 資料表」(例如 SELECT waivers) 記錄執行時間 (execute + fetch)
+  與資料列數；statement 讀完、再次 execute 或 cursor 關閉時寫入
+- 只用 bisect + dict 累加，不需額外套件；設定 TOOL_METRICS=0 可整個關閉
+- gunicorn 多 worker: 每個 worker 最多每 FLUSH_INTERVAL 秒把累計值寫到 metrics 目錄，
+  /metrics 合併所有 worker 的檔案後輸出；worker 結束時 master 把它的檔案併入 aggregate.json
+  後刪除 (計數不會倒退，目錄內檔案數不超過 worker 數 + 1)
+"""
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+FLUSH_INTERVAL = 5.0
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+BYTE_BUCKETS = tuple(256 * 4 ** i for i in range(10))            # 256B .. 64MB
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000, 1_000_000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+THROUGHPUT_BUCKETS = tuple(2 ** i * 1024 * 1024 for i in range(-3, 10))   # 128KB/s .. 512MB/s
+UPLOAD_CONTENT_TYPES = ("multipart/form-data", "application/octet-stream")
+STATEMENT_CACHE_SIZE = 2048
+AGGREGATE_FILE = "aggregate.json"
+STALE_TMP_SECONDS = 60
+
+
+# ----------------------------------------
+# Counter / Histogram
+# ----------------------------------------
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, value=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), v] for k, v in self._series.items()]
+
+    @staticmethod
+    def merge(total, items):
+        for labels, value in items:
+            key = tuple(labels)
+            total[key] = total.get(key, 0) + value
+
+    def render(self, series):
+        for labels, value in sorted(series.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {_number(value)}"
+
+    def reset(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+
+class Histogram(Counter):
+    """各 bucket 分開計數 (非累計)，輸出時才累加成 Prometheus 的 le 形式；最後一格為 +Inf。"""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels, buckets):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[i] += 1
+            s[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), list(v)] for k, v in self._series.items()]
+
+    @staticmethod
+    def merge(total, items):
+        for labels, values in items:
+            key = tuple(labels)
+            current = total.get(key)
+            if current is None:
+                total[key] = list(values)
+            elif len(current) == len(values):
+                for i, v in enumerate(values):
+                    current[i] += v
+
+    def render(self, series):
+        for labels, values in sorted(series.items()):
+            if len(values) != len(self.buckets) + 2:
+                continue   # 舊版程式寫的檔案 (bucket 定義不同)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                le = bound if isinstance(bound, str) else _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labels + ('le',), labels + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {_number(values[-1])}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6)) if value != int(value) else str(int(value))
+    return str(value)
+
+
+# ----------------------------------------
+# SQL statement 分類
+# ----------------------------------------
+_PARENS = re.compile(r"\([^()]*\)")
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+NOT\s+EXISTS\s+)?([A-Za-z_][\w]*)", re.I)
+_statement_cache = {}
+
+
+def statement_label(sql):
+    """'SELECT c.id, (SELECT ... FROM card_images) FROM test_cards c' -> 'SELECT test_cards' (忽略子查詢)。"""
+    label = _statement_cache.get(sql)
+    if label is not None:
+        return label
+    text = sql
+    while True:
+        stripped = _PARENS.sub(" ", text)
+        if stripped == text:
+            break
+        text = stripped
+    words = text.split(None, 2)
+    verb = words[0].upper() if words else "?"
+    if verb == "PRAGMA":
+        label = "PRAGMA " + (words[1].split("=")[0].strip().lower() if len(words) > 1 else "")
+    else:
+        m = _TABLE.search(text)
+        label = f"{verb} {m.group(1)}" if m else verb
+    if len(_statement_cache) >= STATEMENT_CACHE_SIZE:
+        _statement_cache.clear()
+    _statement_cache[sql] = label
+    return label
+
+
+class TimedCursor(sqlite3.Cursor):
+    """記錄每個 statement 的執行時間 (execute + fetch，不含呼叫端處理資料列的時間) 與資料列數。"""
+
+    def __init__(self, conn, db_name, metrics):
+        super().__init__(conn)
+        self._db = db_name
+        self._metrics = metrics
+        self._sql = None
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _finish(self):
+        sql, self._sql = self._sql, None
+        if sql is not None:
+            rows = self._rows if self._rows or self.rowcount < 0 else self.rowcount
+            self._metrics.observe_query(self._db, sql, self._elapsed, rows)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._sql, self._elapsed, self._rows = sql, time.perf_counter() - start, 0
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            self._sql, self._elapsed, self._rows = sql, time.perf_counter() - start, 0
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._elapsed += time.perf_counter() - start
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._elapsed += time.perf_counter() - start
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - start
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._elapsed += time.perf_counter() - start
+            self._finish()
+            raise
+        self._elapsed += time.perf_counter() - start
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+# ----------------------------------------
+# Request 計時 (WSGI middleware)
+# ----------------------------------------
+class _RequestState:
+    __slots__ = ("route", "db_seconds", "db_queries", "json_seconds")
+
+    def __init__(self):
+        self.route = "<unmatched>"
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.json_seconds = 0.0
+
+
+class MetricsMiddleware:
+    """包住 app.wsgi_app；response 送完 (WSGI server 呼叫 close) 才記錄，延遲因此包含送出 response 的時間。"""
+
+    def __init__(self, wsgi_app, metrics):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        metrics = self.metrics
+        state = metrics.begin_request()
+        start = time.perf_counter()
+        status = ["500"]
+        headers_out = {}
+
+        def _start_response(status_line, headers, exc_info=None):
+            status[0] = status_line.split(" ", 1)[0]
+            headers_out["length"] = next((v for k, v in headers if k.lower() == "content-length"), None)
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, _start_response)
+        except BaseException:
+            metrics.end_request(environ, state, status[0], start, time.perf_counter(), 0)
+            raise
+        handler_end = time.perf_counter()
+        file_wrapper = environ.get("wsgi.file_wrapper")
+        if isinstance(file_wrapper, type) and isinstance(body, file_wrapper):
+            # 保留 WSGI server 的 sendfile 最佳化: 不包裝，bytes 取 Content-Length，不含送出時間
+            metrics.end_request(environ, state, status[0], start, handler_end, int(headers_out.get("length") or 0))
+            return body
+        return _CountingBody(body, lambda sent: metrics.end_request(environ, state, status[0], start, handler_end,
+                                                                    sent))
+
+
+class _CountingBody:
+    def __init__(self, body, on_close):
+        self._body = body
+        self._on_close = on_close
+        self._sent = 0
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self._body:
+            self._sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self._body, "close"):
+                self._body.close()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._on_close(self._sent)
+
+
+# ----------------------------------------
+# 多 process 的 worker 檔案
+# ----------------------------------------
+_WORKER_FILE = re.compile(r"^worker_(\d+)_\d+\.json$")
+
+
+def _worker_pid(name):
+    m = _WORKER_FILE.match(name)
+    return int(m.group(1)) if m else None
+
+
+def _pid_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ----------------------------------------
+# Metrics
+# ----------------------------------------
+class Metrics:
+    """
+    本 app 的所有指標。directory 為多 process 共用的 metrics 目錄 (None 時只看本 process)。
+    fork 出來的 worker 會清掉從 master 繼承的數值，各自重新累計並寫到自己的檔案。
+    """
+
+    def __init__(self, directory=None, enabled=True):
+        self.directory = directory
+        self.enabled = enabled
+        self._local = threading.local()
+        self._flush_lock = threading.Lock()
+        self._last_flush = 0.0
+        self._file = None
+        self.request_seconds = Histogram(
+            "tool_http_request_duration_seconds", "Request latency including sending the response body",
+            ("method", "route", "status"), LATENCY_BUCKETS)
+        self.stage_seconds = Histogram(
+            "tool_http_request_stage_seconds", "Time per request spent in handler / sqlite / json / send",
+            ("route", "stage"), LATENCY_BUCKETS)
+        self.request_queries = Histogram(
+            "tool_http_request_db_queries", "SQL statements executed per request", ("route",), COUNT_BUCKETS)
+        self.request_bytes = Histogram(
+            "tool_http_request_bytes", "Request body size", ("route",), BYTE_BUCKETS)
+        self.response_bytes = Histogram(
+            "tool_http_response_bytes", "Response body bytes sent", ("route",), BYTE_BUCKETS)
+        self.upload_bytes = Counter(
+            "tool_upload_bytes_total", "Uploaded bytes (multipart / octet-stream bodies)", ("route",))
+        self.upload_throughput = Histogram(
+            "tool_upload_throughput_bytes_per_second", "Upload throughput per request", ("route",),
+            THROUGHPUT_BUCKETS)
+        self.query_seconds = Histogram(
+            "tool_db_query_duration_seconds", "SQL statement time (execute + fetch)", ("db", "statement"),
+            QUERY_BUCKETS)
+        self.query_rows = Histogram(
+            "tool_db_query_rows", "Rows returned (SELECT) or changed per statement", ("db", "statement"),
+            ROW_BUCKETS)
+        self.all = [self.request_seconds, self.stage_seconds, self.request_queries, self.request_bytes,
+                    self.response_bytes, self.upload_bytes, self.upload_throughput, self.query_seconds,
+                    self.query_rows]
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        for metric in self.all:
+            metric.reset()
+        self._local = threading.local()
+        self._flush_lock = threading.Lock()
+        self._last_flush = 0.0
+        self._file = None
+
+    # --- 接到 app ---
+    def wrap_wsgi(self, wsgi_app):
+        return MetricsMiddleware(wsgi_app, self) if self.enabled else wsgi_app
+
+    def cursor_factory(self, db_name):
+        """給 db_pool 使用: 回傳建立 TimedCursor 的 factory (關閉時為 None)。"""
+        if not self.enabled:
+            return None
+        return lambda conn: TimedCursor(conn, db_name, self)
+
+    # --- request ---
+    def begin_request(self):
+        state = self._local.request = _RequestState()
+        return state
+
+    def set_route(self, route):
+        state = getattr(self._local, "request", None)
+        if state is not None:
+            state.route = route
+
+    def add_json_time(self, seconds):
+        state = getattr(self._local, "request", None)
+        if state is not None:
+            state.json_seconds += seconds
+
+    def end_request(self, environ, state, status, start, handler_end, sent):
+        now = time.perf_counter()
+        route = state.route
+        self.request_seconds.observe((environ.get("REQUEST_METHOD", ""), route, status), now - start)
+        self.stage_seconds.observe((route, "handler"), handler_end - start)
+        self.stage_seconds.observe((route, "db"), state.db_seconds)
+        self.stage_seconds.observe((route, "json"), state.json_seconds)
+        self.stage_seconds.observe((route, "send"), now - handler_end)
+        self.request_queries.observe((route,), state.db_queries)
+        self.response_bytes.observe((route,), sent)
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        if length:
+            self.request_bytes.observe((route,), length)
+            if (environ.get("CONTENT_TYPE") or "").startswith(UPLOAD_CONTENT_TYPES):
+                self.upload_bytes.inc((route,), length)
+                self.upload_throughput.observe((route,), length / max(handler_end - start, 1e-6))
+        if getattr(self._local, "request", None) is state:
+            self._local.request = None
+        if self.directory and now - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def observe_query(self, db_name, sql, seconds, rows):
+        label = statement_label(sql)
+        self.query_seconds.observe((db_name, label), seconds)
+        self.query_rows.observe((db_name, label), rows)
+        state = getattr(self._local, "request", None)
+        if state is not None:
+            state.db_seconds += seconds
+            state.db_queries += 1
+
+    # --- 多 process 彙總 ---
+    def snapshot(self):
+        return {m.name: m.snapshot() for m in self.all}
+
+    def flush(self):
+        """把本 process 的累計值寫到 metrics 目錄 (先寫暫存檔再 rename，讀取端不會讀到一半)。"""
+        if not self.directory or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_flush = time.perf_counter()
+            if self._file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._file = os.path.join(self.directory, f"worker_{os.getpid()}_{time.time_ns()}.json")
+            self._write_json(os.path.basename(self._file), self.snapshot())
+        except OSError:
+            pass
+        finally:
+            self._flush_lock.release()
+
+    def fold_worker(self, pid):
+        """
+        gunicorn master 在 worker 結束後呼叫 (child_exit)：把該 worker 的檔案併入 aggregate.json 再刪除。
+        aggregate.json 記下已併入的檔名，collect() 最後才讀它並略過這些檔案，讀取途中併入也不會重複計算。
+        """
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        prefix = f"worker_{pid}_"
+        names = [n for n in os.listdir(self.directory) if n.startswith(prefix) and n.endswith(".json")]
+        if not names:
+            return
+        aggregate = self._read_aggregate()
+        totals = {m.name: {} for m in self.all}
+        for metric in self.all:
+            metric.merge(totals[metric.name], aggregate["metrics"].get(metric.name, []))
+        for name in names:
+            snap = self._read_json(name)
+            if snap is not None and name not in aggregate["folded"]:
+                for metric in self.all:
+                    metric.merge(totals[metric.name], snap.get(metric.name, []))
+        existing = set(os.listdir(self.directory))
+        # 上次併入但已刪除的檔名不必再記
+        folded = [n for n in aggregate["folded"] if n in existing] + names
+        data = {"folded": folded, "metrics": {name: [[list(k), v] for k, v in series.items()]
+                                              for name, series in totals.items()}}
+        try:
+            self._write_json(AGGREGATE_FILE, data)
+        except OSError:
+            return
+        for name in names:
+            self._remove(name)
+        # 被 kill 的 worker 可能留下寫到一半的暫存檔
+        cutoff = time.time() - STALE_TMP_SECONDS
+        for name in existing:
+            if name.endswith(".tmp"):
+                try:
+                    if os.path.getmtime(os.path.join(self.directory, name)) < cutoff:
+                        self._remove(name)
+                except OSError:
+                    pass
+
+    def _read_aggregate(self):
+        data = self._read_json(AGGREGATE_FILE) or {}
+        return {"folded": data.get("folded", []), "metrics": data.get("metrics", {})}
+
+    def _read_json(self, name):
+        try:
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, name, data):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, os.path.join(self.directory, name))
+        except OSError:
+            self._remove(os.path.basename(tmp))
+            raise
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def clear_directory(self, master_alive=False):
+        """
+        master 啟動時呼叫: 清掉上一次執行留下的 worker 檔案。
+        master_alive=True (serve.py reload 以 USR2 re-exec，舊 master 與它的 worker 仍在服務) 時
+        保留 aggregate.json，只刪除 process 已不存在的 worker 檔案與過期的暫存檔。
+        """
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        cutoff = time.time() - STALE_TMP_SECONDS
+        for name in os.listdir(self.directory):
+            if not name.endswith((".json", ".tmp")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if master_alive:
+                    if name == AGGREGATE_FILE:
+                        continue
+                    if name.endswith(".tmp"):
+                        if os.path.getmtime(path) >= cutoff:
+                            continue
+                    elif _pid_alive(_worker_pid(name)):
+                        continue
+                os.remove(path)
+            except OSError:
+                pass
+
+    def collect(self):
+        """合併所有 worker 的數值: {metric name: {labels: value}}。"""
+        totals = {m.name: {} for m in self.all}
+        snapshots = {}
+        if self.directory:
+            self.flush()
+            for name in sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []:
+                if name.endswith(".json") and name != AGGREGATE_FILE:
+                    snap = self._read_json(name)
+                    if snap is not None:
+                        snapshots[name] = snap
+            # 最後才讀 aggregate: 讀取途中被併入 (或已刪除) 的 worker 檔案都已包含在內
+            aggregate = self._read_aggregate()
+            for name in aggregate["folded"]:
+                snapshots.pop(name, None)
+            processes = len(snapshots)
+            snapshots[AGGREGATE_FILE] = aggregate["metrics"]
+        else:
+            snapshots[None] = self.snapshot()
+            processes = 1
+        for snap in snapshots.values():
+            for metric in self.all:
+                metric.merge(totals[metric.name], snap.get(metric.name, []))
+        return totals, processes
+
+    def render(self):
+        totals, processes = self.collect()
+        lines = ["# HELP tool_metrics_processes Running worker processes reporting metrics (exited ones are aggregated)",
+                 "# TYPE tool_metrics_processes gauge", f"tool_metrics_processes {processes}"]
+        for metric in self.all:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render(totals[metric.name]))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,389 @@
+# migrations.py
+# -*- coding: utf-8 -*-
+"""
+資料庫 schema 版本管理
+
+- 每個資料庫以 PRAGMA user_version 記錄目前的 schema 版本
+- MIGRATIONS 依版本號排序，啟動時只比對 user_version，已是最新版本就什麼都不做
+- 每個版本在自己的 transaction 內執行 (BEGIN IMMEDIATE)，失敗整個版本 rollback，
+  user_version 也一起 rollback；多個 process 同時啟動時只有一個會真的執行
+- 需要重建資料表時使用 INSERT ... SELECT 整批搬移 (SQLite 不支援 DROP COLUMN 的舊版做法)
+- CLI:
+      python migrations.py                  # 套用所有資料庫的待執行版本
+      python migrations.py --status         # 只顯示目前版本與待執行版本
+      python migrations.py --dry-run        # 實際執行並計時，最後 rollback
+      python migrations.py --db ctsv_gtsi --backup
+"""
+import argparse
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from change_log import ensure_change_log
+from data_version import ensure_data_versions
+from search import ensure_gram_index, ensure_search_index, update_gram_triggers
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILES = {
+    "waiver": "waiver.db",
+    "retry": "retry.db",
+    "ctsv_gtsi": "ctsv_gtsi.db",
+}
+
+
+class Migration:
+    """steps: SQL 字串或 callable(conn) 的 list，依序在同一個 transaction 內執行。"""
+
+    def __init__(self, version, name, steps):
+        self.version = version
+        self.name = name
+        self.steps = steps
+
+
+SEED_STATE_SQL = """
+    CREATE TABLE IF NOT EXISTS seed_state (
+        source TEXT NOT NULL,
+        seed_key TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        hash TEXT NOT NULL,
+        PRIMARY KEY (source, seed_key)
+    )
+"""
+
+
+# 匯入的 tradefed 結果: 每次執行一筆 test_runs，每個模組一筆 module_runs (給 shard_planner.py 估計模組時間)
+MODULE_HISTORY_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS test_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        suite TEXT NOT NULL,
+        run_key TEXT NOT NULL UNIQUE,
+        build_fingerprint TEXT,
+        devices TEXT,
+        device_count INTEGER NOT NULL DEFAULT 1,
+        started_at INTEGER,
+        ended_at INTEGER,
+        source TEXT,
+        ingested_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_test_runs_suite_started ON test_runs (suite, started_at)",
+    """
+    CREATE TABLE IF NOT EXISTS module_runs (
+        run_id INTEGER NOT NULL REFERENCES test_runs(id) ON DELETE CASCADE,
+        abi TEXT NOT NULL DEFAULT '',
+        module TEXT NOT NULL,
+        runtime_ms INTEGER NOT NULL,
+        done INTEGER NOT NULL,
+        total_tests INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (run_id, abi, module)
+    ) WITHOUT ROWID
+    """,
+]
+
+
+def _has_column(conn, table, column):
+    return any(r[1] == column for r in conn.execute(f"PRAGMA table_info({table})"))
+
+
+# ----------------------------------------
+# waiver.db
+# ----------------------------------------
+WAIVER_MIGRATIONS = [
+    Migration(1, "waivers table", [
+        """
+        CREATE TABLE IF NOT EXISTS waivers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            suite TEXT NOT NULL, waiver_id TEXT NOT NULL, module TEXT NOT NULL,
+            test_case TEXT NOT NULL, note TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_waivers_suite_id ON waivers (suite, id)",
+    ]),
+    Migration(2, "full-text search index", [lambda conn: ensure_search_index(conn, "waiver")]),
+    Migration(3, "data versions", [lambda conn: ensure_data_versions(conn, "waiver")]),
+    Migration(4, "change log", [lambda conn: ensure_change_log(conn, "waiver")]),
+    Migration(5, "short-term search index", [lambda conn: ensure_gram_index(conn, "waiver")]),
+    Migration(6, "short-term index: queue only indexed columns", [lambda conn: update_gram_triggers(conn, "waiver")]),
+]
+
+# ----------------------------------------
+# retry.db
+# ----------------------------------------
+RETRY_MIGRATIONS = [
+    Migration(1, "retry_tips / suites tables", [
+        """
+        CREATE TABLE IF NOT EXISTS retry_tips (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            module_case TEXT NOT NULL,
+            condition TEXT NOT NULL,
+            trick TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS suites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            suite_key TEXT UNIQUE NOT NULL,
+            suite_title TEXT NOT NULL,
+            suite_tag TEXT,
+            display_order INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        # 預設區塊 (只在完全沒有區塊時建立)
+        """
+        INSERT INTO suites (suite_key, suite_title, suite_tag, display_order)
+        SELECT * FROM (VALUES
+            ('BASIC', 'Basic 測項', 'SIM / Host / Permission 類', 1024),
+            ('GTS', 'GTS 測項', 'GTS', 2048),
+            ('CTS', 'CTS 測項', 'CTS', 3072),
+            ('SECURITYTOT', 'Security / TOT 測項', 'Security / TOT', 4096),
+            ('SPECIAL', '特殊情況 ', 'Special Cases / General', 5120))
+        WHERE NOT EXISTS (SELECT 1 FROM suites)
+        """,
+    ]),
+    Migration(2, "full-text search index", [lambda conn: ensure_search_index(conn, "retry")]),
+    Migration(3, "data versions", [lambda conn: ensure_data_versions(conn, "retry")]),
+    Migration(4, "seed sync state", [SEED_STATE_SQL]),
+    Migration(5, "change log", [lambda conn: ensure_change_log(conn, "retry")]),
+    Migration(6, "module run history", MODULE_HISTORY_SQL),
+    Migration(7, "short-term search index", [lambda conn: ensure_gram_index(conn, "retry")]),
+    Migration(8, "short-term index: queue only indexed columns", [lambda conn: update_gram_triggers(conn, "retry")]),
+]
+
+# ----------------------------------------
+# ctsv_gtsi.db
+# ----------------------------------------
+CARD_TABLE_SQL = """
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        section_key TEXT NOT NULL,
+        card_title TEXT NOT NULL,
+        card_subtitle TEXT,
+        content TEXT,
+        note TEXT,
+        display_order INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY(section_key) REFERENCES ctsv_sections(section_key) ON DELETE CASCADE
+    )
+"""
+
+
+def _drop_card_image_url(conn):
+    """
+    舊版 test_cards 有 image_url 欄位 (可能以逗號分隔多張圖)：
+    搬到 card_images 後重建 test_cards 去掉該欄位，id 保持不變。
+    """
+    if not _has_column(conn, "test_cards", "image_url"):
+        return
+    conn.execute("""
+        WITH RECURSIVE split(card_id, rest, part, idx) AS (
+            SELECT id, image_url || ',', NULL, 0 FROM test_cards
+            WHERE image_url IS NOT NULL AND TRIM(image_url) <> ''
+            UNION ALL
+            SELECT card_id, substr(rest, instr(rest, ',') + 1), TRIM(substr(rest, 1, instr(rest, ',') - 1)), idx + 1
+            FROM split WHERE rest <> ''
+        )
+        INSERT INTO card_images (card_id, filename, display_order)
+        SELECT card_id, part, idx * 1024 FROM split WHERE part <> ''
+    """)
+    conn.execute(CARD_TABLE_SQL.format(name="new_test_cards"))
+    conn.execute("""
+        INSERT INTO new_test_cards (id, section_key, card_title, card_subtitle, content, note, display_order)
+        SELECT id, section_key, card_title, card_subtitle, content, note, display_order FROM test_cards
+    """)
+    conn.execute("DROP TABLE test_cards")
+    conn.execute("ALTER TABLE new_test_cards RENAME TO test_cards")
+
+
+CTSV_MIGRATIONS = [
+    Migration(1, "sections / cards / card_images tables", [
+        """
+        CREATE TABLE IF NOT EXISTS ctsv_sections (
+            section_key TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            tag TEXT,
+            display_order INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        CARD_TABLE_SQL.replace("CREATE TABLE {name}", "CREATE TABLE IF NOT EXISTS test_cards"),
+        """
+        CREATE TABLE IF NOT EXISTS card_images (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            card_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            display_order INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(card_id) REFERENCES test_cards(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        INSERT INTO ctsv_sections (section_key, title, tag, display_order)
+        SELECT * FROM (VALUES
+            ('GTSI', 'GTS Interactive 區塊', 'Android 13+ / MADA', 1024),
+            ('CTSV', 'CTS Verifier 區塊', 'CameraITS / Audio / Sensor', 2048),
+            ('MADA', 'MADA Check List 區塊', 'Auto discoverability / Doc', 3072))
+        WHERE NOT EXISTS (SELECT 1 FROM ctsv_sections)
+        """,
+    ]),
+    Migration(2, "move legacy test_cards.image_url into card_images", [_drop_card_image_url]),
+    Migration(3, "keyset pagination indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_test_cards_section_order ON test_cards (section_key, display_order, id)",
+        "CREATE INDEX IF NOT EXISTS idx_card_images_card_order ON card_images (card_id, display_order)",
+    ]),
+    Migration(4, "full-text search index", [lambda conn: ensure_search_index(conn, "ctsv_gtsi")]),
+    Migration(5, "data versions", [lambda conn: ensure_data_versions(conn, "ctsv_gtsi")]),
+    Migration(6, "seed sync state", [SEED_STATE_SQL]),
+    Migration(7, "change log", [lambda conn: ensure_change_log(conn, "ctsv_gtsi")]),
+    Migration(8, "short-term search index", [lambda conn: ensure_gram_index(conn, "ctsv_gtsi")]),
+    # 上傳檔以 sha256 命名，原始檔名記在這裡 (同內容以第一次上傳的檔名為準)
+    Migration(9, "upload original names", [
+        """
+        CREATE TABLE IF NOT EXISTS uploads (
+            file_path TEXT PRIMARY KEY,
+            original_name TEXT NOT NULL,
+            size INTEGER,
+            created_at REAL
+        )
+        """,
+    ]),
+    Migration(10, "short-term index: queue only indexed columns",
+              [lambda conn: update_gram_triggers(conn, "ctsv_gtsi")]),
+]
+
+MIGRATIONS = {
+    "waiver": WAIVER_MIGRATIONS,
+    "retry": RETRY_MIGRATIONS,
+    "ctsv_gtsi": CTSV_MIGRATIONS,
+}
+
+
+def latest_version(db_name):
+    return MIGRATIONS[db_name][-1].version
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def pending(conn, db_name):
+    version = current_version(conn)
+    return [m for m in MIGRATIONS[db_name] if m.version > version]
+
+
+# ----------------------------------------
+# 執行
+# ----------------------------------------
+def _connect(path):
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+    # 重建資料表時 DROP TABLE 不能觸發 ON DELETE CASCADE；此 pragma 只能在 transaction 外設定
+    conn.execute("PRAGMA foreign_keys = OFF")
+    return conn
+
+
+def backup(conn, path):
+    """以 SQLite online backup API 複製一份 (不需要先停掉 server)。"""
+    base, ext = os.path.splitext(path)
+    target = f"{base}_backup_{datetime.now().strftime('%Y%m%d%H%M%S')}{ext}"
+    dst = sqlite3.connect(target)
+    try:
+        conn.backup(dst)
+    finally:
+        dst.close()
+    return target
+
+
+def _run_steps(conn, migration):
+    for step in migration.steps:
+        if callable(step):
+            step(conn)
+        else:
+            conn.execute(step)
+
+
+def migrate(path, db_name, dry_run=False, make_backup=False, log=None):
+    """
+    套用待執行的版本。回傳 [(version, name, 毫秒)]。
+    dry_run: 在單一 transaction 內執行全部版本並計時，最後 rollback。
+    """
+    conn = _connect(path)
+    applied = []
+    try:
+        if current_version(conn) >= latest_version(db_name):
+            return applied
+        if make_backup and not dry_run and os.path.exists(path):
+            target = backup(conn, path)
+            if log:
+                log(f"  已備份到 {target}")
+        if dry_run:
+            conn.execute("BEGIN IMMEDIATE")
+        for migration in MIGRATIONS[db_name]:
+            if not dry_run:
+                conn.execute("BEGIN IMMEDIATE")
+            # 取得寫入鎖後再確認一次版本，其他 process 可能已經套用
+            if migration.version <= current_version(conn):
+                if not dry_run:
+                    conn.execute("ROLLBACK")
+                continue
+            start = time.perf_counter()
+            try:
+                _run_steps(conn, migration)
+                conn.execute(f"PRAGMA user_version = {int(migration.version)}")
+                if not dry_run:
+                    conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            elapsed = (time.perf_counter() - start) * 1000
+            applied.append((migration.version, migration.name, elapsed))
+            if log:
+                log(f"  v{migration.version} {migration.name} ({elapsed:.1f} ms)")
+        if dry_run:
+            conn.execute("ROLLBACK")
+        else:
+            problems = conn.execute("PRAGMA foreign_key_check").fetchall()
+            if problems and log:
+                log(f"  ⚠️ foreign key 檢查有 {len(problems)} 筆不一致")
+    finally:
+        conn.close()
+    return applied
+
+
+def migrate_all(paths=None, dry_run=False, make_backup=False, log=None):
+    """paths: {db_name: path}；預設為專案目錄下的三個資料庫。"""
+    paths = paths or {name: os.path.join(BASE_DIR, f) for name, f in DB_FILES.items()}
+    return {name: migrate(path, name, dry_run=dry_run, make_backup=make_backup, log=log)
+            for name, path in paths.items()}
+
+
+def status(paths=None):
+    paths = paths or {name: os.path.join(BASE_DIR, f) for name, f in DB_FILES.items()}
+    result = {}
+    for name, path in paths.items():
+        conn = sqlite3.connect(path)
+        try:
+            result[name] = (current_version(conn), latest_version(name),
+                            [(m.version, m.name) for m in pending(conn, name)])
+        finally:
+            conn.close()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations")
+    parser.add_argument("--db", choices=sorted(DB_FILES), action="append")
+    parser.add_argument("--status", action="store_true")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--backup", action="store_true")
+    args = parser.parse_args()
+    targets = {name: os.path.join(BASE_DIR, DB_FILES[name]) for name in (args.db or DB_FILES)}
+
+    if args.status:
+        for name, (cur, latest, todo) in status(targets).items():
+            print(f"{name}: v{cur} / v{latest}")
+            for version, title in todo:
+                print(f"  待執行 v{version} {title}")
+    else:
+        for name, path in targets.items():
+            print(f"{name} ({path}){' [dry-run]' if args.dry_run else ''}")
+            if not migrate(path, name, dry_run=args.dry_run, make_backup=args.backup, log=print):
+                print("  已是最新版本")
@@ -0,0 +1,136 @@
+# ordering.py
+# -*- coding: utf-8 -*-
+"""
+拖曳排序用的 gap-based display_order
+
+- 排序值之間保留間隔 (ORDER_GAP)，移動一個項目只需把它放到前後鄰居的中間值，只寫一筆
+- 前端送來的是「完整的新順序」，這裡用最長遞增子序列 (LIS) 找出不需要動的項目，
+  只替其餘項目重新計算排序值
+- 中間值用完 (鄰居相差 1) 才整個範圍重新編號，並且在同一個 transaction 內完成
+"""
+from bisect import bisect_left
+
+ORDER_GAP = 1024
+
+
+def next_order_value(conn, table, scope_sql="", scope_params=()):
+    """新增項目放在最後: 目前最大值 + ORDER_GAP。"""
+    where = f" WHERE {scope_sql}" if scope_sql else ""
+    row = conn.execute(f"SELECT MAX(display_order) FROM {table}{where}", scope_params).fetchone()
+    return (row[0] or 0) + ORDER_GAP
+
+
+def _lis_indices(values):
+    """回傳嚴格遞增最長子序列的 index 集合 (O(n log n))。"""
+    tails, tails_idx, prev = [], [], [None] * len(values)
+    for i, v in enumerate(values):
+        pos = bisect_left(tails, v)
+        if pos == len(tails):
+            tails.append(v)
+            tails_idx.append(i)
+        else:
+            tails[pos] = v
+            tails_idx[pos] = i
+        prev[i] = tails_idx[pos - 1] if pos > 0 else None
+    keep = set()
+    i = tails_idx[-1] if tails_idx else None
+    while i is not None:
+        keep.add(i)
+        i = prev[i]
+    return keep
+
+
+def plan_order(current, new_ids):
+    """
+    current: {id: display_order}，new_ids: 新順序。
+    new_ids 中不在 current 的 id 視為新項目，一定會被指定排序值。
+    回傳 ({id: 新的 display_order} 只含需要變更者, 是否整個重新編號)。
+    """
+    values = [current.get(i) for i in new_ids]
+    existing = [idx for idx, v in enumerate(values) if v is not None]
+    keep = {existing[j] for j in _lis_indices([values[idx] for idx in existing])}
+    assigned = {}
+    n = len(new_ids)
+    pos = 0
+    while pos < n:
+        if pos in keep:
+            pos += 1
+            continue
+        start = pos
+        while pos < n and pos not in keep:
+            pos += 1
+        run = new_ids[start:pos]
+        lo = values[start - 1] if start > 0 else None
+        hi = values[pos] if pos < n else None
+        k = len(run)
+        if lo is None and hi is None:
+            keys = [ORDER_GAP * (j + 1) for j in range(k)]
+        elif hi is None:
+            keys = [lo + ORDER_GAP * (j + 1) for j in range(k)]
+        elif lo is None:
+            keys = [hi - ORDER_GAP * (k - j) for j in range(k)]
+        else:
+            step = (hi - lo) // (k + 1)
+            if step < 1:
+                return _renumber(current, new_ids), True
+            keys = [lo + step * (j + 1) for j in range(k)]
+        for item_id, key in zip(run, keys):
+            assigned[item_id] = key
+    return {i: v for i, v in assigned.items() if current.get(i) != v}, False
+
+
+def _renumber(current, new_ids):
+    return {i: ORDER_GAP * (idx + 1) for idx, i in enumerate(new_ids) if current.get(i) != ORDER_GAP * (idx + 1)}
+
+
+def apply_order(conn, table, id_col, new_ids, scope_sql="", scope_params=()):
+    """
+    將 scope 內的項目排成 new_ids 的順序，只更新需要變更的資料列。
+    未出現在 new_ids 的項目依原順序接在最後；不在 scope 內的 id (例如其他人剛刪除的項目) 略過，
+    列在 skipped 中回傳，不讓整個排序失敗。
+    呼叫前已執行但尚未 commit 的寫入 (例如卡片換區塊) 會一起在此 commit。
+    回傳 {"updated": n, "renumbered": bool, "skipped": [id, ...]}。
+    """
+    where = f" WHERE {scope_sql}" if scope_sql else ""
+    rows = conn.execute(f"SELECT {id_col}, display_order FROM {table}{where} ORDER BY display_order, {id_col}",
+                        scope_params).fetchall()
+    current = {r[0]: r[1] for r in rows}
+    seen = set()
+    ordered, skipped = [], []
+    for i in new_ids:
+        if i not in current:
+            skipped.append(i)
+        elif i not in seen:
+            seen.add(i)
+            ordered.append(i)
+    ordered.extend(r[0] for r in rows if r[0] not in seen)
+
+    changes, renumbered = plan_order(current, ordered)
+    with conn:
+        if changes:
+            conn.executemany(f"UPDATE {table} SET display_order = ? WHERE {id_col} = ?",
+                             [(v, i) for i, v in changes.items()])
+    return {"updated": len(changes), "renumbered": renumbered, "skipped": skipped}
+
+
+def diff_ordered_values(stored, values):
+    """
+    比對已存的有序清單與新送來的值清單 (例如卡片圖片的檔名)。
+    stored: [(row_id, value, display_order)]，依目前順序排列；values 可有重複值。
+    同值依序配對既有資料列，回傳 (要刪除的 row_id list, {row_id: 新 display_order},
+    [(value, display_order)] 要新增者)；順序沒變的資料列不會出現在結果中。
+    """
+    pool = {}
+    for row_id, value, _ in stored:
+        pool.setdefault(value, []).append(row_id)
+    ordered = []
+    for idx, value in enumerate(values):
+        ids = pool.get(value)
+        ordered.append(ids.pop(0) if ids else ("new", idx))
+    deletes = [row_id for ids in pool.values() for row_id in ids]
+    removed = set(deletes)
+    current = {row_id: order for row_id, _, order in stored if row_id not in removed}
+    changes, _ = plan_order(current, ordered)
+    updates = {i: v for i, v in changes.items() if not isinstance(i, tuple)}
+    inserts = [(values[i[1]], v) for i, v in changes.items() if isinstance(i, tuple)]
+    return deletes, updates, inserts
@@ -0,0 +1,111 @@
+# page_cache.py
+# -*- coding: utf-8 -*-
+"""
+預先 render + 預先壓縮的頁面快取
+
+首頁與 SOP / 各工具頁面的 HTML 不隨請求變動 (資料都由前端 fetch API 取得)，
+因此只在第一次 (或啟動 warm_up 時) render 一次，同時產生 gzip / brotli 版本放在記憶體，
+之後每個請求只依 Accept-Encoding 挑一份 bytes 回傳，並附 ETag 供 304。
+
+- 模板只編譯一次 (inline 模板用 compile_string 建立 Template 物件)
+- url_for 的結果與 script_root 有關，所以快取 key 含 script_root
+- 開啟 TEMPLATES_AUTO_RELOAD (或 debug) 時，模板檔案變更會自動重新 render
+- brotli 為選用套件 (pip install brotli)；未安裝時只提供 gzip
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import render_template, request, Response
+
+try:
+    import brotli
+except ImportError:  # brotli 為選用套件
+    brotli = None
+
+MIN_COMPRESS_SIZE = 1024
+
+
+class RenderedPage:
+    """一個頁面 render 後的結果: {encoding: bytes} 與對應的 ETag。"""
+
+    def __init__(self, html, mtime):
+        body = html.encode("utf-8")
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        self.mtime = mtime
+        self.bodies = {"identity": body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            self.bodies["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(body, mode=brotli.MODE_TEXT, quality=11)
+        self.etags = {enc: (digest if enc == "identity" else f"{digest}-{enc}") for enc in self.bodies}
+
+
+class PageCache:
+
+    def __init__(self, app):
+        self.app = app
+        self._pages = {}       # name -> (template, context 函式)
+        self._rendered = {}    # (name, script_root) -> RenderedPage
+        self._lock = threading.Lock()
+
+    def register(self, name, template, context=None):
+        """
+        template: templates/ 下的檔名，或 inline 模板字串 (以 '<' 開頭)。
+        context: 回傳 render 參數 dict 的函式 (只在 render 時呼叫一次)。
+        """
+        if template.lstrip().startswith("<"):
+            template = self.app.jinja_env.from_string(template)
+        self._pages[name] = (template, context)
+
+    def _template_mtime(self, template):
+        if isinstance(template, str):
+            template = self.app.jinja_env.get_template(template)
+        filename = template.filename
+        return os.path.getmtime(filename) if filename and os.path.exists(filename) else None
+
+    def _auto_reload(self):
+        return self.app.debug or self.app.config.get("TEMPLATES_AUTO_RELOAD")
+
+    def get(self, name):
+        """取得 render 後的頁面 (需在 request context 內呼叫)。"""
+        key = (name, request.script_root)
+        page = self._rendered.get(key)
+        template, context = self._pages[name]
+        if page is not None and not (self._auto_reload() and page.mtime != self._template_mtime(template)):
+            return page
+        with self._lock:
+            page = self._rendered.get(key)
+            mtime = self._template_mtime(template)
+            if page is None or (self._auto_reload() and page.mtime != mtime):
+                html = render_template(template, **(context() if context else {}))
+                page = RenderedPage(html, mtime)
+                self._rendered[key] = page
+        return page
+
+    def serve(self, name):
+        page = self.get(name)
+        encoding = "identity"
+        for enc in ("br", "gzip"):
+            if enc in page.bodies and request.accept_encodings[enc]:
+                encoding = enc
+                break
+        etag = page.etags[encoding]
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+        return Response(page.bodies[encoding], mimetype="text/html", headers=headers)
+
+    def clear(self):
+        """靜態檔案 manifest 或設定變更時呼叫，下次請求重新 render。"""
+        with self._lock:
+            self._rendered.clear()
+
+    def warm_up(self, base_url=None):
+        """啟動時先 render 所有頁面，第一個使用者不必等待。"""
+        with self.app.test_request_context("/", base_url=base_url):
+            for name in self._pages:
+                self.get(name)
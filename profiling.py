@@ -0,0 +1,344 @@
+# profiling.py
+# -*- coding: utf-8 -*-
+"""
+指定 request 的即時 profiling (只在 production 才慢、本機重現不了的呼叫)
+
+- 需設定 TOOL_PROFILE_TOKEN 才會啟用；觸發 profiling 與管理 API 都要帶同一個 token
+  (header X-Profile-Token 或 ?token=)
+- 觸發方式:
+    1. 單一 request 帶 header  X-Profile: cprofile | sample
+    2. 管理 API arm: POST /api/admin/profiles/arm
+           {"route": "/api/ctsv_gtsi/cards/list", "query": "section=GTSI", "mode": "sample", "count": 3, "ttl": 600}
+       之後符合的 request (所有 worker 共用 arm 檔) 自動 profile，做滿 count 次或 ttl 秒後失效；
+       route 可為 route 規則或路徑萬用字元 (例如 /api/waiver/*)
+- 模式:
+    cprofile: 決定性 profiler，存成 .prof (pstats 格式，python -m pstats / snakeviz 可開)；
+              Python 3.12 起 cProfile 會一併記錄同時段其他 thread 的呼叫
+    sample  : 每 SAMPLE_INTERVAL 秒取樣該 request thread 的 call stack，存成 collapsed stacks (.folded，
+              speedscope / flamegraph.pl 可讀)；額外開銷小，較接近真實耗時分布
+- 限流: 每個 process 以 token bucket 限制每分鐘最多 rate 個 profile，且同一時間只 profile 一個 request；
+  超過時 request 照常執行、不 profile (response header X-Profile-Status: skipped)
+- 每個 profile 另存 .json metadata (method / path / route / status / 耗時 / 熱點函式)；超過 max_profiles 份時刪除最舊的
+"""
+import cProfile
+import fnmatch
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，arm 次數只在同一 process 內精確
+    fcntl = None
+
+MODES = ("cprofile", "sample")
+SAMPLE_INTERVAL = 0.005
+DEFAULT_RATE = 6            # 每分鐘每個 process 最多幾個 profile
+DEFAULT_MAX_PROFILES = 200
+MAX_ARM_COUNT = 100
+MAX_ARM_TTL = 24 * 3600
+TOP_FUNCTIONS = 20
+ARM_FILE = "arm.json"
+PROFILE_ID_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$")
+EXTENSIONS = {"cprofile": ".prof", "sample": ".folded"}
+
+
+class ProfilingError(ValueError):
+    pass
+
+
+# ----------------------------------------
+# 單一 request 的 profiling
+# ----------------------------------------
+class _CProfileSession:
+    mode = "cprofile"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+    def top(self, limit=TOP_FUNCTIONS):
+        stats = pstats.Stats(self.profile)
+        rows = []
+        for (filename, line, func), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({"function": f"{func} ({os.path.basename(filename)}:{line})", "calls": calls,
+                         "self_ms": round(tottime * 1000, 3), "cumulative_ms": round(cumtime * 1000, 3)})
+        rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+        return rows[:limit]
+
+
+class _SampleSession:
+    """另開 thread 定期讀取目標 thread 的 frame (sys._current_frames)，累計相同 stack 的次數。"""
+    mode = "sample"
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.target = threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        codes = {}
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = codes.get(code)
+                if name is None:
+                    name = codes[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                stack.append(name)
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top(self, limit=TOP_FUNCTIONS):
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        return [{"function": name, "self_samples": count, "total_samples": total[name],
+                 "self_ms": round(count * self.interval * 1000, 1)} for name, count in own.most_common(limit)]
+
+
+# ----------------------------------------
+# Profiler (限流 / arm / 存檔)
+# ----------------------------------------
+class Profiler:
+    def __init__(self, directory, token=None, rate=DEFAULT_RATE, max_profiles=DEFAULT_MAX_PROFILES):
+        self.directory = directory
+        self.token = token or None
+        self.rate = max(0.0, float(rate))
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+        self._tokens = self.rate
+        self._refilled = time.monotonic()
+
+    @property
+    def enabled(self):
+        return self.token is not None
+
+    def check_token(self, value):
+        return self.enabled and hmac.compare_digest(str(value or ""), self.token)
+
+    # --- 觸發 ---
+    def begin(self, header, token, route, path, query):
+        """
+        依 header 或 arm 設定決定是否 profile 這個 request。回傳 (session, trigger):
+        不需 profile 時 (None, None)；需要但被限流 / 已有其他 request 在 profile 時 (None, trigger)。
+        """
+        if not self.enabled:
+            return None, None
+        if header:
+            mode = header.strip().lower()
+            mode = "cprofile" if mode in ("1", "true", "yes") else mode
+            if mode not in MODES or not self.check_token(token):
+                return None, None
+            trigger = "header"
+        else:
+            mode = self._match_arm(route, path, query)
+            if mode is None:
+                return None, None
+            trigger = "arm"
+        if not self._acquire():
+            return None, trigger
+        # arm 的次數在確定可以 profile 後才扣 (被限流的 request 不佔次數)
+        if trigger == "arm" and self._match_arm(route, path, query, consume=True) is None:
+            self._active.release()
+            return None, None
+        try:
+            return (_CProfileSession() if mode == "cprofile" else _SampleSession()), trigger
+        except Exception:
+            # 例如其他 profiler 已在執行 (Python 3.12 起 cProfile 一次只能有一個)
+            self._active.release()
+            return None, trigger
+
+    def _acquire(self):
+        """同一時間只 profile 一個 request，並以 token bucket 限制每分鐘次數。"""
+        if not self._active.acquire(blocking=False):
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._refilled) * self.rate / 60)
+            self._refilled = now
+            if self._tokens < 1:
+                self._active.release()
+                return False
+            self._tokens -= 1
+        return True
+
+    def finish(self, session, meta):
+        """停止 profiling 並存檔，回傳 profile id。"""
+        try:
+            session.stop()
+        finally:
+            self._active.release()
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.directory, exist_ok=True)
+        session.write(os.path.join(self.directory, profile_id + EXTENSIONS[session.mode]))
+        meta = dict(meta, id=profile_id, mode=session.mode, pid=os.getpid(), created=time.time(),
+                    top=session.top())
+        if session.mode == "sample":
+            meta["samples"] = session.samples
+            meta["interval_ms"] = session.interval * 1000
+        _write_json(os.path.join(self.directory, profile_id + ".json"), meta)
+        self._prune()
+        return profile_id
+
+    # --- arm (跨 worker 共用的檔案) ---
+    def _arm_path(self):
+        return os.path.join(self.directory, ARM_FILE)
+
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        handle = open(os.path.join(self.directory, ".lock"), "w")
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    def arm(self, route, mode="cprofile", count=1, ttl=600, query=None):
+        if mode not in MODES:
+            raise ProfilingError(f"mode 必須是 {' / '.join(MODES)}")
+        if not route:
+            raise ProfilingError("需指定 route")
+        count = int(count)
+        ttl = float(ttl)
+        if not 1 <= count <= MAX_ARM_COUNT:
+            raise ProfilingError(f"count 必須介於 1 ~ {MAX_ARM_COUNT}")
+        if not 0 < ttl <= MAX_ARM_TTL:
+            raise ProfilingError(f"ttl 必須介於 0 ~ {MAX_ARM_TTL} 秒")
+        state = {"route": route, "query": query or None, "mode": mode, "remaining": count,
+                 "expires": time.time() + ttl}
+        with self._lock, self._locked():
+            _write_json(self._arm_path(), state)
+        return state
+
+    def disarm(self):
+        with self._lock, self._locked():
+            try:
+                os.remove(self._arm_path())
+            except FileNotFoundError:
+                pass
+
+    def armed(self):
+        state = _read_json(self._arm_path())
+        if state and (state["remaining"] <= 0 or state["expires"] <= time.time()):
+            return None
+        return state
+
+    def _match_arm(self, route, path, query, consume=False):
+        # 沒有 arm 時每個 request 只多一次 os.path.exists
+        if not os.path.exists(self._arm_path()):
+            return None
+        with self._lock, self._locked():
+            state = self.armed()
+            if state is None:
+                return None
+            pattern = state["route"]
+            if not (route == pattern or fnmatch.fnmatchcase(path, pattern)):
+                return None
+            if state.get("query") and state["query"] not in (query or ""):
+                return None
+            if consume:
+                state["remaining"] -= 1
+                if state["remaining"] > 0:
+                    _write_json(self._arm_path(), state)
+                else:
+                    os.remove(self._arm_path())
+            return state["mode"]
+
+    # --- 查詢 / 下載 ---
+    def list(self):
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.endswith(".json") and PROFILE_ID_RE.match(name[:-5]):
+                meta = _read_json(os.path.join(self.directory, name))
+                if meta:
+                    profiles.append(meta)
+        return profiles
+
+    def get(self, profile_id):
+        """回傳 (metadata, profile 檔路徑)；不存在時 (None, None)。"""
+        if not PROFILE_ID_RE.match(profile_id or ""):
+            return None, None
+        meta = _read_json(os.path.join(self.directory, profile_id + ".json"))
+        if not meta:
+            return None, None
+        return meta, os.path.join(self.directory, profile_id + EXTENSIONS[meta["mode"]])
+
+    def text_report(self, profile_id, limit=80):
+        """cprofile: pstats 依 cumulative 排序的文字報表；sample: collapsed stacks 原文。"""
+        meta, path = self.get(profile_id)
+        if meta is None:
+            return None
+        if meta["mode"] == "sample":
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).strip_dirs().sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def delete(self, profile_id):
+        meta, path = self.get(profile_id)
+        if meta is None:
+            return False
+        for p in (path, os.path.join(self.directory, profile_id + ".json")):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+        return True
+
+    def _prune(self):
+        ids = sorted(name[:-5] for name in os.listdir(self.directory)
+                     if name.endswith(".json") and PROFILE_ID_RE.match(name[:-5]))
+        for profile_id in ids[:max(0, len(ids) - self.max_profiles)]:
+            self.delete(profile_id)
+
+
+def _write_json(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
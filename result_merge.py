@@ -0,0 +1,249 @@
+# result_merge.py
+# -*- coding: utf-8 -*-
+"""
+多份 test_result.xml 合併 (base run + 多次 run retry + 手動重跑的模組 / 分片執行)
+
+- 每個測項 (module, abi, class#test) 依 policy 決定最終結果:
+    best   : 任一次 pass 即為 pass (預設；送審時以最好的結果為準)
+    latest : 以最後一次執行的結果為準 (依 Result start 時間，相同時依檔案順序)
+- 外部排序: 逐檔串流讀取，每 CHUNK_RECORDS 筆排序後寫成暫存 run 檔，最後以 heapq.merge 多路合併；
+  run 檔太多時先分批合併 (MERGE_FAN_IN)，記憶體用量與測項總數無關
+- iter_merged() 逐筆產生合併後的最終結果，retry_commands.py 等也可直接使用
+
+用法:
+    python result_merge.py base.zip retry1.zip retry2.xml
+    python result_merge.py results/*.zip --policy latest --json merged.json
+"""
+import argparse
+import heapq
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+from xts_result import XtsResultReader, open_result
+
+CHUNK_RECORDS = 250_000
+MERGE_FAN_IN = 64
+BATCH_SIZE = 4096
+
+# best policy 的優先順序: pass > 不算失敗的結果 (ignored / assumption failure / skip) > fail
+RESULT_RANK = {"pass": 3, "ignored": 2, "assumption_failure": 2, "skip": 2, "skipped": 2, "fail": 1}
+POLICIES = ("best", "latest")
+
+MergedRecord = namedtuple("MergedRecord", "module abi test_class test_name result message session attempts results")
+
+
+# ----------------------------------------
+# 外部排序
+# ----------------------------------------
+def _write_run(records, tmpdir):
+    records.sort()
+    fd, path = tempfile.mkstemp(suffix=".run", dir=tmpdir)
+    with os.fdopen(fd, "wb") as f:
+        for i in range(0, len(records), BATCH_SIZE):
+            pickle.dump(records[i:i + BATCH_SIZE], f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                break
+            yield from batch
+    os.remove(path)
+
+
+def _merge_runs(paths, tmpdir, fan_in=MERGE_FAN_IN):
+    """run 檔超過 fan_in 時先分批合併成較大的 run 檔，避免同時開太多檔案。"""
+    while len(paths) > fan_in:
+        merged = []
+        for i in range(0, len(paths), fan_in):
+            group = paths[i:i + fan_in]
+            fd, path = tempfile.mkstemp(suffix=".run", dir=tmpdir)
+            with os.fdopen(fd, "wb") as f:
+                batch = []
+                for record in heapq.merge(*[_read_run(p) for p in group]):
+                    batch.append(record)
+                    if len(batch) >= BATCH_SIZE:
+                        pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                        batch = []
+                if batch:
+                    pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+            merged.append(path)
+        paths = merged
+    return heapq.merge(*[_read_run(p) for p in paths])
+
+
+# ----------------------------------------
+# 合併
+# ----------------------------------------
+class MergeInput:
+    """一份輸入結果 (session)。走訪完畢後 modules / result_attrs 等才完整。"""
+
+    def __init__(self, index, name, fileobj):
+        self.index = index
+        self.name = name
+        self.reader = XtsResultReader(fileobj)
+        self.records = 0
+
+    @property
+    def start(self):
+        return int(self.reader.result_attrs.get("start") or 0)
+
+    def info(self):
+        return {"name": self.name, "suite": self.reader.suite_name, "start": self.start or None,
+                "build_fingerprint": self.reader.build_attrs.get("build_fingerprint"),
+                "devices": self.reader.devices, "records": self.records, "modules": len(self.reader.modules)}
+
+
+def _resolve(group, policy):
+    if policy == "latest":
+        return group[-1]
+    return max(group, key=lambda r: (RESULT_RANK.get(r[7].lower(), 0), r[4], r[5], r[6]))
+
+
+def iter_merged(inputs, policy="best", tmpdir=None, chunk_records=CHUNK_RECORDS):
+    """
+    inputs: [MergeInput]。逐筆產生 MergedRecord (依 module, abi, class, test 排序)。
+    session 為最終結果來自的輸入名稱；attempts 為該測項被執行的次數；results 為各次結果 (依時間)。
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"policy 必須是 {' / '.join(POLICIES)}")
+    with tempfile.TemporaryDirectory(prefix="xts_merge_", dir=tmpdir) as work:
+        runs, buffer = [], []
+        for inp in inputs:
+            for rec in inp.reader.iter_tests():
+                # (排序鍵..., session 時間, session 序號, 檔案內序號, result, message)
+                # Result 是第一個元素，讀到測項時 start 已確定；同一測項的紀錄因此依執行時間排列
+                buffer.append((rec.module or "", rec.abi or "", rec.test_class or "", rec.test_name or "",
+                               inp.start, inp.index, inp.records, rec.result or "", rec.message))
+                inp.records += 1
+                if len(buffer) >= chunk_records:
+                    runs.append(_write_run(buffer, work))
+                    buffer = []
+        names = {inp.index: inp.name for inp in inputs}
+        if runs:
+            if buffer:
+                runs.append(_write_run(buffer, work))
+            stream = _merge_runs(runs, work)
+        else:
+            # 資料量小於一個 chunk 時不寫暫存檔
+            buffer.sort()
+            stream = iter(buffer)
+
+        key, group = None, []
+        for record in stream:
+            if record[:4] != key:
+                if group:
+                    yield _merged(group, policy, names)
+                key, group = record[:4], []
+            group.append(record)
+        if group:
+            yield _merged(group, policy, names)
+
+
+def _merged(group, policy, names):
+    final = _resolve(group, policy)
+    return MergedRecord(final[0], final[1] or None, final[2], final[3], final[7], final[8], names[final[5]],
+                        len(group), [r[7] for r in group])
+
+
+def merge_results(files, policy="best", tmpdir=None, chunk_records=CHUNK_RECORDS):
+    """
+    files: [(name, fileobj)]。回傳合併摘要:
+    sessions / summary / modules (各模組最終 pass / fail 數) / incomplete_modules / failures。
+    """
+    started = time.perf_counter()
+    inputs = [MergeInput(i, name, f) for i, (name, f) in enumerate(files)]
+    totals = {"tests": 0, "pass": 0, "fail": 0, "other": 0, "recovered": 0}
+    modules, failures = {}, []
+    for rec in iter_merged(inputs, policy, tmpdir, chunk_records):
+        outcome = rec.result.lower()
+        bucket = outcome if outcome in ("pass", "fail") else "other"
+        totals["tests"] += 1
+        totals[bucket] += 1
+        if outcome != "fail" and "fail" in rec.results:
+            totals["recovered"] += 1
+        counts = modules.setdefault((rec.module, rec.abi), {"pass": 0, "fail": 0, "other": 0})
+        counts[bucket] += 1
+        if outcome == "fail":
+            failures.append({"module": rec.module, "abi": rec.abi, "test": f"{rec.test_class}#{rec.test_name}",
+                             "message": rec.message, "session": rec.session, "attempts": rec.attempts})
+
+    # 模組在任一 session 跑完即視為完成
+    done = {}
+    for inp in inputs:
+        for key, info in inp.reader.modules.items():
+            done[key] = done.get(key, False) or info["done"]
+    incomplete = [{"module": m, "abi": abi} for (m, abi), is_done in sorted(done.items(), key=lambda kv: (
+        kv[0][0], kv[0][1] or "")) if not is_done]
+
+    sessions = [inp.info() for inp in inputs]
+    warnings = []
+    if len({s["suite"] for s in sessions}) > 1:
+        warnings.append("輸入的 suite 不一致")
+    if len({s["build_fingerprint"] for s in sessions}) > 1:
+        warnings.append("輸入的 build fingerprint 不一致")
+    return {
+        "policy": policy,
+        "sessions": sessions,
+        "summary": dict(totals, modules=len(done), incomplete_modules=len(incomplete)),
+        "modules": [dict(counts, module=m, abi=abi) for (m, abi), counts in
+                    sorted(modules.items(), key=lambda kv: (kv[0][0], kv[0][1] or ""))],
+        "incomplete_modules": incomplete,
+        "failures": failures,
+        "warnings": warnings,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def print_summary(report, out=sys.stdout):
+    for s in report["sessions"]:
+        print(f"  {s['name']}: {s['suite']} {s['records']} 測項 / {s['modules']} 模組", file=out)
+    s = report["summary"]
+    print(f"合併 ({report['policy']}): {s['tests']} 測項  pass {s['pass']}  fail {s['fail']}  其他 {s['other']}"
+          f"  (retry 後通過 {s['recovered']})  未完成模組 {s['incomplete_modules']}", file=out)
+    for w in report["warnings"]:
+        print(f"  ⚠️ {w}", file=out)
+    if report["failures"]:
+        print(f"\n== 剩餘 fail: {len(report['failures'])} ==", file=out)
+        for f in report["failures"]:
+            print(f"  {f['abi'] or ''} {f['module']}  {f['test']}  ({f['session']}, 執行 {f['attempts']} 次)", file=out)
+    for m in report["incomplete_modules"]:
+        print(f"  [未完成] {m['abi'] or ''} {m['module']}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge tradefed results from base / retry / rerun sessions")
+    parser.add_argument("results", nargs="+", help="test_result.xml 或 results zip")
+    parser.add_argument("--policy", choices=POLICIES, default="best")
+    parser.add_argument("--json", dest="json_path", help="輸出 JSON 摘要到指定路徑")
+    parser.add_argument("--tmpdir", help="暫存 run 檔的目錄 (預設為系統暫存目錄)")
+    parser.add_argument("--quiet", action="store_true", help="不列出每個 fail 測項")
+    args = parser.parse_args()
+
+    files = [(os.path.basename(p), open_result(p)) for p in args.results]
+    try:
+        report = merge_results(files, args.policy, args.tmpdir)
+    finally:
+        for _, f in files:
+            f.close()
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as out:
+            json.dump(report, out, ensure_ascii=False, indent=2)
+        print(f"已輸出 JSON 摘要: {args.json_path}")
+    if args.quiet:
+        report = dict(report, failures=[])
+    print_summary(report)
+    print(f"\n合併耗時 {report['elapsed_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+# retry_commands.py
+# -*- coding: utf-8 -*-
+"""
+由測試結果自動產生最精簡的 retry 指令 (取代手寫 run retry / 一長串 --include-filter)
+
+- 輸入可為多份結果 (base + 各次 retry)，先以 result_merge 合併 (best policy)，只重跑最後仍 fail 的測項
+- 每個模組 (ABI) 收斂成最少的 filter:
+    * 模組內全部 fail        -> --include-filter "abi Module"
+    * 某個 class 全部 fail   -> --include-filter "abi Module Class"
+    * 其餘                   -> --include-filter "abi Module Class#test"
+    * 大部分 fail 時改用「整個模組 + --exclude-filter 已通過的 class / 測項」，取 filter 數較少者
+    * 模組未跑完 (done=false) 時一律重跑整個模組並排除已通過的部分，避免漏掉沒跑到的測項
+- 各 ABI 的 filter 完全相同時合併成不帶 ABI 的 filter
+- 依 MAX_COMMAND_CHARS 分成多行指令；同一模組的 exclude 與其 include 一定放在同一行
+- 每行附上相關模組的 retry_tips (模組層級與該測項專屬的 tip)
+
+用法:
+    python retry_commands.py base.zip retry1.zip
+    python retry_commands.py test_result.xml --plan cts -s SERIAL1 --max-length 2000 --json retry.json
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from result_merge import MergeInput, iter_merged
+from triage import RetryTipMatcher
+from xts_result import open_result
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# tradefed console 單行指令的長度上限 (保守值；過長的指令會被截斷或無法貼上)
+MAX_COMMAND_CHARS = 4000
+# 預留給 run <plan>、--shard-count、-s <serial> 等非 filter 部分的長度
+COMMAND_RESERVE = 200
+
+
+def _filter(module, abi, target=None):
+    return " ".join(p for p in (abi, module, target) if p)
+
+
+def _option(kind, text):
+    return f'--{kind}-filter "{text}"'
+
+
+# ----------------------------------------
+# 收斂 filter
+# ----------------------------------------
+class ModuleRetry:
+    """單一 (module, abi) 的 retry 範圍: includes / excludes 為 filter 目標 (None 代表整個模組)。"""
+
+    def __init__(self, module, abi, level, includes, excludes=(), failed=0, total=0):
+        self.module = module
+        self.abi = abi
+        self.level = level
+        self.includes = list(includes)
+        self.excludes = list(excludes)
+        self.failed = failed
+        self.total = total
+        self.abis = [abi] if abi else []
+
+    def signature(self):
+        return self.level, tuple(self.includes), tuple(self.excludes)
+
+    def options(self):
+        # 合併 ABI 後 abi 為 None，filter 不帶 ABI
+        return ([_option("include", _filter(self.module, self.abi, t)) for t in self.includes] +
+                [_option("exclude", _filter(self.module, self.abi, t)) for t in self.excludes])
+
+
+def collapse(module, abi, classes, done=True, max_chars=MAX_COMMAND_CHARS):
+    """
+    classes: {class: [(test, failed)]}。回傳 ModuleRetry，沒有需要重跑的測項時回傳 None。
+    """
+    failed = sum(1 for tests in classes.values() for _, f in tests if f)
+    total = sum(len(tests) for tests in classes.values())
+    if done and not failed:
+        return None
+    if done and failed == total:
+        return ModuleRetry(module, abi, "module", [None], failed=failed, total=total)
+
+    # include 形式: 全 fail 的 class 收成一個 filter，其餘列出 fail 的測項
+    includes, excludes = [], []
+    for cls in sorted(classes):
+        tests = classes[cls]
+        bad = [t for t, f in tests if f]
+        if len(bad) == len(tests):
+            includes.append(cls)
+        else:
+            includes.extend(f"{cls}#{t}" for t in bad)
+        # exclude 形式: 排除沒有 fail 的 class，或 class 內沒有 fail 的測項
+        if not bad:
+            excludes.append(cls)
+        elif len(bad) < len(tests):
+            excludes.extend(f"{cls}#{t}" for t, f in tests if not f)
+
+    if not done:
+        # 未跑完: 整個模組重跑，只排除已 pass 的個別測項；
+        # class 裡還沒跑到的測項不在紀錄內，不能整個 class 排除。exclude 太長時乾脆不排除
+        passed = [f"{cls}#{t}" for cls in sorted(classes) for t, f in classes[cls] if not f]
+        fits = _exclude_length(module, abi, passed) <= max_chars - COMMAND_RESERVE
+        return ModuleRetry(module, abi, "incomplete", [None], passed if fits else (), failed, total)
+    # 有 exclude 的模組必須放在同一行，整組超過上限時不採用 exclude 形式
+    fits = _exclude_length(module, abi, excludes) <= max_chars - COMMAND_RESERVE
+    if fits and 1 + len(excludes) < len(includes):
+        return ModuleRetry(module, abi, "exclude", [None], excludes, failed, total)
+    level = "class" if all("#" not in t for t in includes) else "test"
+    return ModuleRetry(module, abi, level, includes, failed=failed, total=total)
+
+
+def _exclude_length(module, abi, excludes):
+    return len(_option("include", _filter(module, abi))) + \
+        sum(len(_option("exclude", _filter(module, abi, t))) + 1 for t in excludes)
+
+
+def _merge_abis(retries):
+    """同一模組各 ABI 的 filter 完全相同時合併成一個不帶 ABI 的項目。"""
+    if len(retries) > 1 and len({r.signature() for r in retries}) == 1 and all(r.abi for r in retries):
+        first = retries[0]
+        merged = ModuleRetry(first.module, None, first.level, first.includes, first.excludes,
+                             sum(r.failed for r in retries), sum(r.total for r in retries))
+        merged.abis = sorted(r.abi for r in retries)
+        return [merged]
+    return retries
+
+
+def iter_module_retries(inputs, max_chars=MAX_COMMAND_CHARS, tmpdir=None):
+    """
+    inputs: [MergeInput]。依模組順序產生 ModuleRetry (已合併 ABI)。
+    一次只保留一個模組的測項在記憶體中。
+    """
+    records = iter_merged(inputs, "best", tmpdir)
+    done, seen = None, set()
+    current, by_abi = None, {}
+
+    def flush():
+        retries = []
+        for abi in sorted(by_abi, key=lambda a: a or ""):
+            seen.add((current, abi))
+            r = collapse(current, abi, by_abi[abi], done.get((current, abi), True), max_chars)
+            if r is not None:
+                retries.append(r)
+        return _merge_abis(retries)
+
+    for rec in records:
+        if done is None:
+            # iter_merged 產生第一筆時所有輸入都已讀完，各模組的 done 狀態已確定
+            done = _done_modules(inputs)
+        if rec.module != current:
+            if current is not None:
+                yield from flush()
+            current, by_abi = rec.module, {}
+        tests = by_abi.setdefault(rec.abi, {}).setdefault(rec.test_class, [])
+        tests.append((rec.test_name, rec.result.lower() == "fail"))
+    if current is not None:
+        yield from flush()
+
+    # 沒有任何測項紀錄、也沒跑完的模組 (例如一開始就 crash)
+    done = done if done is not None else _done_modules(inputs)
+    pending = {}
+    for (module, abi), is_done in done.items():
+        if not is_done and (module, abi) not in seen:
+            pending.setdefault(module, []).append(ModuleRetry(module, abi, "incomplete", [None]))
+    for module in sorted(pending):
+        yield from _merge_abis(sorted(pending[module], key=lambda r: r.abi or ""))
+
+
+def _done_modules(inputs):
+    done = {}
+    for inp in inputs:
+        for key, info in inp.reader.modules.items():
+            done[key] = done.get(key, False) or info["done"]
+    return done
+
+
+# ----------------------------------------
+# 分行
+# ----------------------------------------
+def chunk_commands(retries, prefix, suffix="", max_chars=MAX_COMMAND_CHARS):
+    """
+    將各模組的 filter 依長度上限分成多行。回傳 [(command, [ModuleRetry])]。
+    只有 include 的模組可拆到不同行；有 exclude 的模組整組放在同一行。
+    """
+    base = len(prefix) + (len(suffix) + 1 if suffix else 0)
+    commands, parts, members, length = [], [], [], base
+
+    def emit():
+        nonlocal parts, members, length
+        if parts:
+            commands.append((" ".join([prefix] + parts + ([suffix] if suffix else [])), members))
+        parts, members, length = [], [], base
+
+    for r in retries:
+        options = r.options()
+        if r.excludes:
+            need = sum(len(o) + 1 for o in options)
+            if length + need > max_chars:
+                emit()
+            parts.extend(options)
+            members.append(r)
+            length += need
+            continue
+        for option in options:
+            if length + len(option) + 1 > max_chars and parts:
+                emit()
+            parts.append(option)
+            length += len(option) + 1
+            if not members or members[-1] is not r:
+                members.append(r)
+    emit()
+    return commands
+
+
+# ----------------------------------------
+# 產生
+# ----------------------------------------
+def _tips_for(tips, retry, failed_tests):
+    if tips is None:
+        return []
+    found = {tip["id"]: tip for tip in tips.match_module(retry.module)}
+    for test in failed_tests:
+        tip = tips.match(retry.module, test)
+        if tip is not None:
+            found.setdefault(tip["id"], tip)
+    return [{"module": retry.module, "type": t["type"], "condition": t["condition"], "trick": t["trick"]}
+            for t in found.values()]
+
+
+def build_retry_commands(files, tips=None, plan_name=None, serials=(), max_chars=MAX_COMMAND_CHARS, tmpdir=None):
+    """
+    files: [(name, fileobj)]；tips 為 RetryTipMatcher (可為 None)。
+    回傳 {"suite", "plan", "commands": [{command, modules, filters, tips}], "modules", "summary"}。
+    """
+    started = time.perf_counter()
+    inputs = [MergeInput(i, name, f) for i, (name, f) in enumerate(files)]
+    retries = []
+    failed_tests = {}
+    for r in iter_module_retries(inputs, max_chars, tmpdir):
+        retries.append(r)
+        # tip 比對只需要 fail 的測項名稱；整個模組重跑時以模組層級 tip 為準
+        failed_tests[id(r)] = [t for t in r.includes if t and "#" in t]
+
+    suite = next((inp.reader.suite_name for inp in inputs if inp.reader.suite_name), None)
+    name = plan_name or (suite or "cts").lower()
+    suffix = " ".join(f"-s {s}" for s in serials)
+    if len(serials) > 1:
+        suffix = f"--shard-count {len(serials)} {suffix}"
+
+    commands = []
+    for command, members in chunk_commands(retries, f"run {name}", suffix, max_chars):
+        tips_found = []
+        for r in members:
+            tips_found.extend(_tips_for(tips, r, failed_tests[id(r)]))
+        commands.append({
+            "command": command,
+            "length": len(command),
+            "modules": sorted({r.module for r in members}),
+            "filters": command.count("-filter "),
+            "tips": tips_found,
+        })
+
+    failed = sum(r.failed for r in retries)
+    return {
+        "suite": suite,
+        "plan": name,
+        "commands": commands,
+        "modules": [{"module": r.module, "abis": r.abis, "level": r.level, "failed": r.failed, "total": r.total,
+                     "include_filters": len(r.includes), "exclude_filters": len(r.excludes)} for r in retries],
+        "summary": {
+            "modules": len(retries),
+            "failed_tests": failed,
+            "include_filters": sum(len(r.includes) for r in retries),
+            "exclude_filters": sum(len(r.excludes) for r in retries),
+            # 逐一列出 fail 測項時需要的 filter 數，供比較
+            "naive_filters": failed,
+            "commands": len(commands),
+        },
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+# ----------------------------------------
+# CLI
+# ----------------------------------------
+def print_commands(report, out=sys.stdout):
+    s = report["summary"]
+    print(f"Suite: {report['suite'] or '-'}  需重跑模組 {s['modules']}  fail 測項 {s['failed_tests']}  "
+          f"filter {s['include_filters']} include / {s['exclude_filters']} exclude "
+          f"(逐一列出需 {s['naive_filters']})  指令 {s['commands']} 行", file=out)
+    for m in report["modules"]:
+        abis = ",".join(m["abis"]) or "-"
+        print(f"  {m['module']} [{abis}] {m['level']}: fail {m['failed']}/{m['total']}", file=out)
+    for i, c in enumerate(report["commands"], 1):
+        print(f"\n== 指令 {i} ({c['filters']} filter, {c['length']} 字元) ==", file=out)
+        print(c["command"], file=out)
+        for tip in c["tips"]:
+            condition = f" [{tip['condition']}]" if tip["condition"] else ""
+            print(f"  💡 {tip['module']}{condition}: {tip['trick']}", file=out)
+
+
+def _load_tips(path):
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return RetryTipMatcher.from_db(conn)
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate minimal retry commands from failed results")
+    parser.add_argument("results", nargs="+", help="test_result.xml 或 results zip (可多份，先合併)")
+    parser.add_argument("--db", default=os.path.join(BASE_DIR, "retry.db"), help="retry_tips 所在的資料庫")
+    parser.add_argument("--plan", dest="plan_name", help="tradefed plan 名稱 (預設為 suite 小寫，例如 cts)")
+    parser.add_argument("-s", "--serial", action="append", default=[], help="DUT serial，可重複")
+    parser.add_argument("--max-length", type=int, default=MAX_COMMAND_CHARS, help="單行指令長度上限")
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    files = [(os.path.basename(p), open_result(p)) for p in args.results]
+    try:
+        report = build_retry_commands(files, _load_tips(args.db), args.plan_name, args.serial, args.max_length)
+    finally:
+        for _, f in files:
+            f.close()
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as out:
+            json.dump(report, out, ensure_ascii=False, indent=2)
+    print_commands(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# search.py
+# -*- coding: utf-8 -*-
+"""
+全文搜尋 (SQLite FTS5)
+
+- waivers / retry_tips / test_cards 各自在所屬資料庫建立 external-content FTS5 表
+- 使用 trigram tokenizer，中文 (無空白斷詞) 與英文測項名稱都能做子字串搜尋
+- 以 AFTER INSERT / UPDATE / DELETE trigger 同步索引，不需要額外的排程
+- trigram 無法比對少於 3 個字的詞 (例如兩個中文字)：另建 <table>_grams FTS5 表，存每列的單字與雙字 gram
+  (編成 'g' + UTF-8 hex 的 token)，短詞直接比對 gram token，仍有索引與 bm25 排序
+- gram 需要在 Python 端切割，trigger 只把索引欄位有異動的 id 放進 <table>_gram_queue；
+  寫入端 (API、bulk 匯入、seed 同步) 在同一個 transaction 內呼叫 index_queued() 補上索引，
+  搜尋只讀不寫：佇列還有資料 (其他程式直接寫 DB) 時改用 LIKE 掃描，不會漏也不會搶寫入鎖
+- 跨資料庫合併時 bm25 無法直接比較，各來源先以該來源最佳分數正規化 (relevance 0~1) 再合併
+"""
+import sqlite3
+
+# 每個資料庫要索引的表: db_name -> (source table, fts table, 索引欄位, 顯示標題欄位)
+SEARCH_SOURCES = {
+    "waiver": ("waivers", "waivers_fts", ("suite", "waiver_id", "module", "test_case", "note"), "test_case"),
+    "retry": ("retry_tips", "retry_tips_fts", ("type", "module_case", "condition", "trick"), "module_case"),
+    "ctsv_gtsi": ("test_cards", "test_cards_fts", ("card_title", "card_subtitle", "content", "note"), "card_title"),
+}
+
+# trigram 最短可用索引的長度；更短的詞使用 gram 索引
+MIN_TRIGRAM_LEN = 3
+SNIPPET_TOKENS = 16
+GRAM_CHUNK = 500
+
+
+def _table_exists(conn, name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def ensure_search_index(conn, db_name):
+    """建立 FTS5 表與同步 trigger；第一次建立時從原表 rebuild 索引。由 migrations.py 在 transaction 內呼叫。"""
+    table, fts, cols, _ = SEARCH_SOURCES[db_name]
+    col_list = ", ".join(cols)
+    new_cols = ", ".join(f"new.{c}" for c in cols)
+    old_cols = ", ".join(f"old.{c}" for c in cols)
+
+    created = not _table_exists(conn, fts)
+    conn.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{col_list}, content='{table}', content_rowid='id', tokenize='trigram')"
+    )
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, {col_list}) VALUES (new.id, {new_cols});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.id, {old_cols});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.id, {old_cols});
+            INSERT INTO {fts}(rowid, {col_list}) VALUES (new.id, {new_cols});
+        END
+    """)
+    if created:
+        conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _gram_tables(db_name):
+    table = SEARCH_SOURCES[db_name][0]
+    return f"{table}_grams", f"{table}_gram_queue"
+
+
+def _gram_token(gram):
+    """FTS5 tokenizer 會切開標點與連續的中文，gram 一律編成單一英數 token。"""
+    return "g" + gram.encode("utf-8").hex()
+
+
+def _gram_text(values):
+    """各欄位 (分開處理，不跨欄位) 的單字與雙字 gram，以空白分隔。"""
+    tokens = []
+    for value in values:
+        text = str(value).lower() if value is not None else ""
+        for n in range(1, MIN_TRIGRAM_LEN):
+            for i in range(len(text) - n + 1):
+                gram = text[i:i + n]
+                if not any(c.isspace() for c in gram):
+                    tokens.append(_gram_token(gram))
+    return " ".join(tokens)
+
+
+def _gram_triggers(conn, db_name):
+    """只有索引欄位異動才放進佇列 (排序、區塊搬移等更新不需要重建 gram)。"""
+    table, _, cols, _ = SEARCH_SOURCES[db_name]
+    _, queue = _gram_tables(db_name)
+    events = (("ai", "INSERT", "new"), ("au", f"UPDATE OF {', '.join(cols)}", "new"), ("ad", "DELETE", "old"))
+    for suffix, event, ref in events:
+        conn.execute(f"DROP TRIGGER IF EXISTS {table}_gram_{suffix}")
+        conn.execute(f"""
+            CREATE TRIGGER {table}_gram_{suffix} AFTER {event} ON {table} BEGIN
+                INSERT OR IGNORE INTO {queue}(id) VALUES ({ref}.id);
+            END
+        """)
+
+
+def ensure_gram_index(conn, db_name):
+    """建立短詞用的 gram 索引、異動佇列與 trigger，並為既有資料建立索引。由 migrations.py 在 transaction 內呼叫。"""
+    table = SEARCH_SOURCES[db_name][0]
+    grams, queue = _gram_tables(db_name)
+    conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {grams} USING fts5(grams, tokenize='ascii')")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {queue} (id INTEGER PRIMARY KEY)")
+    _gram_triggers(conn, db_name)
+    conn.execute(f"INSERT OR IGNORE INTO {queue}(id) SELECT id FROM {table}")
+    _index_queued(conn, db_name)
+
+
+def update_gram_triggers(conn, db_name):
+    """既有資料庫的 trigger 換成只監看索引欄位的版本。由 migrations.py 在 transaction 內呼叫。"""
+    _gram_triggers(conn, db_name)
+    _index_queued(conn, db_name)
+
+
+def _index_queued(conn, db_name):
+    """重建佇列中各 id 的 gram (已刪除的資料列只移除)，完成後清空佇列。須在寫入 transaction 內呼叫。"""
+    table, _, cols, _ = SEARCH_SOURCES[db_name]
+    grams, queue = _gram_tables(db_name)
+    ids = [r[0] for r in conn.execute(f"SELECT id FROM {queue}")]
+    if not ids:
+        return 0
+    for i in range(0, len(ids), GRAM_CHUNK):
+        chunk = ids[i:i + GRAM_CHUNK]
+        marks = ",".join("?" for _ in chunk)
+        conn.execute(f"DELETE FROM {grams} WHERE rowid IN ({marks})", chunk)
+        rows = conn.execute(f"SELECT id, {', '.join(cols)} FROM {table} WHERE id IN ({marks})", chunk).fetchall()
+        conn.executemany(f"INSERT INTO {grams}(rowid, grams) VALUES (?, ?)",
+                         [(r[0], _gram_text(r[1:])) for r in rows])
+    conn.execute(f"DELETE FROM {queue}")
+    return len(ids)
+
+
+_DB_BY_TABLE = {source[0]: db_name for db_name, source in SEARCH_SOURCES.items()}
+
+
+def index_queued(conn, table):
+    """
+    寫入端呼叫: 在 commit 前補上這個 transaction 內異動列的 gram 索引 (與資料同時生效)。
+    table 不是搜尋來源，或索引尚未建立 (尚未 migrate) 時不做事；回傳處理的列數。
+    """
+    db_name = _DB_BY_TABLE.get(table)
+    if db_name is None or not _table_exists(conn, _gram_tables(db_name)[1]):
+        return 0
+    return _index_queued(conn, db_name)
+
+
+def gram_index_ready(conn, db_name):
+    """佇列為空才代表 gram 索引與資料一致；只讀查詢，不取得寫入鎖。"""
+    _, queue = _gram_tables(db_name)
+    return conn.execute(f"SELECT 1 FROM {queue} LIMIT 1").fetchone() is None
+
+
+def _split_terms(q):
+    return [t for t in (q or "").split() if t]
+
+
+def _fts_query(terms):
+    # 每個詞都包成 phrase，避免使用者輸入的 - * " 等被當成 FTS5 語法
+    return " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+def _make_snippet(text, terms, width=60):
+    """只有短字詞時 (gram 索引 / LIKE fallback) 無法使用 FTS5 snippet()，在 Python 端擷取。"""
+    text = text or ""
+    lower = text.lower()
+    for t in terms:
+        pos = lower.find(t.lower())
+        if pos >= 0:
+            start = max(0, pos - width // 2)
+            end = min(len(text), pos + len(t) + width // 2)
+            frag = text[start:pos] + "<mark>" + text[pos:pos + len(t)] + "</mark>" + text[pos + len(t):end]
+            return ("…" if start > 0 else "") + frag + ("…" if end < len(text) else "")
+    return text[:width]
+
+
+def search_db(conn, db_name, q, limit=20):
+    """在單一資料庫中搜尋，回傳依 bm25 排序的結果 (score 越小越相關)。"""
+    table, fts, cols, title_col = SEARCH_SOURCES[db_name]
+    terms = _split_terms(q)
+    if not terms:
+        return []
+    col_list = ", ".join(f"t.{c}" for c in cols)
+    long_terms = [t for t in terms if len(t) >= MIN_TRIGRAM_LEN]
+    short_terms = [t for t in terms if len(t) < MIN_TRIGRAM_LEN]
+    snippet = f"snippet({fts}, -1, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS snippet"
+
+    if not short_terms:
+        rows = conn.execute(
+            f"SELECT t.id, {col_list}, bm25({fts}) AS score, {snippet} "
+            f"FROM {fts} JOIN {table} t ON t.id = {fts}.rowid "
+            f"WHERE {fts} MATCH ? ORDER BY score LIMIT ?",
+            (_fts_query(terms), limit),
+        ).fetchall()
+        return [_to_result(db_name, r, cols, title_col, r["score"], r["snippet"]) for r in rows]
+
+    if gram_index_ready(conn, db_name):
+        grams, _ = _gram_tables(db_name)
+        gram_query = " ".join(_gram_token(t.lower()) for t in short_terms)
+        if long_terms:
+            # 長詞用 trigram、短詞用 gram 索引，兩者都符合才算 (與全部都是長詞時同為 AND)
+            rows = conn.execute(
+                f"SELECT t.id, {col_list}, bm25({fts}) + g.score AS score, {snippet} "
+                f"FROM {fts} JOIN {table} t ON t.id = {fts}.rowid "
+                f"JOIN (SELECT rowid, bm25({grams}) AS score FROM {grams} WHERE {grams} MATCH ?) g "
+                f"ON g.rowid = t.id WHERE {fts} MATCH ? ORDER BY score LIMIT ?",
+                (gram_query, _fts_query(long_terms), limit),
+            ).fetchall()
+            return [_to_result(db_name, r, cols, title_col, r["score"], r["snippet"]) for r in rows]
+        rows = conn.execute(
+            f"SELECT t.id, {col_list}, bm25({grams}) AS score "
+            f"FROM {grams} JOIN {table} t ON t.id = {grams}.rowid "
+            f"WHERE {grams} MATCH ? ORDER BY score LIMIT ?",
+            (gram_query, limit),
+        ).fetchall()
+        return [_to_result(db_name, r, cols, title_col, r["score"], _make_snippet(_row_text(r, cols), terms))
+                for r in rows]
+
+    # 佇列還有未索引的異動 (其他程式直接寫入 DB)，退回 LIKE 掃描 FTS 表，等下一次寫入時補上
+    any_col = "(" + " OR ".join(f"f.{c} LIKE ?" for c in cols) + ")"
+    where = " AND ".join([any_col] * len(terms))
+    params = []
+    for t in terms:
+        params.extend(["%" + t + "%"] * len(cols))
+    rows = conn.execute(
+        f"SELECT t.id, {col_list} FROM {fts} f JOIN {table} t ON t.id = f.rowid "
+        f"WHERE {where} ORDER BY t.id LIMIT ?",
+        params + [limit],
+    ).fetchall()
+    # 沒有 bm25 可用: 依 id 順序給遞增的分數，正規化後仍保留順序
+    return [_to_result(db_name, r, cols, title_col, -1.0 / (i + 1), _make_snippet(_row_text(r, cols), terms))
+            for i, r in enumerate(rows)]
+
+
+def _row_text(row, cols):
+    return " ".join(str(row[c]) for c in cols if row[c])
+
+
+def _to_result(db_name, row, cols, title_col, score, snippet):
+    return {
+        "source": db_name,
+        "id": row["id"],
+        "title": row[title_col],
+        "snippet": snippet,
+        "score": score,
+        "row": {c: row[c] for c in ("id",) + cols},
+    }
+
+
+def _normalize(results):
+    """
+    bm25 依各索引的統計量計算，不同資料庫之間無法比較：以該來源最佳分數為 1 換算 relevance (越大越相關)。
+    """
+    best = results[0]["score"] if results else 0
+    for rank, r in enumerate(results):
+        r["relevance"] = round(r["score"] / best, 4) if best < 0 else 1.0
+        r["rank"] = rank
+    return results
+
+
+def search_all(get_conn, q, limit=20, sources=None):
+    """跨 waiver / retry / ctsv_gtsi 三個資料庫搜尋，各來源分數正規化後合併排序。"""
+    results = []
+    for db_name in (sources or SEARCH_SOURCES):
+        if db_name not in SEARCH_SOURCES:
+            continue
+        conn = get_conn(db_name)
+        try:
+            results.extend(_normalize(search_db(conn, db_name, q, limit)))
+        except sqlite3.OperationalError:
+            # 索引尚未建立 (尚未跑過 init_db) 時略過該來源
+            pass
+        finally:
+            conn.close()
+    # relevance 相同時依各來源內的名次交錯
+    results.sort(key=lambda r: (-r["relevance"], r["rank"]))
+    for r in results:
+        del r["rank"]
+    return results[:limit]
@@ -0,0 +1,278 @@
+# seed_sync.py
+# -*- coding: utf-8 -*-
+"""
+固定資料 (seed) 的增量同步
+
+import_retry.py 的 RETRY_DATA 與 import_ctsv_gtsi.py 的卡片原本是「全部刪除再重新匯入」，
+會蓋掉使用者在網頁上的修改，而且每筆資料的 id 都會改變。這裡改為:
+
+- 每筆 seed 以自然鍵 (例如 type + module_case) 識別，內容算 hash
+- seed_state 表記錄「上次套用的 seed hash」與對應的資料列 id
+- 只對有差異的 seed 做 INSERT / UPDATE / DELETE，全部在同一個 transaction 內批次寫入，id 保持不變
+- 使用者改過的資料列 (目前內容與上次套用的 seed 不同) 不會被覆蓋或刪除，列為衝突 (--force 可強制覆蓋)
+- 使用者自己新增的資料列不在 seed_state 中，完全不受影響
+- 第一次同步 (認領舊版匯入的資料列) 時自然鍵先正規化 (去頭尾空白、合併空白、不分大小寫) 再比對；
+  資料表已有資料卻找不到對應列的 seed 不新增，列為衝突 (以 row_id 0 記在 seed_state)，
+  之後每次同步都會再嘗試認領並列出，直到以 --force 新增，避免產生只差空白或大小寫的重複資料
+- seed 沒有變動時只需要一次 seed_state 查詢，不寫入任何資料
+"""
+import hashlib
+import json
+import time
+
+from ordering import ORDER_GAP, diff_ordered_values
+from search import index_queued
+
+# seed_state.row_id 為此值: 第一次同步時找不到對應資料列、等待 --force 新增的 seed
+UNMATCHED_ROW_ID = 0
+
+
+def normalize_key_value(value):
+    """'GtsInteractiveOverUsbTestCases ' / 'SPECIAL' 與 'GtsInteractiveOverUsbTestCases' / 'Special' 視為同一鍵。"""
+    return " ".join(str(value).split()).casefold() if value is not None else ""
+
+
+def content_hash(values):
+    raw = json.dumps(values, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class TableSeed:
+    """
+    單一資料表的 seed。fields 為要同步的欄位，key_fields 為自然鍵 (同鍵重複時以出現順序區分)。
+    有子資料表 (例如卡片圖片) 的情況由子類別覆寫 read_rows / insert / update。
+    """
+
+    def __init__(self, source, table, fields, key_fields):
+        self.source = source
+        self.table = table
+        self.fields = tuple(fields)
+        self.key_fields = tuple(key_fields)
+
+    def values(self, record):
+        """參與比對的內容 (dict)。"""
+        return {f: record.get(f) or None for f in self.fields}
+
+    def keyed(self, records, normalize=False):
+        """
+        回傳 {seed_key: record}；同一自然鍵出現多次時加上序號。
+        normalize 時以 normalize_key_value 後的值組鍵 (只用於認領既有資料列，不存進 seed_state)。
+        """
+        seen, result = {}, {}
+        for record in records:
+            natural = [record.get(f) for f in self.key_fields]
+            if normalize:
+                natural = [normalize_key_value(v) for v in natural]
+            n = seen[tuple(natural)] = seen.get(tuple(natural), -1) + 1
+            result[json.dumps(natural + ([n] if n else []), ensure_ascii=False)] = record
+        return result
+
+    def read_rows(self, conn, row_ids):
+        """回傳 {row_id: values dict}，已刪除的資料列不會出現。"""
+        if not row_ids:
+            return {}
+        cols = ", ".join(self.fields)
+        result = {}
+        ids = list(row_ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            marks = ",".join("?" for _ in chunk)
+            for r in conn.execute(f"SELECT id, {cols} FROM {self.table} WHERE id IN ({marks})", chunk):
+                result[r[0]] = {f: r[j + 1] or None for j, f in enumerate(self.fields)}
+        return result
+
+    def find_by_key(self, conn):
+        """第一次同步時認領既有資料列: {正規化後的 seed_key: row_id}。"""
+        cols = ", ".join(self.fields)
+        rows = conn.execute(f"SELECT id, {cols} FROM {self.table} ORDER BY id").fetchall()
+        records = [dict(zip(self.fields, r[1:]), id=r[0]) for r in rows]
+        return {key: rec["id"] for key, rec in self.keyed(records, normalize=True).items()}
+
+    def insert(self, conn, records):
+        cols = ", ".join(self.fields)
+        marks = ", ".join("?" for _ in self.fields)
+        ids = []
+        for record in records:
+            v = self.values(record)
+            ids.append(conn.execute(f"INSERT INTO {self.table} ({cols}) VALUES ({marks})",
+                                    [v[f] for f in self.fields]).lastrowid)
+        return ids
+
+    def update(self, conn, pairs):
+        """pairs: [(row_id, record)]"""
+        set_clause = ", ".join(f"{f} = ?" for f in self.fields)
+        conn.executemany(f"UPDATE {self.table} SET {set_clause} WHERE id = ?",
+                         [[self.values(rec)[f] for f in self.fields] + [row_id] for row_id, rec in pairs])
+
+    def delete(self, conn, row_ids):
+        conn.executemany(f"DELETE FROM {self.table} WHERE id = ?", [(i,) for i in row_ids])
+
+
+class CardSeed(TableSeed):
+    """test_cards + card_images。新卡片依 seed 順序接在區塊最後，之後以使用者的拖曳排序為準。"""
+
+    def __init__(self):
+        super().__init__("ctsv_cards", "test_cards",
+                         ("section_key", "card_title", "card_subtitle", "content", "note"),
+                         ("section_key", "card_title"))
+
+    def values(self, record):
+        v = super().values(record)
+        v["image_urls"] = [u for u in record.get("image_urls") or [] if u]
+        return v
+
+    def read_rows(self, conn, row_ids):
+        result = super().read_rows(conn, row_ids)
+        for v in result.values():
+            v["image_urls"] = []
+        ids = list(result)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            marks = ",".join("?" for _ in chunk)
+            for r in conn.execute(f"SELECT card_id, filename FROM card_images WHERE card_id IN ({marks}) "
+                                  f"ORDER BY card_id, display_order, id", chunk):
+                result[r[0]]["image_urls"].append(r[1])
+        return result
+
+    def insert(self, conn, records):
+        ids = []
+        for record in records:
+            v = self.values(record)
+            row = conn.execute("SELECT MAX(display_order) FROM test_cards WHERE section_key = ?",
+                               (v["section_key"],)).fetchone()
+            order = (row[0] or 0) + ORDER_GAP
+            card_id = conn.execute(
+                "INSERT INTO test_cards (section_key, card_title, card_subtitle, content, note, display_order) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [v[f] for f in self.fields] + [order]).lastrowid
+            conn.executemany("INSERT INTO card_images (card_id, filename, display_order) VALUES (?, ?, ?)",
+                             [(card_id, url, ORDER_GAP * (i + 1)) for i, url in enumerate(v["image_urls"])])
+            ids.append(card_id)
+        return ids
+
+    def update(self, conn, pairs):
+        super().update(conn, pairs)
+        for card_id, record in pairs:
+            stored = conn.execute("SELECT id, filename, display_order FROM card_images WHERE card_id = ? "
+                                  "ORDER BY display_order, id", (card_id,)).fetchall()
+            deletes, moves, inserts = diff_ordered_values([tuple(r) for r in stored],
+                                                          self.values(record)["image_urls"])
+            conn.executemany("DELETE FROM card_images WHERE id = ?", [(i,) for i in deletes])
+            conn.executemany("UPDATE card_images SET display_order = ? WHERE id = ?",
+                             [(v, i) for i, v in moves.items()])
+            conn.executemany("INSERT INTO card_images (card_id, filename, display_order) VALUES (?, ?, ?)",
+                             [(card_id, url, order) for url, order in inserts])
+
+    def delete(self, conn, row_ids):
+        conn.executemany("DELETE FROM card_images WHERE card_id = ?", [(i,) for i in row_ids])
+        super().delete(conn, row_ids)
+
+
+RETRY_SEED = TableSeed("retry_tips", "retry_tips", ("type", "module_case", "condition", "trick"),
+                       ("type", "module_case"))
+CARD_SEED = CardSeed()
+
+
+# ----------------------------------------
+# 同步
+# ----------------------------------------
+def sync(conn, seed, records, dry_run=False, force=False):
+    """
+    將 records 同步到資料庫。回傳 summary dict:
+    inserted / updated / deleted / unchanged / conflicts (使用者改過而未覆蓋的 seed_key) /
+    unmatched (conflicts 中找不到對應資料列而未新增者) / elapsed_ms。
+    """
+    start = time.perf_counter()
+    wanted = seed.keyed(records)
+    hashes = {key: content_hash(seed.values(rec)) for key, rec in wanted.items()}
+    state = {r[0]: (r[1], r[2]) for r in conn.execute(
+        "SELECT seed_key, row_id, hash FROM seed_state WHERE source = ?", (seed.source,))}
+
+    summary = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0, "conflicts": [], "unmatched": []}
+    pending = {k for k in wanted if k in state and state[k][0] == UNMATCHED_ROW_ID}
+    new_keys = [k for k in wanted if k not in state or k in pending]
+    changed = [k for k in wanted if k in state and k not in pending and state[k][1] != hashes[k]]
+    removed = [k for k in state if k not in wanted]
+    summary["unchanged"] = len(wanted) - len(new_keys) - len(changed)
+    if not (new_keys or changed or removed):
+        summary["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return summary
+
+    # 目前資料列內容: 用來判斷使用者是否改過 (與上次套用的 seed hash 比較)
+    current = seed.read_rows(conn, [state[k][0] for k in changed + removed])
+    adopt = seed.find_by_key(conn) if new_keys else {}
+    normalized = dict(zip(wanted, seed.keyed(records, normalize=True))) if new_keys else {}
+    adopted_ids = {row_id for row_id, _ in state.values()}
+    # 第一次同步且資料表已有資料 (舊版匯入): 找不到對應列的 seed 不直接新增
+    first_adopt = not state and bool(adopt)
+
+    inserts, updates, deletes, new_state, drop_state = [], [], [], [], []
+    for key in new_keys:
+        row_id = adopt.get(normalized[key])
+        if row_id is not None and row_id not in adopted_ids:
+            # 既有資料列 (舊版匯入) 認領為 seed，內容不同才更新
+            adopted_ids.add(row_id)
+            if content_hash(seed.read_rows(conn, [row_id])[row_id]) != hashes[key]:
+                if not force:
+                    # 先不記錄: 記成 seed hash 下次會被當成「未變」，記成目前內容的 hash 下次又會被覆蓋；
+                    # 每次同步都列為衝突，直到內容與 seed 相同或以 --force 覆蓋
+                    summary["conflicts"].append(key)
+                    continue
+                updates.append((row_id, wanted[key]))
+            new_state.append((seed.source, key, row_id, hashes[key]))
+        elif (first_adopt or key in pending) and not force:
+            summary["conflicts"].append(key)
+            summary["unmatched"].append(key)
+            if key not in pending:
+                new_state.append((seed.source, key, UNMATCHED_ROW_ID, ""))
+        else:
+            inserts.append(key)
+    for key in changed:
+        row_id, old_hash = state[key]
+        row = current.get(row_id)
+        if row is None:
+            # 使用者刪除了該資料列: 尊重使用者，只更新 hash
+            new_state.append((seed.source, key, row_id, hashes[key]))
+        elif force or content_hash(row) == old_hash:
+            updates.append((row_id, wanted[key]))
+            new_state.append((seed.source, key, row_id, hashes[key]))
+        else:
+            summary["conflicts"].append(key)
+    for key in removed:
+        row_id, old_hash = state[key]
+        row = current.get(row_id)
+        if row is not None and not force and content_hash(row) != old_hash:
+            summary["conflicts"].append(key)
+            continue
+        if row is not None:
+            deletes.append(row_id)
+        drop_state.append((seed.source, key))
+
+    summary.update(inserted=len(inserts), updated=len(updates), deleted=len(deletes))
+    if not dry_run:
+        with conn:
+            if deletes:
+                seed.delete(conn, deletes)
+            if updates:
+                seed.update(conn, updates)
+            if inserts:
+                ids = seed.insert(conn, [wanted[k] for k in inserts])
+                new_state.extend((seed.source, k, i, hashes[k]) for k, i in zip(inserts, ids))
+            conn.executemany("DELETE FROM seed_state WHERE source = ? AND seed_key = ?", drop_state)
+            conn.executemany("INSERT OR REPLACE INTO seed_state (source, seed_key, row_id, hash) VALUES (?, ?, ?, ?)",
+                             new_state)
+            index_queued(conn, seed.table)
+    summary["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return summary
+
+
+def print_summary(name, summary, dry_run=False):
+    prefix = "[dry-run] " if dry_run else ""
+    print(f"{prefix}{name}: 新增 {summary['inserted']}、更新 {summary['updated']}、刪除 {summary['deleted']}、"
+          f"未變 {summary['unchanged']} ({summary['elapsed_ms']} ms)")
+    unmatched = set(summary.get("unmatched", ()))
+    for key in summary["conflicts"]:
+        if key in unmatched:
+            print(f"  ⚠️ 資料庫中找不到對應的資料列，未新增: {key} (使用 --force 新增)")
+        else:
+            print(f"  ⚠️ 網頁上已修改，未覆蓋: {key} (使用 --force 覆蓋)")
@@ -0,0 +1,167 @@
+# serve.py
+# -*- coding: utf-8 -*-
+"""
+Production 啟動程式 (gunicorn，多 worker)
+
+- preload: master process 先載入 app 並完成 schema 升級、static manifest、頁面快取、waiver 索引，
+  worker fork 後直接共用，不必各自重算；每個 worker 啟動後才建立自己的 SQLite 連線
+- gthread worker: 每個 worker 多個 thread，上傳大檔時不會卡住其他請求；
+  每個開著的頁面會以一條 /api/events (SSE) 連線佔用一個 thread，thread 數預設較多；
+  SSE 連線最多佔每個 worker 一半的 thread，超過時回 503，瀏覽器稍後重連
+- graceful reload (程式或模板更新後，不中斷服務):
+      python serve.py reload
+  會對 master 送 USR2 啟動新的 master (重新 preload)，新 worker 就緒後再讓舊 master 處理完手上的請求後結束
+
+用法:
+    python serve.py                          # 預設 0.0.0.0:5000，worker 數依 CPU 決定
+    python serve.py --workers 4 --threads 8 --bind 127.0.0.1:8000
+    python serve.py reload
+    python serve.py stop
+
+環境變數 TOOL_BIND / TOOL_WORKERS / TOOL_THREADS 可取代對應參數。
+需要 gunicorn (pip install gunicorn，僅支援 Linux / macOS)；Windows 請用 python 3PL.py。
+"""
+import argparse
+import os
+import signal
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PIDFILE = os.path.join(BASE_DIR, "gunicorn.pid")
+
+
+def default_workers():
+    return max(2, min(8, (os.cpu_count() or 1) * 2))
+
+
+def build_options(args):
+    return {
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": args.threads,
+        "preload_app": True,
+        "pidfile": args.pidfile,
+        # 大檔上傳 (MAX_CONTENT_LENGTH 500MB) 需要較長的 timeout
+        "timeout": 300,
+        "graceful_timeout": 30,
+        "keepalive": 5,
+        # 定期換掉 worker，避免長時間執行後記憶體持續成長
+        "max_requests": 5000,
+        "max_requests_jitter": 500,
+        "accesslog": args.access_log,
+        "post_fork": _post_fork,
+        "worker_exit": _worker_exit,
+        "child_exit": _child_exit,
+    }
+
+
+def _post_fork(server, worker):
+    import wsgi
+    wsgi.tool.init_worker(threads=server.cfg.threads)
+
+
+def _worker_exit(server, worker):
+    # worker 內: 寫出最後一次累計值
+    import wsgi
+    wsgi.tool.metrics.flush()
+
+
+def _child_exit(server, worker):
+    # master 內 (worker 被 kill 也會呼叫): 併入 aggregate 並刪除該 worker 的檔案
+    import wsgi
+    wsgi.tool.metrics.fold_worker(worker.pid)
+
+
+def run(args):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit("需要 gunicorn: pip install gunicorn (Windows 請改用 python 3PL.py)")
+
+    class ToolApplication(BaseApplication):
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if value is not None and key in self.cfg.settings:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            import wsgi
+            return wsgi.app
+
+    os.chdir(BASE_DIR)
+    sys.path.insert(0, BASE_DIR)
+    ToolApplication(build_options(args)).run()
+
+
+# ----------------------------------------
+# reload / stop
+# ----------------------------------------
+def _read_pid(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+def reload(pidfile, timeout=60):
+    old_pid = _read_pid(pidfile)
+    if not old_pid or not _alive(old_pid):
+        sys.exit(f"找不到執行中的 server ({pidfile})")
+    os.kill(old_pid, signal.SIGUSR2)
+    # 新 master 先寫入 <pidfile>.2，舊 master 結束後才改名為 <pidfile>
+    deadline = time.time() + timeout
+    new_pid = None
+    while time.time() < deadline:
+        pid = _read_pid(pidfile + ".2")
+        if pid and pid != old_pid and _alive(pid):
+            new_pid = pid
+            break
+        time.sleep(0.2)
+    if new_pid is None:
+        sys.exit("新的 master 沒有在時間內啟動，舊的 server 保持執行")
+    # 等新 worker 完成 preload 再讓舊 master 結束 (TERM = 處理完手上的請求後結束)
+    time.sleep(2)
+    os.kill(old_pid, signal.SIGTERM)
+    print(f"reload 完成: {old_pid} -> {new_pid}")
+
+
+def stop(pidfile):
+    pid = _read_pid(pidfile)
+    if not pid or not _alive(pid):
+        sys.exit(f"找不到執行中的 server ({pidfile})")
+    os.kill(pid, signal.SIGTERM)
+    print(f"已通知 {pid} 結束")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the tool with gunicorn (multi-worker)")
+    parser.add_argument("command", nargs="?", default="start", choices=["start", "reload", "stop"])
+    parser.add_argument("--bind", default=os.environ.get("TOOL_BIND", "0.0.0.0:5000"))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("TOOL_WORKERS", 0)) or default_workers())
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("TOOL_THREADS", 16)))
+    parser.add_argument("--pidfile", default=DEFAULT_PIDFILE)
+    parser.add_argument("--access-log", default=None, help="'-' 輸出到 stdout")
+    args = parser.parse_args()
+
+    if args.command == "reload":
+        reload(args.pidfile)
+    elif args.command == "stop":
+        stop(args.pidfile)
+    else:
+        run(args)
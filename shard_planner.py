@@ -0,0 +1,464 @@
+# shard_planner.py
+# -*- coding: utf-8 -*-
+"""
+CTS / GTS 模組分配規劃 (多台 DUT 同時跑)
+
+- ingest: 讀取 test_result.xml / results zip 中每個 Module 的 runtime，存入 retry.db 的
+  test_runs / module_runs；同一份結果重複匯入會略過
+- 估計: 每個 (abi, module) 取最近 HISTORY_RUNS 次「完成」執行的中位數；沒有完成紀錄時用觀察到的最長時間，
+  完全沒有紀錄時用所有模組的中位數 (標記為 estimated)
+- 分配: LPT (由長到短，每次放到目前負載最低的 DUT)，需要特殊環境的模組先排；最後以搬移 / 交換做局部改善
+- 環境限制: 模組層級的 retry_tips.condition 提到實體 SIM / Test SIM / eSIM / SD 卡時，
+  只會分配給具備該能力的 DUT (以 SERIAL:sim,sd_card 指定)
+- 輸出: 每台 DUT 一行 run <suite> --include-filter ... -s <serial>
+- validate: 對每筆歷史執行只用「該次之前」的資料重新規劃，比對預估與實際 wall-clock
+
+用法:
+    python shard_planner.py ingest results/*.zip
+    python shard_planner.py plan --suite CTS --dut SERIAL1:sim --dut SERIAL2 --dut SERIAL3:sd_card
+    python shard_planner.py plan --suite CTS -n 3 --exclude CtsDeqpTestCases --json plan.json
+    python shard_planner.py validate --suite CTS
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import statistics
+import sys
+import time
+
+from migrations import migrate
+from triage import RetryTipMatcher
+from xts_result import XtsResultReader, open_result
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+HISTORY_RUNS = 5
+SHARD_OVERHEAD_MS = 3 * 60 * 1000      # 每台 DUT 的 invocation 準備時間 (安裝、重開機、收 log)
+DEFAULT_MODULE_MS = 5 * 60 * 1000      # 完全沒有歷史資料時的模組時間
+MAX_REFINE_ROUNDS = 200
+
+# retry_tips.condition 關鍵字 -> DUT 能力
+CAPABILITY_PATTERNS = [
+    (re.compile(r"test\s*sim", re.I), "test_sim"),
+    (re.compile(r"(?<![a-z])e\s*sim", re.I), "esim"),
+    (re.compile(r"實體\s*sim", re.I), "sim"),
+    (re.compile(r"sd\s*(卡|card)", re.I), "sd_card"),
+]
+CAPABILITIES = sorted({cap for _, cap in CAPABILITY_PATTERNS})
+
+
+# ----------------------------------------
+# 匯入歷史執行時間
+# ----------------------------------------
+def ingest_result(conn, fileobj, source=None):
+    """回傳 {"run_id", "suite", "modules", "duplicate"}。"""
+    reader = XtsResultReader(fileobj).consume()
+    attrs = reader.result_attrs
+    suite = reader.suite_name
+    if not suite or not reader.modules:
+        raise ValueError("不是 tradefed test_result.xml (缺少 suite_name 或 Module)")
+    devices = reader.devices
+    started = int(attrs.get("start") or 0) or None
+    ended = int(attrs.get("end") or 0) or None
+    fingerprint = reader.build_attrs.get("build_fingerprint")
+    run_key = reader.run_key
+
+    with conn:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO test_runs (suite, run_key, build_fingerprint, devices, device_count, "
+            "started_at, ended_at, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (suite, run_key, fingerprint, ",".join(devices), max(1, len(devices)), started, ended, source))
+        if not cur.rowcount:
+            row = conn.execute("SELECT id FROM test_runs WHERE run_key = ?", (run_key,)).fetchone()
+            return {"run_id": row[0], "suite": suite, "modules": len(reader.modules), "duplicate": True}
+        run_id = cur.lastrowid
+        conn.executemany(
+            "INSERT OR REPLACE INTO module_runs (run_id, abi, module, runtime_ms, done, total_tests) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(run_id, abi or "", module, info["runtime_ms"], int(info["done"]), info["total"])
+             for (module, abi), info in reader.modules.items()])
+    return {"run_id": run_id, "suite": suite, "modules": len(reader.modules), "duplicate": False}
+
+
+# ----------------------------------------
+# 估計模組時間
+# ----------------------------------------
+class Estimate:
+    __slots__ = ("abi", "module", "duration_ms", "samples", "source")
+
+    def __init__(self, abi, module, duration_ms, samples, source):
+        self.abi = abi
+        self.module = module
+        self.duration_ms = duration_ms
+        self.samples = samples
+        self.source = source  # history / partial / default
+
+
+def estimate_durations(conn, suite, before=None, history_runs=HISTORY_RUNS):
+    """
+    回傳 {(abi, module): Estimate}，涵蓋該 suite 歷史中出現過的所有模組。
+    before (ms) 指定時只使用在此之前開始的執行 (驗證用)。
+    """
+    sql = ("SELECT m.abi, m.module, m.runtime_ms, m.done FROM module_runs m JOIN test_runs r ON r.id = m.run_id "
+           "WHERE r.suite = ? AND m.runtime_ms > 0")
+    params = [suite.upper()]
+    if before is not None:
+        sql += " AND r.started_at < ?"
+        params.append(before)
+    sql += " ORDER BY r.started_at DESC, r.id DESC"
+    done, partial = {}, {}
+    for abi, module, runtime_ms, is_done in conn.execute(sql, params):
+        key = (abi, module)
+        if is_done:
+            samples = done.setdefault(key, [])
+            if len(samples) < history_runs:
+                samples.append(runtime_ms)
+        else:
+            partial[key] = max(partial.get(key, 0), runtime_ms)
+
+    result = {}
+    for key, samples in done.items():
+        result[key] = Estimate(key[0], key[1], int(statistics.median(samples)), len(samples), "history")
+    for key, runtime_ms in partial.items():
+        if key not in result:
+            # 沒跑完過: 已知的最長時間只是下限
+            result[key] = Estimate(key[0], key[1], runtime_ms, 0, "partial")
+    return result
+
+
+def default_duration(estimates):
+    known = [e.duration_ms for e in estimates.values() if e.source == "history"]
+    return int(statistics.median(known)) if known else DEFAULT_MODULE_MS
+
+
+# ----------------------------------------
+# 環境限制
+# ----------------------------------------
+def condition_capabilities(condition):
+    return {cap for pattern, cap in CAPABILITY_PATTERNS if pattern.search(condition or "")}
+
+
+def module_requirements(tips, module):
+    """依 retry_tips (只看整個模組適用的 tip) 判斷模組需要的 DUT 能力。"""
+    required = set()
+    if tips is not None:
+        for tip in tips.match_module(module):
+            required |= condition_capabilities(tip.get("condition"))
+    return frozenset(required)
+
+
+def parse_dut(spec):
+    """'SERIAL:sim,sd_card' -> (serial, frozenset(caps))"""
+    name, _, caps = spec.partition(":")
+    caps = {c.strip().lower() for c in caps.split(",") if c.strip()}
+    unknown = caps - set(CAPABILITIES)
+    if unknown:
+        raise ValueError(f"未知的 DUT 能力 {sorted(unknown)}，可用: {', '.join(CAPABILITIES)}")
+    return name.strip(), frozenset(caps)
+
+
+# ----------------------------------------
+# 分配
+# ----------------------------------------
+class Unit:
+    __slots__ = ("abi", "module", "duration_ms", "requires", "source")
+
+    def __init__(self, abi, module, duration_ms, requires=frozenset(), source="history"):
+        self.abi = abi
+        self.module = module
+        self.duration_ms = duration_ms
+        self.requires = requires
+        self.source = source
+
+
+class Shard:
+    __slots__ = ("index", "serial", "caps", "units", "load_ms")
+
+    def __init__(self, index, serial=None, caps=frozenset()):
+        self.index = index
+        self.serial = serial
+        self.caps = caps
+        self.units = []
+        self.load_ms = 0
+
+    def add(self, unit):
+        self.units.append(unit)
+        self.load_ms += unit.duration_ms
+
+    def remove(self, unit):
+        self.units.remove(unit)
+        self.load_ms -= unit.duration_ms
+
+
+def assign(units, shards):
+    """
+    LPT: 可選 DUT 較少的模組先排，同一組內由長到短，每次放到負載最低的可用 DUT。
+    回傳無法分配 (沒有 DUT 具備所需能力) 的 units。
+    """
+    eligible = {id(u): [s for s in shards if u.requires <= s.caps] for u in units}
+    unassigned = [u for u in units if not eligible[id(u)]]
+    order = sorted((u for u in units if eligible[id(u)]),
+                   key=lambda u: (len(eligible[id(u)]), -u.duration_ms, u.module, u.abi))
+    for unit in order:
+        min(eligible[id(unit)], key=lambda s: (s.load_ms, s.index)).add(unit)
+    _refine(shards, eligible)
+    return unassigned
+
+
+def _refine(shards, eligible):
+    """從負載最高的 DUT 搬移或交換模組，直到最高負載無法再降低。"""
+    for _ in range(MAX_REFINE_ROUNDS):
+        worst = max(shards, key=lambda s: s.load_ms)
+        peak = worst.load_ms
+        if not _improve(worst, peak, eligible):
+            return
+
+
+def _improve(worst, peak, eligible):
+    for unit in sorted(worst.units, key=lambda u: -u.duration_ms):
+        for target in eligible[id(unit)]:
+            if target is worst:
+                continue
+            # 搬移
+            if target.load_ms + unit.duration_ms < peak:
+                worst.remove(unit)
+                target.add(unit)
+                return True
+            # 交換: 換回一個較短且 worst 也能跑的模組
+            for other in target.units:
+                delta = unit.duration_ms - other.duration_ms
+                if delta > 0 and target.load_ms + delta < peak and worst in eligible[id(other)]:
+                    worst.remove(unit)
+                    target.remove(other)
+                    target.add(unit)
+                    worst.add(other)
+                    return True
+    return False
+
+
+def include_filters(shard, abis_by_module):
+    """同一模組的所有 ABI 都在這台 DUT 上時合併成不帶 ABI 的 filter。"""
+    by_module = {}
+    for unit in shard.units:
+        by_module.setdefault(unit.module, set()).add(unit.abi)
+    filters = []
+    for module in sorted(by_module):
+        abis = by_module[module]
+        if abis == {""} or (len(abis) > 1 and abis >= abis_by_module.get(module, abis)):
+            filters.append(module)
+        else:
+            filters.extend(f"{abi} {module}" if abi else module for abi in sorted(abis))
+    return filters
+
+
+def shard_command(plan_name, shard, filters):
+    parts = [f"run {plan_name}"]
+    parts += [f'--include-filter "{f}"' for f in filters]
+    if shard.serial:
+        parts.append(f"-s {shard.serial}")
+    return " ".join(parts)
+
+
+def plan_shards(conn, suite, duts, tips=None, exclude=(), modules=None, plan_name=None,
+                overhead_ms=SHARD_OVERHEAD_MS):
+    """
+    duts: [(serial 或 None, caps)]。modules 指定時只規劃這些模組 (名稱)，否則為歷史中出現過的所有模組。
+    回傳 plan dict (見 print_plan)。
+    """
+    started = time.perf_counter()
+    estimates = estimate_durations(conn, suite)
+    fallback = default_duration(estimates)
+    exclude = {m.strip() for m in exclude if m.strip()}
+    wanted = {m.strip() for m in modules if m.strip()} if modules else None
+
+    abis_by_module, units = {}, []
+    for (abi, module), est in sorted(estimates.items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        if module in exclude or (wanted is not None and module not in wanted):
+            continue
+        abis_by_module.setdefault(module, set()).add(abi)
+        units.append(Unit(abi, module, est.duration_ms, module_requirements(tips, module), est.source))
+    # 指定了但歷史中沒有的模組: 以中位數估計，不分 ABI
+    for module in sorted((wanted or set()) - set(abis_by_module) - exclude):
+        units.append(Unit("", module, fallback, module_requirements(tips, module), "default"))
+
+    shards = [Shard(i, serial, caps) for i, (serial, caps) in enumerate(duts)]
+    if not shards:
+        raise ValueError("至少需要一台 DUT")
+    unassigned = assign(units, shards)
+
+    name = plan_name or suite.lower()
+    result_shards = []
+    for shard in shards:
+        filters = include_filters(shard, abis_by_module)
+        result_shards.append({
+            "serial": shard.serial,
+            "capabilities": sorted(shard.caps),
+            "estimated_ms": shard.load_ms + (overhead_ms if shard.units else 0),
+            "modules": len(shard.units),
+            "units": [{"abi": u.abi, "module": u.module, "duration_ms": u.duration_ms,
+                       "requires": sorted(u.requires), "source": u.source}
+                      for u in sorted(shard.units, key=lambda u: -u.duration_ms)],
+            "command": shard_command(name, shard, filters) if filters else None,
+        })
+    total = sum(shard.load_ms for shard in shards)
+    makespan = max(s["estimated_ms"] for s in result_shards)
+    return {
+        "suite": suite.upper(),
+        "plan": name,
+        "shards": result_shards,
+        "unassigned": [{"abi": u.abi, "module": u.module, "requires": sorted(u.requires)} for u in unassigned],
+        "summary": {
+            "modules": len(units),
+            "without_history": sum(1 for u in units if u.source == "default"),
+            "total_ms": total,
+            "estimated_makespan_ms": makespan,
+            # 理想平均 (完全平均分配) 與 makespan 的比值，越接近 1 越平均
+            "balance": round((total / len(shards) + overhead_ms) / makespan, 3) if makespan else 1.0,
+        },
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+# ----------------------------------------
+# 驗證
+# ----------------------------------------
+def validate(conn, suite, overhead_ms=SHARD_OVERHEAD_MS, history_runs=HISTORY_RUNS):
+    """
+    對每筆有開始 / 結束時間的歷史執行，只用該次之前的資料估計模組時間，依當次 DUT 數規劃，
+    比對預估 makespan 與實際 wall-clock；同時統計單一模組時間的預估誤差。
+    """
+    runs = conn.execute("SELECT id, started_at, ended_at, device_count FROM test_runs "
+                        "WHERE suite = ? AND started_at IS NOT NULL AND ended_at > started_at "
+                        "ORDER BY started_at", (suite.upper(),)).fetchall()
+    rows, module_errors = [], []
+    for run_id, started_at, ended_at, device_count in runs:
+        estimates = estimate_durations(conn, suite, before=started_at, history_runs=history_runs)
+        if not estimates:
+            continue
+        fallback = default_duration(estimates)
+        units, covered = [], 0
+        for abi, module, runtime_ms, done in conn.execute(
+                "SELECT abi, module, runtime_ms, done FROM module_runs WHERE run_id = ?", (run_id,)):
+            est = estimates.get((abi, module))
+            if est is not None:
+                covered += 1
+                if done and runtime_ms > 0 and est.source == "history":
+                    module_errors.append(abs(est.duration_ms - runtime_ms) / runtime_ms)
+            units.append(Unit(abi, module, est.duration_ms if est else fallback))
+        shards = [Shard(i) for i in range(device_count)]
+        assign(units, shards)
+        predicted = max(s.load_ms for s in shards) + overhead_ms
+        actual = ended_at - started_at
+        rows.append({"run_id": run_id, "devices": device_count, "modules": len(units),
+                     "coverage": round(covered / len(units), 3) if units else 0.0,
+                     "predicted_ms": predicted, "actual_ms": actual,
+                     "error": round((predicted - actual) / actual, 3)})
+    errors = [abs(r["error"]) for r in rows]
+    return {
+        "suite": suite.upper(),
+        "runs": rows,
+        "summary": {
+            "runs": len(rows),
+            "wall_clock_mape": round(statistics.mean(errors), 3) if errors else None,
+            "module_median_error": round(statistics.median(module_errors), 3) if module_errors else None,
+            # 實際與「不含 overhead 的預估」差距的中位數，可用來調整 --overhead-min
+            "suggested_overhead_ms": int(statistics.median(
+                [r["actual_ms"] - (r["predicted_ms"] - overhead_ms) for r in rows])) if rows else None,
+        },
+    }
+
+
+# ----------------------------------------
+# CLI
+# ----------------------------------------
+def _fmt_ms(ms):
+    minutes = round(ms / 60000)
+    return f"{minutes // 60}h{minutes % 60:02d}m"
+
+
+def print_plan(plan, out=sys.stdout):
+    s = plan["summary"]
+    print(f"Suite: {plan['suite']}  模組: {s['modules']} (無歷史資料 {s['without_history']})  "
+          f"預估總時間 {_fmt_ms(s['estimated_makespan_ms'])}  平均度 {s['balance']}", file=out)
+    for i, shard in enumerate(plan["shards"], 1):
+        caps = f" [{', '.join(shard['capabilities'])}]" if shard["capabilities"] else ""
+        print(f"\n== DUT {i}: {shard['serial'] or '-'}{caps}  {shard['modules']} 模組  "
+              f"預估 {_fmt_ms(shard['estimated_ms'])} ==", file=out)
+        print(shard["command"] or "(沒有分配到模組)", file=out)
+    for u in plan["unassigned"]:
+        print(f"  ⚠️ 無法分配 (沒有 DUT 具備 {', '.join(u['requires'])}): {u['abi']} {u['module']}".rstrip(),
+              file=out)
+
+
+def print_validation(report, out=sys.stdout):
+    for r in report["runs"]:
+        print(f"  run {r['run_id']}: {r['devices']} DUT, {r['modules']} 模組 (有歷史 {r['coverage']:.0%})  "
+              f"預估 {_fmt_ms(r['predicted_ms'])} / 實際 {_fmt_ms(r['actual_ms'])}  誤差 {r['error']:+.1%}", file=out)
+    s = report["summary"]
+    if not s["runs"]:
+        print("沒有可驗證的歷史執行 (至少需要兩次有開始 / 結束時間的執行)", file=out)
+        return
+    module_error = "-" if s["module_median_error"] is None else f"{s['module_median_error']:.1%}"
+    print(f"{report['suite']}: {s['runs']} 次執行，wall-clock 平均誤差 {s['wall_clock_mape']:.1%}，"
+          f"單一模組誤差中位數 {module_error}，建議 overhead {_fmt_ms(s['suggested_overhead_ms'])}", file=out)
+
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Duration-aware module sharding planner for multiple DUTs")
+    parser.add_argument("--db", default=os.path.join(BASE_DIR, "retry.db"))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_ingest = sub.add_parser("ingest", help="匯入 test_result.xml / results zip 的模組執行時間")
+    p_ingest.add_argument("results", nargs="+")
+
+    p_plan = sub.add_parser("plan", help="產生各 DUT 的 run 指令")
+    p_plan.add_argument("--suite", required=True)
+    p_plan.add_argument("--dut", action="append", default=[], help="SERIAL[:sim,test_sim,esim,sd_card]，可重複")
+    p_plan.add_argument("-n", "--count", type=int, help="不指定 serial 時的 DUT 數")
+    p_plan.add_argument("--exclude", action="append", default=[], help="排除的模組，可重複")
+    p_plan.add_argument("-m", "--module", action="append", default=None, help="只規劃指定模組，可重複")
+    p_plan.add_argument("--plan", dest="plan_name", help="tradefed plan 名稱 (預設為 suite 小寫，例如 cts)")
+    p_plan.add_argument("--overhead-min", type=float, default=SHARD_OVERHEAD_MS / 60000)
+    p_plan.add_argument("--json", dest="json_path")
+
+    p_validate = sub.add_parser("validate", help="以歷史執行驗證預估時間")
+    p_validate.add_argument("--suite", required=True)
+    p_validate.add_argument("--overhead-min", type=float, default=SHARD_OVERHEAD_MS / 60000)
+    args = parser.parse_args()
+
+    migrate(args.db, "retry")
+    conn = _connect(args.db)
+    try:
+        if args.command == "ingest":
+            for path in args.results:
+                with open_result(path) as f:
+                    r = ingest_result(conn, f, source=os.path.basename(path))
+                note = " (已匯入過，略過)" if r["duplicate"] else ""
+                print(f"{path}: {r['suite']} {r['modules']} 模組{note}")
+        elif args.command == "plan":
+            duts = [parse_dut(d) for d in args.dut] + [(None, frozenset())] * (args.count or 0)
+            plan = plan_shards(conn, args.suite, duts, RetryTipMatcher.from_db(conn), exclude=args.exclude,
+                               modules=args.module, plan_name=args.plan_name,
+                               overhead_ms=int(args.overhead_min * 60000))
+            if args.json_path:
+                with open(args.json_path, "w", encoding="utf-8") as out:
+                    json.dump(plan, out, ensure_ascii=False, indent=2)
+            print_plan(plan)
+        else:
+            print_validation(validate(conn, args.suite, overhead_ms=int(args.overhead_min * 60000)))
+    except ValueError as e:
+        sys.exit(str(e))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+// live_events.js
+// 訂閱 /api/events (Server-Sent Events)，把其他人 (或自己) 的新增 / 修改 / 刪除直接套用到頁面手上的資料，
+// 不必在每次編輯後重新抓整份 list。
+//
+//   const live = LiveEvents.connect(['retry_tips', 'suites'], {
+//       onChange(event) { ... },      // {table, op: insert/update/delete/reorder/bulk, row / row_id / items}
+//       onResync(table) { ... },      // 無法補送漏掉的事件時 (table 為 '*' 代表全部)，重新載入該表
+//   });
+//   if (!live.isOpen()) loadAllData();   // 即時連線未建立時仍退回重新載入
+(function (global) {
+    'use strict';
+
+    const EVENTS_URL = '/api/events';
+    const BUSY_RETRY_MS = 30000;   // server 訂閱者已滿 (503) 時的重連間隔
+
+    function connect(tables, handlers) {
+        let source = null;
+        let open = false;
+        let closed = false;
+        let restarted = false;      // 重新建立的連線沒有 Last-Event-ID，開啟後整個重新載入
+        let pending = [];
+        let scheduled = false;
+
+        // 同一個 frame 內收到的事件合併處理，最後只重畫一次
+        function flush() {
+            scheduled = false;
+            const batch = pending;
+            pending = [];
+            const resync = new Set();
+            batch.forEach(event => {
+                if (event.op === 'resync' || event.op === 'bulk') {
+                    resync.add(event.table);
+                } else if (!resync.has(event.table) && !resync.has('*')) {
+                    handlers.onChange(event);
+                }
+            });
+            if (resync.has('*')) {
+                handlers.onResync('*');
+            } else {
+                resync.forEach(table => handlers.onResync(table));
+            }
+            if (handlers.onBatch) handlers.onBatch(batch);
+        }
+
+        function start() {
+            if (typeof EventSource === 'undefined') return;
+            const query = tables && tables.length ? `?tables=${encodeURIComponent(tables.join(','))}` : '';
+            source = new EventSource(EVENTS_URL + query);
+            source.onopen = () => {
+                open = true;
+                if (restarted) {
+                    restarted = false;
+                    handlers.onResync('*');
+                }
+            };
+            source.onerror = () => {
+                // 連線中斷時 EventSource 會依 retry 自動重連並帶 Last-Event-ID；
+                // 收到 503 (訂閱者已滿) 則進入 CLOSED 不再重連，由這裡稍後重新建立
+                open = false;
+                if (source.readyState === EventSource.CLOSED && !closed) {
+                    source = null;
+                    restarted = true;
+                    setTimeout(() => { if (!closed) start(); }, BUSY_RETRY_MS);
+                }
+            };
+            source.addEventListener('change', message => {
+                let event;
+                try {
+                    event = JSON.parse(message.data);
+                } catch (e) {
+                    return;
+                }
+                pending.push(event);
+                if (!scheduled) {
+                    scheduled = true;
+                    (global.requestAnimationFrame || setTimeout)(flush);
+                }
+            });
+        }
+
+        start();
+        return {
+            isOpen: () => open && source && source.readyState === EventSource.OPEN,
+            close: () => { closed = true; if (source) source.close(); open = false; },
+        };
+    }
+
+    // 將 insert / update / delete / reorder 套用到陣列 (依 key 欄位比對)，回傳新陣列
+    // compare 為排序函式 (例如依 display_order)，不指定則保持原順序、新資料接在最後
+    function applyToList(list, event, key = 'id', compare = null) {
+        let result = list;
+        if (event.op === 'insert' || event.op === 'update') {
+            const row = event.row;
+            const idx = list.findIndex(item => item[key] === row[key]);
+            result = idx >= 0 ? list.map((item, i) => (i === idx ? row : item)) : list.concat([row]);
+        } else if (event.op === 'delete') {
+            result = list.filter(item => item[key] !== event.row_id);
+        } else if (event.op === 'reorder') {
+            const updates = new Map(event.items.map(item => [item[key], item]));
+            result = list.map(item => (updates.has(item[key]) ? Object.assign({}, item, updates.get(item[key])) : item));
+        }
+        if (compare) {
+            result = result.slice().sort(compare);
+        }
+        return result;
+    }
+
+    // 以 /api/<resource>/changes 增量同步 state = {items, cursor}: 只下載 cursor 之後有變動的資料列，
+    // 第一次 (cursor 為 null) 或 cursor 失效時 server 回 reset 與全部資料
+    async function syncList(url, state, key = 'id', compare = null) {
+        let hasMore = true;
+        while (hasMore) {
+            const query = state.cursor ? `?since=${encodeURIComponent(state.cursor)}` : '';
+            const resp = await fetch(url + query);
+            if (!resp.ok) throw new Error(`${url}: HTTP ${resp.status}`);
+            const page = await resp.json();
+            const byKey = new Map((page.reset ? [] : state.items).map(item => [item[key], item]));
+            page.deletes.forEach(k => byKey.delete(k));
+            page.upserts.forEach(item => byKey.set(item[key], item));
+            state.items = Array.from(byKey.values());
+            if (compare) state.items.sort(compare);
+            state.cursor = page.cursor;
+            hasMore = page.has_more;
+        }
+        return state;
+    }
+
+    global.LiveEvents = {connect, applyToList, syncList};
+})(window);
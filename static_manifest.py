@@ -0,0 +1,111 @@
+# static_manifest.py
+# -*- coding: utf-8 -*-
+"""
+靜態檔案指紋 (fingerprint) manifest
+
+- 掃描 static/ 下的檔案計算內容 hash，url_for('static', filename=...) 自動加上 ?v=<hash>
+- 帶有正確 hash 的請求回傳 Cache-Control: immutable (一年)，瀏覽器不再重新驗證；
+  檔案內容變了 hash 就變，網址也跟著變
+- manifest 存在 .static_manifest.json，啟動時以 (mtime, size) 判斷，只重算有變動的檔案
+- static/uploads/ 已經是 content-addressed 檔名、以 . 開頭的目錄 (.derivatives 等) 為衍生檔，都不列入
+"""
+import hashlib
+import json
+import os
+import threading
+
+from flask import request
+
+HASH_LENGTH = 12
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+SKIP_DIRS = ("uploads",)
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(1 << 20), b""):
+            h.update(buf)
+    return h.hexdigest()[:HASH_LENGTH]
+
+
+class StaticManifest:
+
+    def __init__(self, static_root, cache_path):
+        self.static_root = static_root
+        self.cache_path = cache_path
+        self._entries = {}     # 相對路徑 -> [mtime, size, hash]
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def _walk(self):
+        for root, dirs, files in os.walk(self.static_root):
+            rel_root = os.path.relpath(root, self.static_root)
+            dirs[:] = [d for d in dirs if not d.startswith(".") and not (rel_root == "." and d in SKIP_DIRS)]
+            for name in files:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, self.static_root).replace(os.sep, "/"), path
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def build(self):
+        """
+        增量重建: (mtime, size) 沒變的檔案沿用上次的 hash。
+        回傳 {"files": n, "hashed": 重算數, "removed": 刪除數, "changed": bool}。
+        """
+        with self._lock:
+            previous = self._entries or self._read_cache()
+            entries, hashed = {}, 0
+            for rel, path in self._walk():
+                st = os.stat(path)
+                old = previous.get(rel)
+                if old and old[0] == st.st_mtime and old[1] == st.st_size:
+                    entries[rel] = old
+                else:
+                    entries[rel] = [st.st_mtime, st.st_size, file_hash(path)]
+                    hashed += 1
+            removed = len(set(previous) - set(entries))
+            changed = entries != previous
+            self._entries = entries
+            self.loaded = True
+            if changed:
+                tmp = self.cache_path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(entries, f)
+                os.replace(tmp, self.cache_path)
+        return {"files": len(entries), "hashed": hashed, "removed": removed, "changed": changed}
+
+    def get(self, rel_path):
+        """回傳檔案的 hash，不在 manifest 中則回傳 None。"""
+        if not self.loaded:
+            self.build()
+        entry = self._entries.get(rel_path)
+        return entry[2] if entry else None
+
+    def init_app(self, app):
+        """url_for('static') 自動加上 ?v=<hash>，帶正確 hash 的回應改為長期快取。"""
+
+        @app.url_defaults
+        def _fingerprint(endpoint, values):
+            if endpoint == "static" and "v" not in values:
+                digest = self.get(values.get("filename") or "")
+                if digest:
+                    values["v"] = digest
+
+        @app.after_request
+        def _immutable(response):
+            if request.endpoint == "static" and response.status_code in (200, 206, 304):
+                v = request.args.get("v")
+                if v and v == self.get((request.view_args or {}).get("filename", "")):
+                    response.cache_control.public = True
+                    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+                    response.cache_control.immutable = True
+                    response.cache_control.no_cache = None
+            return response
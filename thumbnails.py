@@ -0,0 +1,161 @@
+# thumbnails.py
+# -*- coding: utf-8 -*-
+"""
+卡片圖片縮圖 / WebP 衍生檔
+
+- 每張圖片產生固定寬度 (THUMB_SIZES) 的縮圖，原格式與 WebP 各一份
+- 衍生檔快取在 static/.derivatives/<寬度>/<原相對路徑>.<格式>，來源檔更新 (mtime 較新) 時才重建
+- 上傳時丟到 process pool 背景產生；既有檔案可用本檔 CLI 一次補齊:
+      python thumbnails.py            # 掃描 static/ 下所有圖片
+      python thumbnails.py --workers 8
+- 需要 Pillow (pip install Pillow)；未安裝時 /thumb 直接回傳原圖
+"""
+import argparse
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 為選用套件
+    Image = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_ROOT = os.path.join(BASE_DIR, "static")
+DERIVATIVE_DIRNAME = ".derivatives"
+
+THUMB_SIZES = (160, 320, 640, 1280)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+_pool = None
+
+
+def is_image(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def pick_size(requested):
+    """把任意 size 對應到最接近且不小於它的固定寬度，避免產生無限多種衍生檔。"""
+    for s in THUMB_SIZES:
+        if requested <= s:
+            return s
+    return THUMB_SIZES[-1]
+
+
+def derivative_path(static_root, rel_path, size, fmt):
+    base = os.path.join(static_root, DERIVATIVE_DIRNAME, str(size), *rel_path.split("/"))
+    return base + "." + fmt
+
+
+def _source_format(rel_path):
+    ext = rel_path.rsplit(".", 1)[-1].lower()
+    return "jpg" if ext in ("jpg", "jpeg") else ("png" if ext in ("png", "gif", "bmp") else ext)
+
+
+def _is_fresh(src, dst):
+    return os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src)
+
+
+def generate_derivatives(static_root, rel_path, sizes=THUMB_SIZES):
+    """
+    產生 rel_path 的所有衍生檔，回傳新產生的檔案數。
+    在 process pool 中執行，所以只用可 pickle 的參數。
+    """
+    if Image is None:
+        return 0
+    src = os.path.join(static_root, *rel_path.split("/"))
+    if not os.path.isfile(src) or not is_image(src):
+        return 0
+    created = 0
+    with Image.open(src) as im:
+        im.load()
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "transparency" in im.info else "RGB")
+        for size in sizes:
+            targets = [(fmt, derivative_path(static_root, rel_path, size, fmt))
+                       for fmt in (_source_format(rel_path), "webp")]
+            targets = [(fmt, dst) for fmt, dst in targets if not _is_fresh(src, dst)]
+            if not targets:
+                continue
+            thumb = im.copy()
+            if thumb.width > size:
+                thumb.thumbnail((size, size * 10), Image.LANCZOS)
+            for fmt, dst in targets:
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                # 上傳背景產生與請求當下產生可能同時進行，暫存檔名需各自獨立
+                tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+                if fmt == "webp":
+                    thumb.save(tmp, "WEBP", quality=WEBP_QUALITY, method=4)
+                elif fmt == "jpg":
+                    thumb.convert("RGB").save(tmp, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+                else:
+                    thumb.save(tmp, "PNG", optimize=True)
+                os.replace(tmp, dst)
+                created += 1
+    return created
+
+
+def get_derivative(static_root, rel_path, size, accept_webp):
+    """
+    取得 (或當場產生) 衍生檔。回傳 (絕對路徑, mimetype)；無法產生時回傳 (None, None)，
+    由呼叫端改送原圖。
+    """
+    if Image is None or not is_image(rel_path):
+        return None, None
+    size = pick_size(size)
+    fmt = "webp" if accept_webp else _source_format(rel_path)
+    dst = derivative_path(static_root, rel_path, size, fmt)
+    src = os.path.join(static_root, *rel_path.split("/"))
+    if not _is_fresh(src, dst):
+        try:
+            generate_derivatives(static_root, rel_path, sizes=(size,))
+        except (OSError, ValueError):
+            return None, None
+    mimetype = {"webp": "image/webp", "jpg": "image/jpeg", "png": "image/png"}.get(fmt)
+    return (dst, mimetype) if os.path.exists(dst) else (None, None)
+
+
+def submit_derivatives(static_root, rel_path):
+    """上傳完成後丟到背景 process pool 產生衍生檔 (不等待結果)。"""
+    global _pool
+    if Image is None or not is_image(rel_path):
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(1, min(4, (os.cpu_count() or 2) // 2)))
+    return _pool.submit(generate_derivatives, static_root, rel_path)
+
+
+def iter_static_images(static_root):
+    for root, dirs, files in os.walk(static_root):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            if is_image(name):
+                rel = os.path.relpath(os.path.join(root, name), static_root)
+                yield rel.replace(os.sep, "/")
+
+
+def backfill(static_root=STATIC_ROOT, workers=None):
+    """一次性補齊 static/ 下所有既有圖片的衍生檔。"""
+    if Image is None:
+        print("未安裝 Pillow，請先 pip install Pillow")
+        return 0
+    paths = list(iter_static_images(static_root))
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rel, created in zip(paths, pool.map(generate_derivatives, [static_root] * len(paths), paths,
+                                                chunksize=4)):
+            if created:
+                print(f"  {rel}: {created} 個衍生檔")
+            total += created
+    print(f"完成，共 {len(paths)} 張圖片，新產生 {total} 個衍生檔。")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate thumbnails / WebP derivatives for static images")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--static-root", default=STATIC_ROOT)
+    args = parser.parse_args()
+    backfill(args.static_root, args.workers)
@@ -0,0 +1,190 @@
+# triage.py
+# -*- coding: utf-8 -*-
+"""
+test_result.xml 失敗項目分類 (Triage)
+
+每個 fail 的測項會被分成三類:
+- waived       : waivers 表中有對應的 Waiver ID
+- known_retry  : retry_tips 中有該模組 / 測項的 Retry 技巧
+- new          : 以上皆無，需要人工確認
+
+用法:
+    python triage.py test_result.xml                # 使用 test_result.xml 內的 suite_name
+    python triage.py results.zip --suite GTS --json report.json
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from waiver_index import WaiverIndex
+from xts_result import XtsResultReader, open_result, split_abi, normalize_test_name, full_test_name
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ----------------------------------------
+# Retry 技巧對照
+# ----------------------------------------
+_RANGE_SUFFIX = re.compile(r"\d+\s*~\s*\d+$")
+
+
+def parse_tip_pattern(module_case):
+    """
+    retry_tips.module_case 是手寫的自由文字，例如:
+        'Radio'、'CtsNetTestCases\\t'、'signed-CtsOmapiTestCases'
+        'arm64-v8a CtsWindowManagerDeviceTestCases/\\nandroid.server.wm.PinnedStackTests#testX'
+        '憑證系列 (CtsLibcoreOjTestCases, CtsLibcoreTestCases, CtsSecurityTestCases)'
+    回傳 (模組關鍵字 list, 測項名稱或 None)。
+    """
+    text = (module_case or "").strip()
+    if not text:
+        return [], None
+    module_part, _, test_part = text.partition("/")
+    if "(" in module_part:
+        module_part = module_part[module_part.index("(") + 1:].rstrip(") ")
+    keywords = []
+    for piece in module_part.split(","):
+        _, piece = split_abi(piece)
+        piece = _RANGE_SUFFIX.sub("", piece.strip())
+        piece = re.sub(r"^signed-", "", piece)
+        piece = re.sub(r"[^A-Za-z0-9_\-]", "", piece)
+        if len(piece) >= 3:
+            keywords.append(piece.lower())
+    test = normalize_test_name(test_part) if test_part.strip() else None
+    return keywords, test
+
+
+class RetryTipMatcher:
+    """模組名稱包含 tip 關鍵字 (不分大小寫) 即視為符合；tip 指定測項時需測項也相同。"""
+
+    def __init__(self, rows):
+        self._tips = []
+        for r in rows:
+            keywords, test = parse_tip_pattern(r["module_case"])
+            if keywords:
+                self._tips.append((keywords, test, dict(r)))
+
+    @classmethod
+    def from_db(cls, conn):
+        rows = conn.execute("SELECT id, type, module_case, condition, trick FROM retry_tips ORDER BY id").fetchall()
+        return cls(rows)
+
+    def match_module(self, module):
+        """回傳適用於整個模組的 tips (不含限定單一測項的 tip)。"""
+        lower = (module or "").lower()
+        return [tip for keywords, test, tip in self._tips
+                if test is None and any(k in lower for k in keywords)]
+
+    def match(self, module, test):
+        lower = (module or "").lower()
+        for keywords, tip_test, tip in self._tips:
+            if any(k in lower for k in keywords) and (tip_test is None or tip_test == test):
+                return tip
+        return None
+
+
+# ----------------------------------------
+# Triage
+# ----------------------------------------
+def triage_result(fileobj, waivers, tips, suite=None):
+    """
+    串流走訪 fileobj 中 fail 的測項並分類。
+    waivers 需提供 match(module, test) (例如 WaiverIndex.for_suite())，tips 為 RetryTipMatcher。
+    waivers 也可以是 callable(suite) -> lookup，用於 suite 要從 XML 讀出的情況。
+    """
+    started = time.perf_counter()
+    reader = XtsResultReader(fileobj)
+    records = reader.iter_tests(only_failed=True)
+    failures = []
+    counts = {"waived": 0, "known_retry": 0, "new": 0}
+    lookup = None if callable(waivers) else waivers
+
+    for rec in records:
+        if lookup is None:
+            suite = suite or reader.suite_name
+            lookup = waivers(suite)
+        test = full_test_name(rec)
+        item = {"module": rec.module, "abi": rec.abi, "test": test, "message": rec.message}
+        waiver = lookup.match(rec.module, test)
+        tip = tips.match(rec.module, test) if tips else None
+        if waiver is not None:
+            item["status"] = "waived"
+            item["waiver_id"] = waiver["waiver_id"]
+            item["waiver_row_id"] = waiver["id"]
+        elif tip is not None:
+            item["status"] = "known_retry"
+        else:
+            item["status"] = "new"
+        if tip is not None:
+            item["retry_tip"] = {k: tip[k] for k in ("id", "type", "module_case", "condition", "trick")}
+        counts[item["status"]] += 1
+        failures.append(item)
+
+    incomplete = [{"module": m, "abi": abi} for (m, abi), info in reader.modules.items() if not info["done"]]
+    return {
+        "suite": suite or reader.suite_name,
+        "build": {k: reader.build_attrs.get(k) for k in ("build_fingerprint", "build_id", "build_product")},
+        "summary": dict(counts, failed=len(failures), modules=len(reader.modules),
+                        incomplete_modules=len(incomplete)),
+        "incomplete_modules": incomplete,
+        "failures": failures,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def print_report(report, out=sys.stdout):
+    s = report["summary"]
+    print(f"Suite: {report['suite']}  Build: {report['build'].get('build_fingerprint')}", file=out)
+    print(f"模組: {s['modules']}  未完成模組: {s['incomplete_modules']}  Fail: {s['failed']}"
+          f"  (waived {s['waived']} / known_retry {s['known_retry']} / new {s['new']})", file=out)
+    for status, title in (("new", "需確認 (new)"), ("known_retry", "已知 Retry 技巧"), ("waived", "已有 Waiver")):
+        items = [f for f in report["failures"] if f["status"] == status]
+        if not items:
+            continue
+        print(f"\n== {title}: {len(items)} ==", file=out)
+        for f in items:
+            extra = ""
+            if status == "waived":
+                extra = f"  [{f['waiver_id']}]"
+            elif status == "known_retry":
+                extra = f"  -> {f['retry_tip']['condition']}: {f['retry_tip']['trick'] or ''}".rstrip()
+            print(f"  {f['abi'] or ''} {f['module']}  {f['test']}{extra}", file=out)
+    for m in report["incomplete_modules"]:
+        print(f"  [未完成] {m['abi'] or ''} {m['module']}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Triage tradefed test_result.xml against waivers / retry tips")
+    parser.add_argument("result", help="test_result.xml 或 results zip")
+    parser.add_argument("--suite", help="對照的 waiver suite (預設使用 XML 內的 suite_name)")
+    parser.add_argument("--json", dest="json_path", help="輸出 JSON 報告到指定路徑")
+    args = parser.parse_args()
+
+    waiver_conn = sqlite3.connect(os.path.join(BASE_DIR, "waiver.db"))
+    waiver_conn.row_factory = sqlite3.Row
+    retry_conn = sqlite3.connect(os.path.join(BASE_DIR, "retry.db"))
+    retry_conn.row_factory = sqlite3.Row
+    try:
+        index = WaiverIndex()
+        index.load_from_db(waiver_conn)
+        tips = RetryTipMatcher.from_db(retry_conn)
+        with open_result(args.result) as f:
+            report = triage_result(f, index.for_suite, tips, suite=args.suite)
+    finally:
+        waiver_conn.close()
+        retry_conn.close()
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as out:
+            json.dump(report, out, ensure_ascii=False, indent=2)
+        print(f"已輸出 JSON 報告: {args.json_path}")
+    print_report(report)
+    print(f"\n解析耗時 {report['elapsed_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
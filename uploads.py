@@ -0,0 +1,257 @@
+# uploads.py
+# -*- coding: utf-8 -*-
+"""
+上傳檔案儲存 (content-addressed) 與分段續傳
+
+- 檔案一律以 sha256 命名存放: static/uploads/<前2碼>/<sha256>.<副檔名>
+  同內容的檔案只會存一份，不同內容但同名 (例如兩張 1.jpg) 也不會互相覆蓋
+- 回傳結果帶 original_name (去掉路徑的上傳檔名)，由呼叫端記錄，下載時以原檔名送出
+- 邊寫入邊計算 hash，不把整個檔案讀進記憶體
+- 分段上傳: init -> 多次 chunk (可中斷後從 received 繼續) -> finalize
+  進度存在 static/uploads/.partial/，server 重啟後仍可續傳
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+COPY_BUFSIZE = 1 << 20
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+STALE_SECONDS = 24 * 60 * 60
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def file_ext(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def original_name(filename):
+    """瀏覽器 (舊版 IE) 可能送完整路徑，只保留檔名。"""
+    return (filename or "").replace("\\", "/").rsplit("/", 1)[-1].strip()
+
+
+def content_path(digest, ext):
+    """回傳相對於 static/ 的路徑 (前端以 static/ 為 base 顯示)。"""
+    name = digest + ('.' + ext if ext else '')
+    return "uploads/" + digest[:2] + "/" + name
+
+
+class UploadStore:
+
+    def __init__(self, upload_root, allowed_extensions, max_size=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.upload_root = upload_root
+        self.static_root = os.path.dirname(upload_root)
+        self.partial_dir = os.path.join(upload_root, ".partial")
+        self.allowed_extensions = allowed_extensions
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self._hashers = {}     # upload_id -> (sha256 物件, 已 hash 的 bytes)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(self.partial_dir, exist_ok=True)
+
+    # ----------------------------------------
+    # 共用: 放到 content-addressed 位置
+    # ----------------------------------------
+    def _abs(self, rel_path):
+        return os.path.join(self.static_root, *rel_path.split("/"))
+
+    def exists(self, digest, ext):
+        return os.path.exists(self._abs(content_path(digest, ext)))
+
+    def _commit(self, tmp_path, digest, ext):
+        rel = content_path(digest, ext)
+        target = self._abs(rel)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+            return rel, True
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+        return rel, False
+
+    def _check_ext(self, filename):
+        ext = file_ext(filename or "")
+        if ext not in self.allowed_extensions:
+            raise UploadError("file type not allowed")
+        return ext
+
+    def save_stream(self, stream, filename):
+        """單次上傳: 邊寫入暫存檔邊 hash，完成後移到 content-addressed 位置。"""
+        ext = self._check_ext(filename)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.partial_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    buf = stream.read(COPY_BUFSIZE)
+                    if not buf:
+                        break
+                    hasher.update(buf)
+                    out.write(buf)
+                    size += len(buf)
+            digest = hasher.hexdigest()
+            rel, dedup = self._commit(tmp_path, digest, ext)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return {"file_path": rel, "sha256": digest, "size": size, "deduplicated": dedup,
+                "original_name": original_name(filename)}
+
+    # ----------------------------------------
+    # 分段上傳
+    # ----------------------------------------
+    def _lock(self, upload_id):
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _paths(self, upload_id):
+        if not _UPLOAD_ID.match(upload_id or ""):
+            raise UploadError("invalid upload id", 404)
+        base = os.path.join(self.partial_dir, upload_id)
+        return base + ".json", base + ".part"
+
+    def _load_meta(self, upload_id):
+        meta_path, part_path = self._paths(upload_id)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise UploadError("upload not found", 404)
+        meta["received"] = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        return meta
+
+    def init(self, filename, size, sha256=None):
+        ext = self._check_ext(filename)
+        if not isinstance(size, int) or size < 0:
+            raise UploadError("invalid size")
+        if self.max_size and size > self.max_size:
+            raise UploadError("file too large", 413)
+        self.cleanup_stale()
+        # 已知 hash 且檔案已存在: 不需要傳任何資料
+        if sha256 and re.match(r"^[0-9a-f]{64}$", sha256) and self.exists(sha256, ext):
+            return {"status": "ok", "file_path": content_path(sha256, ext), "sha256": sha256,
+                    "size": size, "deduplicated": True, "original_name": original_name(filename)}
+        upload_id = uuid.uuid4().hex
+        meta_path, part_path = self._paths(upload_id)
+        meta = {"upload_id": upload_id, "filename": filename, "ext": ext, "size": size,
+                "sha256": sha256, "created": time.time()}
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        open(part_path, "wb").close()
+        self._hashers[upload_id] = (hashlib.sha256(), 0)
+        return {"status": "pending", "upload_id": upload_id, "chunk_size": self.chunk_size, "received": 0}
+
+    def status(self, upload_id):
+        meta = self._load_meta(upload_id)
+        return {"upload_id": upload_id, "size": meta["size"], "received": meta["received"],
+                "chunk_size": self.chunk_size}
+
+    def write_chunk(self, upload_id, offset, stream):
+        """offset 必須等於目前已收到的大小；不符時回 409 並附上 received 讓前端從該處續傳。"""
+        with self._lock(upload_id):
+            meta = self._load_meta(upload_id)
+            _, part_path = self._paths(upload_id)
+            received = meta["received"]
+            if offset != received:
+                raise UploadError("offset mismatch", 409, received=received)
+            hasher, hashed = self._hashers.get(upload_id, (None, 0))
+            in_sync = hasher is not None and hashed == received
+            try:
+                with open(part_path, "ab") as out:
+                    while True:
+                        buf = stream.read(COPY_BUFSIZE)
+                        if not buf:
+                            break
+                        if received + len(buf) > meta["size"]:
+                            out.truncate(received)
+                            raise UploadError("chunk exceeds declared size", 413, received=received)
+                        out.write(buf)
+                        received += len(buf)
+                        if in_sync:
+                            hasher.update(buf)
+            except BaseException:
+                # 連線中斷或超過大小: hash 狀態不再可靠，finalize 時改從暫存檔重算
+                self._hashers.pop(upload_id, None)
+                raise
+            if in_sync:
+                self._hashers[upload_id] = (hasher, received)
+            return {"upload_id": upload_id, "received": received, "size": meta["size"]}
+
+    def finalize(self, upload_id):
+        with self._lock(upload_id):
+            meta = self._load_meta(upload_id)
+            meta_path, part_path = self._paths(upload_id)
+            if meta["received"] != meta["size"]:
+                raise UploadError("upload incomplete", 409, received=meta["received"])
+            hasher, hashed = self._hashers.pop(upload_id, (None, 0))
+            if hasher is None or hashed != meta["received"]:
+                # server 重啟或 hash 狀態遺失: 從暫存檔重新計算
+                hasher = hashlib.sha256()
+                with open(part_path, "rb") as f:
+                    for buf in iter(lambda: f.read(COPY_BUFSIZE), b""):
+                        hasher.update(buf)
+            digest = hasher.hexdigest()
+            if meta.get("sha256") and meta["sha256"] != digest:
+                self._discard(upload_id)
+                raise UploadError("sha256 mismatch", 422, sha256=digest)
+            rel, dedup = self._commit(part_path, digest, meta["ext"])
+            os.remove(meta_path)
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+        return {"status": "ok", "file_path": rel, "sha256": digest, "size": meta["size"], "deduplicated": dedup,
+                "original_name": original_name(meta["filename"])}
+
+    def abort(self, upload_id):
+        self._paths(upload_id)
+        with self._lock(upload_id):
+            self._discard(upload_id)
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+
+    def _discard(self, upload_id):
+        self._hashers.pop(upload_id, None)
+        for path in self._paths(upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def cleanup_stale(self, max_age=STALE_SECONDS):
+        """
+        刪除超過 max_age 沒有任何新資料寫入的上傳。以 upload id 分組，依 .part 的 mtime 判斷
+        (還沒收到任何資料、只有 .json 時依 .json)，每個 id 只 _discard 一次；其他暫存檔依自己的 mtime。
+        """
+        now = time.time()
+        uploads = {}
+        for name in os.listdir(self.partial_dir):
+            base, _, suffix = name.rpartition(".")
+            path = os.path.join(self.partial_dir, name)
+            if suffix in ("json", "part"):
+                uploads.setdefault(base, {})[suffix] = path
+                continue
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+            except OSError:
+                pass
+        for upload_id, paths in uploads.items():
+            try:
+                if now - os.path.getmtime(paths.get("part") or paths["json"]) <= max_age:
+                    continue
+                with self._lock(upload_id):
+                    self._discard(upload_id)
+                with self._locks_guard:
+                    self._locks.pop(upload_id, None)
+            except (OSError, UploadError):
+                pass
@@ -0,0 +1,148 @@
+# waiver_index.py
+# -*- coding: utf-8 -*-
+"""
+Waiver 記憶體索引
+
+支援的 waiver 寫法 (module / test_case 皆為手寫文字):
+- 精確測項      : 'Class#method'、'Class method'、'Class#method[volume=external]'
+- Class 萬用字元 : 'Class#*' 或只寫 'Class'
+- 前綴萬用字元   : 'android.foo.*'、'Class#testBar*'
+- 整個模組       : test_case 為 '*' 或空白
+- 參數化測項     : 'Class#method[arm64-v8a]' 查不到時退回比對 'Class#method'
+
+新增 / 修改 / 刪除 waiver 時呼叫 upsert() / remove() 即可增量更新，不需整包重建。
+"""
+import re
+import threading
+
+from xts_result import split_abi, normalize_test_name
+
+_PARAM_SUFFIX = re.compile(r"\[[^\]]*\]$")
+
+
+def strip_params(name):
+    """'Class#test[arm64-v8a]' -> 'Class#test'"""
+    return _PARAM_SUFFIX.sub("", name or "")
+
+
+def _parse_pattern(module, test_case):
+    """回傳 (kind, suite 以外的 key)。kind 為 'exact' 或 'prefix'。"""
+    _, module = split_abi(module)
+    module = (module or "").strip()
+    test = normalize_test_name(test_case)
+    if test in ("", "*"):
+        return "prefix", (module, "")
+    if test.endswith("*"):
+        return "prefix", (module, test.rstrip("*"))
+    if "#" not in test:
+        return "prefix", (module, test + "#")
+    return "exact", (module, test)
+
+
+class WaiverIndex:
+
+    def __init__(self):
+        # match() 不上鎖: 三個表放在同一個 tuple，load() 整組替換；
+        # upsert() / remove() 只以新的 bucket list 取代舊的，不原地修改讀取中的 list
+        self._lock = threading.Lock()
+        self._tables = ({}, {}, {})
+        # _tables[0] rows  : row id -> (kind, key)
+        # _tables[1] exact : (suite, module, test) -> [row, ...]
+        # _tables[2] prefix: (suite, module) -> [(prefix, row), ...] 長的前綴排前面
+        self.loaded = False
+        self.version = None    # 載入時的 data_versions 版本 (由呼叫端維護)
+
+    # ----------------------------------------
+    # 建立 / 增量更新
+    # ----------------------------------------
+    def load(self, rows):
+        tables = ({}, {}, {})
+        for r in rows:
+            _add(tables, r)
+        with self._lock:
+            self._tables = tables
+            self.loaded = True
+
+    def load_from_db(self, conn):
+        rows = conn.execute("SELECT id, suite, waiver_id, module, test_case, note FROM waivers ORDER BY id").fetchall()
+        self.load(rows)
+
+    def upsert(self, row):
+        with self._lock:
+            _remove(self._tables, row["id"])
+            _add(self._tables, row)
+
+    def remove(self, row_id):
+        with self._lock:
+            _remove(self._tables, row_id)
+
+    # ----------------------------------------
+    # 查詢
+    # ----------------------------------------
+    def match(self, suite, module, test_case):
+        """回傳 (waiver row dict, match kind) 或 (None, None)。"""
+        suite = (suite or "").upper()
+        _, module = split_abi(module)
+        test = normalize_test_name(test_case)
+        base_test = strip_params(test)
+        modules = (module,) if strip_params(module) == module else (module, strip_params(module))
+        _, exact, prefixes = self._tables
+        for mod in modules:
+            bucket = exact.get((suite, mod, test))
+            if bucket:
+                return bucket[0], "exact"
+            if base_test != test:
+                bucket = exact.get((suite, mod, base_test))
+                if bucket:
+                    return bucket[0], "param"
+            for prefix, row in prefixes.get((suite, mod), ()):
+                if test.startswith(prefix):
+                    return row, ("module" if not prefix else "wildcard")
+        return None, None
+
+    def for_suite(self, suite):
+        return _SuiteView(self, suite)
+
+    def __len__(self):
+        return len(self._tables[0])
+
+
+def _add(tables, row):
+    rows, exact, prefixes = tables
+    row = {k: row[k] for k in ("id", "suite", "waiver_id", "module", "test_case", "note")}
+    suite = (row["suite"] or "").upper()
+    kind, (module, test) = _parse_pattern(row["module"], row["test_case"])
+    if kind == "exact":
+        key = (suite, module, test)
+        exact[key] = sorted(exact.get(key, []) + [row], key=lambda r: r["id"])
+    else:
+        key = (suite, module)
+        prefixes[key] = sorted(prefixes.get(key, []) + [(test, row)], key=lambda p: (-len(p[0]), p[1]["id"]))
+    rows[row["id"]] = (kind, key)
+
+
+def _remove(tables, row_id):
+    rows, exact, prefixes = tables
+    entry = rows.pop(row_id, None)
+    if entry is None:
+        return
+    kind, key = entry
+    if kind == "exact":
+        table, bucket = exact, [r for r in exact.get(key, []) if r["id"] != row_id]
+    else:
+        table, bucket = prefixes, [p for p in prefixes.get(key, []) if p[1]["id"] != row_id]
+    if bucket:
+        table[key] = bucket
+    else:
+        table.pop(key, None)
+
+
+class _SuiteView:
+    """提供 triage 使用的 match(module, test) 介面。"""
+
+    def __init__(self, index, suite):
+        self.index = index
+        self.suite = suite
+
+    def match(self, module, test):
+        return self.index.match(self.suite, module, test)[0]
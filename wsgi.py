@@ -0,0 +1,28 @@
+# wsgi.py
+# -*- coding: utf-8 -*-
+"""
+WSGI 入口 (3PL.py 檔名以數字開頭，WSGI server 無法直接 import)
+
+    gunicorn wsgi:app                 # 任何 WSGI server 皆可
+    python serve.py                   # 建議: 多 worker + preload + graceful reload (見 serve.py)
+"""
+import importlib.util
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module():
+    name = "tool_3pl"
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(BASE_DIR, "3PL.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+tool = load_module()
+app = tool.create_app()
@@ -0,0 +1,163 @@
+# xts_result.py
+# -*- coding: utf-8 -*-
+"""
+Tradefed (CTS / GTS / VTS / STS) test_result.xml 串流解析
+
+- 使用 expat 逐段 feed，不建立 DOM，記憶體用量與檔案大小無關
+- 只保留 Result / Build / Module 層級的屬性，每個 <Test> 轉成一筆 TestRecord
+- 也支援直接讀取 tradefed 產出的 results zip (內含 test_result.xml)
+"""
+import hashlib
+import re
+import zipfile
+from collections import namedtuple
+from xml.parsers import expat
+
+CHUNK_SIZE = 1 << 20
+
+TestRecord = namedtuple("TestRecord", "module abi test_class test_name result message")
+
+KNOWN_ABIS = ("arm64-v8a", "armeabi-v7a", "armeabi", "x86_64", "x86", "riscv64")
+FAIL_RESULTS = {"fail"}
+
+
+# ----------------------------------------
+# 名稱正規化
+# ----------------------------------------
+def split_abi(text):
+    """'arm64-v8a CtsFooTestCases' -> ('arm64-v8a', 'CtsFooTestCases')"""
+    text = (text or "").strip()
+    for abi in KNOWN_ABIS:
+        if text.startswith(abi):
+            return abi, text[len(abi):].strip()
+    return None, text
+
+
+def normalize_test_name(text):
+    """
+    waiver / retry 內的測項寫法不一 ('Class method'、'Class#method'、多個空白)，
+    統一成 tradefed 的 'Class#method'。
+    """
+    text = re.sub(r"\s+", " ", (text or "").strip())
+    if "#" not in text and " " in text:
+        cls, _, method = text.partition(" ")
+        text = cls + "#" + method.strip()
+    return text.replace(" ", "")
+
+
+def full_test_name(record):
+    return record.test_class + "#" + record.test_name
+
+
+# ----------------------------------------
+# 串流解析
+# ----------------------------------------
+class XtsResultReader:
+    """
+    逐筆走訪 test_result.xml 中的 <Test>。
+
+        reader = XtsResultReader(fileobj)
+        for rec in reader.iter_tests(only_failed=True):
+            ...
+        reader.result_attrs / reader.build_attrs / reader.modules
+
+    modules 為 {(module, abi): {"done": bool, "pass": int, "total": int, "runtime_ms": int}}，
+    走訪完畢後才完整。runtime_ms 為 tradefed 記錄的模組執行時間 (舊版沒有此屬性時為 0)。
+    """
+
+    def __init__(self, fileobj, chunk_size=CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.result_attrs = {}
+        self.build_attrs = {}
+        self.modules = {}
+
+    def iter_tests(self, only_failed=False):
+        out = []
+        state = {"module": None, "abi": None, "cls": None}
+
+        def start(name, attrs):
+            if name == "Test":
+                result = attrs.get("result", "")
+                if only_failed and result not in FAIL_RESULTS:
+                    state["last"] = False
+                    return
+                out.append(TestRecord(state["module"], state["abi"], state["cls"],
+                                      attrs.get("name", ""), result, None))
+                state["last"] = True
+            elif name == "TestCase":
+                state["cls"] = attrs.get("name", "")
+            elif name == "Failure":
+                if state.get("last") and out:
+                    out[-1] = out[-1]._replace(message=attrs.get("message"))
+            elif name == "Module":
+                state["module"] = attrs.get("name", "")
+                state["abi"] = attrs.get("abi")
+                self.modules[(state["module"], state["abi"])] = {
+                    "done": attrs.get("done", "true") == "true",
+                    "pass": int(attrs.get("pass", 0) or 0),
+                    "total": int(attrs.get("total_tests", 0) or 0),
+                    "runtime_ms": int(attrs.get("runtime", 0) or 0),
+                }
+            elif name == "Result":
+                self.result_attrs = dict(attrs)
+            elif name == "Build":
+                self.build_attrs = dict(attrs)
+
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = start
+        read = self.fileobj.read
+        while True:
+            chunk = read(self.chunk_size)
+            if not chunk:
+                parser.Parse(b"", True)
+                break
+            parser.Parse(chunk, False)
+            if out:
+                yield from out
+                out.clear()
+        yield from out
+
+    @property
+    def suite_name(self):
+        return (self.result_attrs.get("suite_name") or "").upper()
+
+    @property
+    def devices(self):
+        """執行這次測試的 DUT serial list (Result 的 devices 屬性，分片執行時有多台)。"""
+        return [d for d in (self.result_attrs.get("devices") or "").split(",") if d]
+
+    @property
+    def run_key(self):
+        """辨識同一次執行的鍵 (重複匯入同一份結果時相同)。Result / Build 讀到後即可使用。"""
+        attrs = self.result_attrs
+        started = int(attrs.get("start") or 0) or None
+        ended = int(attrs.get("end") or 0) or None
+        key = (self.suite_name, started, ended, self.devices, self.build_attrs.get("build_fingerprint"))
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def consume(self):
+        """只需要 Result / Module 層級資訊時，走訪完整份檔案但不保留測項。"""
+        for _ in self.iter_tests(only_failed=True):
+            pass
+        return self
+
+
+def open_result(path_or_file):
+    """
+    開啟 test_result.xml 或 tradefed results zip，回傳 binary file object。
+    zip 內只讀取 test_result.xml，不解壓其他 log。
+    """
+    if isinstance(path_or_file, str):
+        fileobj = open(path_or_file, "rb")
+    else:
+        fileobj = path_or_file
+    head = fileobj.read(4)
+    fileobj.seek(0)
+    if head == b"PK\x03\x04":
+        zf = zipfile.ZipFile(fileobj)
+        for name in zf.namelist():
+            if name.endswith("test_result.xml"):
+                return zf.open(name)
+        raise ValueError("zip 內找不到 test_result.xml")
+    return fileobj